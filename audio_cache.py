@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+CACHE_DIR_NAME = "audio_cache"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_lock = threading.Lock()
+# Running estimate of the cache size; None until the first scan.
+_total_bytes: Optional[int] = None
+
+
+def _cache_dir() -> Path:
+    return Path(
+        os.environ.get(
+            "AUDIO_CACHE_DIR", Path(__file__).resolve().parent / CACHE_DIR_NAME
+        )
+    )
+
+
+def _max_bytes() -> int:
+    return int(os.environ.get("AUDIO_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def cache_key(*parts: Optional[str]) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        # Length-prefix every part so ("ab", "c") and ("a", "bc") differ.
+        encoded = str(part).encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return _cache_dir() / key[:2] / key
+
+
+def get(key: str) -> Optional[bytes]:
+    if _max_bytes() <= 0:
+        return None
+    path = _entry_path(key)
+    try:
+        data = path.read_bytes()
+        # The mtime doubles as the last-used time for LRU eviction.
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+
+def put(key: str, data: bytes) -> None:
+    global _total_bytes
+    max_bytes = _max_bytes()
+    if max_bytes <= 0 or len(data) > max_bytes:
+        return
+    path = _entry_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # An entry written again replaces the old one's bytes.
+        replaced_bytes = path.stat().st_size
+    except OSError:
+        replaced_bytes = 0
+    tmp_path = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        # Readers in other sessions see either nothing or the whole entry.
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        return
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_size()
+        else:
+            _total_bytes += len(data) - replaced_bytes
+        if _total_bytes > max_bytes:
+            _total_bytes = _evict(max_bytes)
+
+
+def _entries():
+    for path in _cache_dir().glob("??/*"):
+        if path.name.startswith("."):
+            continue
+        try:
+            yield path, path.stat()
+        except OSError:
+            continue
+
+
+def _scan_size() -> int:
+    return sum(stat.st_size for _, stat in _entries())
+
+
+def _evict(max_bytes: int) -> int:
+    """Delete least recently used entries down to 90% of max_bytes."""
+    entries = sorted(_entries(), key=lambda entry: entry[1].st_mtime)
+    total = sum(stat.st_size for _, stat in entries)
+    target = max_bytes * 9 // 10
+    for path, stat in entries:
+        if total <= target:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            # Another session evicted it first.
+            pass
+        total -= stat.st_size
+    return total
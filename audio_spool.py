@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+SPOOL_DIR_NAME = "whitelist_chat_tts"
+# Session spools untouched for this long are assumed abandoned.
+MAX_AGE_SECONDS = 6 * 60 * 60
+CLEANUP_INTERVAL_SECONDS = 10 * 60
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def _spool_root() -> Path:
+    return Path(
+        os.environ.get(
+            "TTS_SPOOL_DIR", Path(tempfile.gettempdir()) / SPOOL_DIR_NAME
+        )
+    )
+
+
+def new_spool_id() -> str:
+    return uuid.uuid4().hex
+
+
+def spool_path(spool_id: str) -> Path:
+    """Where the spool lives, without creating or touching it."""
+    return _spool_root() / spool_id
+
+
+def spool_ids() -> List[str]:
+    root = _spool_root()
+    if not root.exists():
+        return []
+    return [path.name for path in root.iterdir() if path.is_dir()]
+
+
+def session_dir(spool_id: str) -> Path:
+    """The session's spool directory, marked as recently used."""
+    path = _spool_root() / spool_id
+    path.mkdir(parents=True, exist_ok=True)
+    os.utime(path)
+    return path
+
+
+def reset(spool_id: str) -> Path:
+    """Empty the session's spool before a new conversion."""
+    path = _spool_root() / spool_id
+    shutil.rmtree(path, ignore_errors=True)
+    return session_dir(spool_id)
+
+
+def write(spool_id: str, name: str, data: bytes) -> Path:
+    path = session_dir(spool_id) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cleanup(max_age_seconds: int = MAX_AGE_SECONDS) -> int:
+    """Remove abandoned session spools; returns how many were removed.
+
+    Runs at most once per CLEANUP_INTERVAL_SECONDS per process.
+    """
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return 0
+        _last_cleanup = now
+    removed = 0
+    root = _spool_root()
+    if not root.exists():
+        return 0
+    for path in root.iterdir():
+        try:
+            if now - path.stat().st_mtime < max_age_seconds:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
@@ -0,0 +1,154 @@
+"""Size and speed of the plain and compressed chat log formats.
+
+Saves the same generated chats (prose and code, like a coding chat) in each
+format of the files backend and reports bytes on disk, save, append, load
+and list times:
+
+    python -m benchmarks.chat_format --turns 10 50 200 --chats 50
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+WORDS = (
+    "the function returns a list of values when called with an empty input so "
+    "we need to check for none before iterating over the items and handle the "
+    "error case separately because the caller expects a dictionary keyed by id"
+).split()
+IDENTIFIERS = ["items", "result", "value", "index", "config", "path", "client"]
+
+
+def prose(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def code(rng, lines):
+    body = []
+    for _ in range(lines):
+        name, other = rng.sample(IDENTIFIERS, 2)
+        body.append(
+            rng.choice(
+                [
+                    f"    {name} = {other}.get({rng.randint(0, 99)!r})",
+                    f"    for {name} in {other}:",
+                    f"        {name}.append({other}[{rng.randint(0, 9)}])",
+                    f"    if {name} is None:",
+                    f"        return {other}",
+                ]
+            )
+        )
+    return "```python\ndef handler(items):\n" + "\n".join(body) + "\n```"
+
+
+def make_messages(rng, turns):
+    messages = []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": prose(rng, rng.randint(10, 60))})
+        answer = [prose(rng, rng.randint(20, 80))]
+        if rng.random() < 0.6:
+            answer.append(code(rng, rng.randint(5, 40)))
+        answer.append(prose(rng, rng.randint(10, 40)))
+        messages.append({"role": "assistant", "content": "\n\n".join(answer)})
+    return messages
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def measure(chats, compress, chat_dir):
+    import chat_store
+    import chat_store_files
+
+    os.environ["CHAT_STORE_COMPRESS"] = "1" if compress else "0"
+    times = {name: [] for name in ("save", "append", "load", "tail", "first")}
+    for chat_id, messages in chats.items():
+        _, ms = timed(chat_store.save_chat, chat_id, chat_id, messages[:-2], "coding")
+        times["save"].append(ms)
+        _, ms = timed(chat_store.save_chat, chat_id, chat_id, messages, "coding")
+        times["append"].append(ms)
+    for chat_id, messages in chats.items():
+        # Cold reads: nothing cached from the writes above.
+        chat_store_files._log_cache.clear()
+        chat, ms = timed(chat_store.load_chat, chat_id)
+        assert chat["messages"] == messages, chat_id
+        times["load"].append(ms)
+        chat_store_files._log_cache.clear()
+        _, ms = timed(chat_store.load_chat, chat_id, tail=20)
+        times["tail"].append(ms)
+        chat_store_files._log_cache.clear()
+        _, ms = timed(next, chat_store.iter_messages(chat_id))
+        times["first"].append(ms)
+
+    user_dir = chat_store.user_dir(chat_store.current_user())
+    sizes = [
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(user_dir)
+        if chat_store_files.INDEX_DIR_NAME not in root
+        for name in names
+    ]
+    # Listing from scratch reads every chat's summary.
+    shutil.rmtree(user_dir / chat_store_files.INDEX_DIR_NAME)
+    chat_store_files._manifest_cache.clear()
+    _, rebuild_ms = timed(chat_store.list_chats)
+    chat_store_files._manifest_cache.clear()
+    _, list_ms = timed(chat_store.list_chats)
+    result = {
+        f"{name}_ms": round(statistics.median(values), 3)
+        for name, values in times.items()
+    }
+    return {
+        "bytes": sum(sizes),
+        **result,
+        "list_ms": round(list_ms, 3),
+        "list_rebuild_ms": round(rebuild_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", nargs="+", type=int, default=[10, 50, 200])
+    parser.add_argument("--chats", type=int, default=50)
+    args = parser.parse_args()
+    os.environ.setdefault("METRICS_ENABLED", "0")
+
+    import chat_store
+
+    for turns in args.turns:
+        rng = random.Random(turns)
+        chats = {
+            f"chat{index}": make_messages(rng, turns) for index in range(args.chats)
+        }
+        results = {}
+        for name, compress in (("plain", False), ("compressed", True)):
+            with tempfile.TemporaryDirectory() as chat_dir:
+                os.environ["CHAT_STORE_DIR"] = chat_dir
+                chat_store.configure("files")
+                chat_store.set_user(None)
+                results[name] = measure(chats, compress, chat_dir)
+        ratio = results["plain"]["bytes"] / results["compressed"]["bytes"]
+        for name, result in results.items():
+            print(
+                json.dumps(
+                    {
+                        "format": name,
+                        "turns": turns,
+                        "chats": args.chats,
+                        **result,
+                        "ratio": round(ratio if name == "compressed" else 1.0, 2),
+                    }
+                )
+            )
+    os.environ.pop("CHAT_STORE_DIR", None)
+    os.environ.pop("CHAT_STORE_COMPRESS", None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Stress chat storage with many threads and processes at once.
+
+Every thread of every process grows its own chats one turn at a time while
+listing and loading whatever the others wrote, across a few users. At the
+end each user's chats are checked for lost or torn writes:
+
+    python -m benchmarks.chat_store_stress --processes 4 --threads 8
+    python -m benchmarks.chat_store_stress --backends sqlite --turns 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def message(chat_id, index):
+    role = "user" if index % 2 == 0 else "assistant"
+    return {"role": role, "content": f"{chat_id} turn {index} " + "x" * 200}
+
+
+def check_chat(chat, chat_id, expected=None):
+    """Problems with a loaded chat: every message must be the one written."""
+    if chat is None:
+        return [f"{chat_id}: missing"]
+    messages = chat["messages"]
+    problems = []
+    if expected is not None and len(messages) != expected:
+        problems.append(f"{chat_id}: {len(messages)} messages, expected {expected}")
+    for index, stored in enumerate(messages):
+        if stored != message(chat_id, index):
+            problems.append(f"{chat_id}: message {index} differs")
+            break
+    return problems
+
+
+def run_thread(worker, thread, args, results):
+    import chat_store
+
+    rng = random.Random(f"{worker}-{thread}")
+    user = f"user{(worker * args.threads + thread) % args.users}"
+    chat_store.set_user(user)
+    chat_ids = [f"w{worker}_t{thread}_c{index}" for index in range(args.chats)]
+    counts = {"saves": 0, "lists": 0, "loads": 0}
+    problems = []
+    for turn in range(args.turns):
+        for chat_id in chat_ids:
+            messages = [message(chat_id, index) for index in range(turn + 1)]
+            chat_store.save_chat(chat_id, chat_id, messages, "coding")
+            counts["saves"] += 1
+            if rng.random() < args.list_rate:
+                summaries = chat_store.list_chats(limit=50)
+                counts["lists"] += 1
+                if summaries:
+                    other = rng.choice(summaries)["id"]
+                    # Chats of other threads are mid-write; any prefix is fine.
+                    problems += check_chat(chat_store.load_chat(other), other)
+                    counts["loads"] += 1
+    results.append({"user": user, "chats": chat_ids, "problems": problems, **counts})
+
+
+def run_worker(worker, args):
+    import chat_store
+
+    chat_store.configure(args.backend)
+    results = []
+    threads = [
+        threading.Thread(target=run_thread, args=(worker, thread, args, results))
+        for thread in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def verify(args, results):
+    import chat_store
+
+    chat_store.configure(args.backend)
+    problems = []
+    expected = {}
+    for result in results:
+        expected.setdefault(result["user"], set()).update(result["chats"])
+        problems += result["problems"]
+    for user, chat_ids in sorted(expected.items()):
+        chat_store.set_user(user)
+        summaries = chat_store.list_chats()
+        listed = {summary["id"] for summary in summaries}
+        if args.backend == "files":
+            import chat_store_files
+
+            # A lost manifest update leaves a stale entry behind.
+            for summary in summaries:
+                path = chat_store_files._chat_path(summary["id"])
+                if summary["size"] != path.stat().st_size:
+                    problems.append(f"{user}: stale listing of {summary['id']}")
+        if listed != chat_ids:
+            problems.append(
+                f"{user}: listed {len(listed)} chats, expected {len(chat_ids)}"
+            )
+        for chat_id in sorted(chat_ids):
+            problems += check_chat(chat_store.load_chat(chat_id), chat_id, args.turns)
+    chat_store.set_user(None)
+    leftovers = [
+        os.path.join(root, name)
+        for root, _, names in os.walk(os.environ["CHAT_STORE_DIR"])
+        for name in names
+        if name.endswith(".tmp")
+    ]
+    problems += [f"temp file left behind: {path}" for path in leftovers]
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["files", "sqlite"])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--chats", type=int, default=3, help="chats per thread")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--list-rate", type=float, default=0.3)
+    args = parser.parse_args()
+    os.environ.setdefault("METRICS_ENABLED", "0")
+
+    failed = False
+    for backend in args.backends:
+        args.backend = backend
+        with tempfile.TemporaryDirectory() as chat_dir:
+            # Set before the pool starts so every process shares the directory.
+            os.environ["CHAT_STORE_DIR"] = chat_dir
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=args.processes) as pool:
+                futures = [
+                    pool.submit(run_worker, worker, args)
+                    for worker in range(args.processes)
+                ]
+                results = [result for future in futures for result in future.result()]
+            seconds = time.perf_counter() - started
+            problems = verify(args, results)
+        operations = sum(
+            result["saves"] + result["lists"] + result["loads"] for result in results
+        )
+        failed = failed or bool(problems)
+        print(
+            json.dumps(
+                {
+                    "backend": backend,
+                    "processes": args.processes,
+                    "threads": args.threads,
+                    "saves": sum(result["saves"] for result in results),
+                    "lists": sum(result["lists"] for result in results),
+                    "loads": sum(result["loads"] for result in results),
+                    "seconds": round(seconds, 3),
+                    "operations_per_second": round(operations / seconds, 1),
+                    "problems": problems[:20],
+                }
+            )
+        )
+    os.environ.pop("CHAT_STORE_DIR", None)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare streaming (ffmpeg pipe) and pydub audio conversion.
+
+Generates a synthetic tone locally, then converts it once per mode in a
+fresh interpreter so each run's peak RSS is measured in isolation:
+
+    python -m benchmarks.convert_audio --seconds 600 --output-format mp3
+"""
+import argparse
+import array
+import json
+import math
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+SAMPLE_RATE = 24000
+
+
+def write_tone(path, seconds):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        block = array.array(
+            "h",
+            (
+                int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+                for i in range(SAMPLE_RATE)
+            ),
+        ).tobytes()
+        for _ in range(seconds):
+            wav.writeframes(block)
+
+
+def encode(wav_path, input_format):
+    if input_format == "wav":
+        return wav_path
+    path = wav_path.with_suffix(f".{input_format}")
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-y", "-i", str(wav_path), str(path)],
+        check=True,
+    )
+    return path
+
+
+def run_mode(mode, input_path, input_format, output_format):
+    import utils
+
+    started = time.perf_counter()
+    with open(input_path, "rb") as audio_file:
+        output = utils.convert_audio(
+            audio_file, input_format, output_format, streaming=mode == "stream"
+        )
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "input_mb": round(Path(input_path).stat().st_size / 2**20, 2),
+        "output_mb": round(len(output) / 2**20, 2),
+        "throughput_mb_s": round(Path(input_path).stat().st_size / 2**20 / seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=600)
+    parser.add_argument("--input-format", default="flac")
+    parser.add_argument("--output-format", default="mp3")
+    parser.add_argument("--mode", choices=["stream", "pydub"], help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_mode(args.mode, args.input, args.input_format, args.output_format)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = Path(tmp) / "tone.wav"
+        write_tone(wav_path, args.seconds)
+        input_path = encode(wav_path, args.input_format)
+        for mode in ("pydub", "stream"):
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.convert_audio",
+                    "--mode",
+                    mode,
+                    "--input",
+                    str(input_path),
+                    "--input-format",
+                    args.input_format,
+                    "--output-format",
+                    args.output_format,
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            print(completed.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Local stand-in for the OpenAI endpoints the app uses.
+
+Serves streamed and plain ``POST /v1/responses`` and ``POST
+/v1/audio/speech`` with configurable latency, token rate and failures, so
+benchmarks run offline and repeatably:
+
+    python -m benchmarks.fake_openai --port 8765 --token-rate 80 --latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run ...
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    # seconds before the first byte of any response
+    "latency": 0.05,
+    # streamed output tokens per second; 0 sends them as fast as possible
+    "token_rate": 0.0,
+    "output_tokens": 200,
+    # fraction of requests answered with a 500 or a 429 (with Retry-After)
+    "failure_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after": 1.0,
+    # fraction of streams that send an ``error`` event halfway through
+    "stream_error_rate": 0.0,
+    # speech synthesis time and generated speech length, per input character
+    "synthesis_seconds_per_char": 0.001,
+    "audio_seconds_per_char": 0.06,
+    "sample_rate": 24000,
+    "seed": 0,
+}
+# Prompts shorter than this are never served from the provider's cache.
+MIN_CACHED_TOKENS = 1024
+WORDS = (
+    "the quick brown fox jumps over lazy dog while code compiles and tests "
+    "pass in a loop of functions returning values from small modules"
+).split()
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, Handler)
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.random = random.Random(self.config["seed"])
+        self.lock = threading.Lock()
+        self.prefixes = set()
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "rate_limited": 0,
+            "stream_errors": 0,
+        }
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def roll(self, name):
+        with self.lock:
+            return self.random.random() < self.config[name]
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def cached_tokens(self, messages):
+        """Tokens of the longest message prefix seen before, like prompt caching."""
+        digest = hashlib.sha256()
+        cached = 0
+        tokens = 0
+        with self.lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+                tokens += _tokens(json.dumps(message))
+                key = digest.hexdigest()
+                if key in self.prefixes and tokens >= MIN_CACHED_TOKENS:
+                    cached = tokens
+                self.prefixes.add(key)
+        return cached
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server.count("requests")
+        time.sleep(server.config["latency"])
+        if server.roll("rate_limit_rate"):
+            server.count("rate_limited")
+            return self.send_error_json(
+                429,
+                "rate_limit_exceeded",
+                {"Retry-After": str(server.config["retry_after"])},
+            )
+        if server.roll("failure_rate"):
+            server.count("failures")
+            return self.send_error_json(500, "server_error")
+        if self.path.rstrip("/").endswith("/responses"):
+            return self.handle_responses(body)
+        if self.path.rstrip("/").endswith("/audio/speech"):
+            return self.handle_speech(body)
+        self.send_error_json(404, "not_found")
+
+    def send_error_json(self, status, code, headers=None):
+        data = json.dumps(
+            {"error": {"message": f"fake {code}", "type": code, "code": code}}
+        ).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_responses(self, body):
+        server = self.server
+        messages = body.get("input")
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        input_tokens = sum(_tokens(json.dumps(message)) for message in messages)
+        usage = {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": server.cached_tokens(messages)},
+            "output_tokens": server.config["output_tokens"],
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + server.config["output_tokens"],
+        }
+        words = [
+            WORDS[index % len(WORDS)] for index in range(server.config["output_tokens"])
+        ]
+        response = {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model"),
+            "status": "in_progress",
+            "output": [],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+        }
+        if not body.get("stream"):
+            response.update(
+                status="completed",
+                output=[_output_message(" ".join(words))],
+                usage=usage,
+            )
+            data = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sequence = iter(range(1 << 30))
+        self.send_event(
+            "response.created", {"response": response, "sequence_number": next(sequence)}
+        )
+        fail_at = len(words) // 2 if server.roll("stream_error_rate") else None
+        interval = 1.0 / server.config["token_rate"] if server.config["token_rate"] else 0
+        for index, word in enumerate(words):
+            if index == fail_at:
+                server.count("stream_errors")
+                self.send_event(
+                    "error",
+                    {
+                        "code": "server_error",
+                        "message": "fake stream error",
+                        "param": None,
+                        "sequence_number": next(sequence),
+                    },
+                )
+                return self.end_chunks()
+            if interval:
+                time.sleep(interval)
+            self.send_event(
+                "response.output_text.delta",
+                {
+                    "item_id": "msg_fake",
+                    "output_index": 0,
+                    "content_index": 0,
+                    "delta": word if index == 0 else f" {word}",
+                    "logprobs": [],
+                    "sequence_number": next(sequence),
+                },
+            )
+        response.update(
+            status="completed", output=[_output_message(" ".join(words))], usage=usage
+        )
+        self.send_event(
+            "response.completed",
+            {"response": response, "sequence_number": next(sequence)},
+        )
+        self.end_chunks()
+
+    def send_event(self, event_type, payload):
+        data = json.dumps(dict(payload, type=event_type))
+        self.send_chunk(f"event: {event_type}\ndata: {data}\n\n".encode("utf-8"))
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunks(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def handle_speech(self, body):
+        # Always WAV: the benchmarks request it so no codec is needed here.
+        config = self.server.config
+        # Longer inputs take longer to synthesize, as with the real API.
+        time.sleep(len(body.get("input", "")) * config["synthesis_seconds_per_char"])
+        seconds = len(body.get("input", "")) * config["audio_seconds_per_char"]
+        frames = int(seconds * config["sample_rate"])
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(2)
+            audio.setframerate(config["sample_rate"])
+            audio.writeframes(b"\0\0" * frames)
+        data = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _output_message(text):
+    return {
+        "type": "message",
+        "id": "msg_fake",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def start(port=0, **config):
+    """Serve on a background thread; returns the server (see ``.url``)."""
+    server = FakeOpenAI(("127.0.0.1", port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    for name, default in DEFAULT_CONFIG.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(default), default=default
+        )
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    server = FakeOpenAI(("127.0.0.1", port), args)
+    print(f"fake OpenAI API at {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Per-turn CPU and allocation cost of the chat message path.
+
+Compares the original list-of-dicts path (deep copy to insert the style
+message, full content scan on save) with chat_messages.Conversation:
+
+    python -m benchmarks.messages --sizes 1000 10000
+"""
+import argparse
+import copy
+import json
+import time
+import tracemalloc
+
+import chat_messages
+import chat_request
+
+STYLE_MESSAGE = {"role": "system", "content": "Regardless of the question..."}
+
+
+def make_dicts(size):
+    messages = [chat_request.system_message("coding")]
+    for index in range(size):
+        role = "user" if index % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"message {index} " * 20})
+    return messages
+
+
+def chat_has_content(messages):
+    for message in messages:
+        if message.get("role") in ("user", "assistant"):
+            if str(message.get("content", "")).strip():
+                return True
+    return False
+
+
+def dict_turn(messages, prompt):
+    messages.append({"role": "user", "content": prompt})
+    chat_has_content(messages)
+    request = copy.deepcopy(messages)
+    request.insert(1, STYLE_MESSAGE)
+    messages.append({"role": "assistant", "content": "answer"})
+    chat_has_content(messages)
+    return request
+
+
+def conversation_turn(messages, prompt):
+    messages.append(chat_messages.Message("user", prompt))
+    messages.has_content
+    request = chat_request.api_messages(messages, "coding") + [STYLE_MESSAGE]
+    messages.append(chat_messages.Message("assistant", "answer"))
+    messages.has_content
+    messages.to_dicts()
+    return request
+
+
+def measure(turn, messages, turns):
+    turn(messages, "warm up")
+    started = time.process_time()
+    for index in range(turns):
+        turn(messages, f"question {index}")
+    cpu = (time.process_time() - started) / turns
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    requests = [turn(messages, f"question {index}") for index in range(turns)]
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del requests
+    return {
+        "cpu_ms_per_turn": round(cpu * 1000, 3),
+        "retained_kb_per_turn": round((after - before) / turns / 1024, 1),
+        "peak_kb": round((peak - before) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+    for size in args.sizes:
+        for name, turn, messages in (
+            ("dicts+deepcopy", dict_turn, make_dicts(size)),
+            (
+                "conversation",
+                conversation_turn,
+                chat_messages.Conversation(make_dicts(size)),
+            ),
+        ):
+            result = measure(turn, messages, args.turns)
+            print(json.dumps({"messages": size, "path": name, **result}))
+
+
+if __name__ == "__main__":
+    main()
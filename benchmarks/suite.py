@@ -0,0 +1,425 @@
+"""Offline benchmark suite: chat turns, chat storage and zip TTS batches.
+
+Chat and TTS scenarios run against the local fake API (benchmarks.fake_openai),
+storage scenarios against a temporary chat directory. Results are written as
+JSON, tagged with the current commit, so runs can be diffed:
+
+    python -m benchmarks.suite --output bench_results.json
+    python -m benchmarks.suite --scenarios chat_store --store-sizes 10 1000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import fake_openai
+
+SCENARIOS = ("chat", "chat_store", "tts_zip", "tts_async", "tts_long")
+
+
+class NullPlaceholder:
+    def markdown(self, text):
+        pass
+
+
+def summary(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "mean": round(statistics.fmean(values), 6),
+        "p50": round(values[len(values) // 2], 6),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 6),
+        "max": round(values[-1], 6),
+    }
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def history(length):
+    import chat_messages
+    import chat_request
+
+    messages = chat_messages.Conversation([chat_request.system_message("coding")])
+    for index in range(length):
+        role = "user" if index % 2 == 0 else "assistant"
+        messages.append(
+            chat_messages.Message(role, f"message {index} " + "lorem ipsum " * 40)
+        )
+    return messages
+
+
+def chat_turn(client, messages, model):
+    """One streamed turn, assembled and rendered the way the chat page does."""
+    import chat_request
+    import context_window
+    import stream_render
+
+    renderer = stream_render.ThrottledRenderer(NullPlaceholder())
+    started = time.perf_counter()
+    context, _, context_stats = context_window.build_context(
+        chat_request.api_messages(messages, "coding"),
+        chat_request.style_messages(None),
+        chat_request.token_budget(model),
+        model=model,
+        summarize=lambda previous, new: "summary",
+    )
+    assembled = time.perf_counter()
+    stream = client.responses.create(
+        **chat_request.request_kwargs(model, context, "coding")
+    )
+    reader = chat_request.read_stream(stream, renderer.append, started)
+    usage = reader.usage
+    renderer.finish()
+    finished = time.perf_counter()
+    return {
+        "assemble_seconds": assembled - started,
+        "first_token_seconds": reader.first_token_seconds or finished - started,
+        "seconds": finished - started,
+        "deltas_per_second": renderer.events / (finished - started),
+        "flushes": renderer.flushes,
+        "cached_tokens": usage.get("cached_tokens", 0),
+        "input_tokens": usage.get("input_tokens", 0),
+        **{f"context_{key}": value for key, value in context_stats.items()},
+    }
+
+
+def bench_chat(args, server):
+    import clients
+    import openai
+
+    client = clients.get_client("fake")
+    results = []
+    for length in args.history_lengths:
+        messages = history(length)
+        turns = []
+        errors = 0
+        for _ in range(args.turns):
+            try:
+                turns.append(chat_turn(client, messages, "gpt-5-mini"))
+            except (RuntimeError, openai.APIError):
+                errors += 1
+        metrics = {"turns": len(turns), "errors": errors}
+        for key in ("assemble_seconds", "first_token_seconds", "seconds"):
+            metrics[key] = summary([turn[key] for turn in turns])
+        metrics["deltas_per_second"] = summary(
+            [turn["deltas_per_second"] for turn in turns]
+        )
+        metrics["cached_token_share"] = round(
+            sum(turn["cached_tokens"] for turn in turns)
+            / max(1, sum(turn["input_tokens"] for turn in turns)),
+            3,
+        )
+        results.append(
+            {"scenario": "chat", "params": {"history": length}, "metrics": metrics}
+        )
+    return results
+
+
+def seed_chats(backend, count, messages):
+    import chat_store
+
+    if backend == "files":
+        # Saving one by one rewrites the manifest every time; write the logs
+        # directly and let the first listing index them.
+        import chat_store_files
+
+        for index in range(count):
+            chat_store_files._write_log(
+                f"seed_{index:06d}",
+                chat_store_files._chat_meta(f"Chat {index}", "coding", None),
+                messages,
+                chat_store._now_iso(),
+            )
+    else:
+        for index in range(count):
+            chat_store.save_chat(f"seed_{index:06d}", f"Chat {index}", messages, "coding")
+
+
+def bench_chat_store(args):
+    import chat_store
+
+    messages = history(20).to_dicts()
+    results = []
+    for backend in args.backends:
+        for size in args.store_sizes:
+            with tempfile.TemporaryDirectory() as chat_dir:
+                os.environ["CHAT_STORE_DIR"] = chat_dir
+                chat_store.configure(backend)
+                seed_seconds, _ = timed(seed_chats, backend, size, messages)
+                cold_list, _ = timed(chat_store.list_chats, limit=50)
+                list_times, save_new, save_append, loads = [], [], [], []
+                for index in range(args.repeat):
+                    list_times.append(timed(chat_store.list_chats, limit=50)[0])
+                    chat_id = f"bench_{index:04d}"
+                    save_new.append(
+                        timed(chat_store.save_chat, chat_id, "new", messages, "coding")[0]
+                    )
+                    longer = messages + [{"role": "user", "content": "one more"}]
+                    save_append.append(
+                        timed(chat_store.save_chat, chat_id, "new", longer, "coding")[0]
+                    )
+                    loads.append(
+                        timed(chat_store.load_chat, f"seed_{index % size:06d}")[0]
+                    )
+                search_seconds, _ = timed(chat_store.search_chats, "message 7", limit=10)
+            results.append(
+                {
+                    "scenario": "chat_store",
+                    "params": {"backend": backend, "chats": size},
+                    "metrics": {
+                        "seed_seconds": round(seed_seconds, 3),
+                        "cold_list_seconds": round(cold_list, 6),
+                        "list_seconds": summary(list_times),
+                        "save_new_seconds": summary(save_new),
+                        "save_append_seconds": summary(save_append),
+                        "load_seconds": summary(loads),
+                        "search_seconds": round(search_seconds, 6),
+                    },
+                }
+            )
+    os.environ.pop("CHAT_STORE_DIR", None)
+    return results
+
+
+def bench_tts_zip(args, server):
+    """Zip uploads the way the TTS page runs them: a tts_jobs job, through
+    the scheduler, spooled to disk and zipped up."""
+    import tts_jobs
+
+    # Every run must reach the (fake) API, under the same limit as tts_async.
+    os.environ["AUDIO_CACHE_MAX_BYTES"] = "0"
+    os.environ["TTS_RATE_LIMITS"] = f"tts-1={args.tts_rpm}"
+    results = []
+    for files in args.zip_files:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["TTS_SPOOL_DIR"] = tmp
+            entries = [
+                (
+                    f"{index:05d}.wav",
+                    f"File {index}. "
+                    + "Some sentence to read out loud. " * args.zip_chars,
+                )
+                for index in range(files)
+            ]
+            started = time.perf_counter()
+            job = tts_jobs.submit(
+                "bench",
+                f"{files}.zip",
+                entries,
+                format="wav",
+                api_key="fake",
+                concurrency=args.concurrency,
+            )
+            tts_jobs._queue.join()
+            seconds = time.perf_counter() - started
+            state = tts_jobs.get(job)
+            audio_bytes = sum(
+                os.path.getsize(path) for _, path in tts_jobs.finished_entries(state)
+            )
+        results.append(
+            {
+                "scenario": "tts_zip",
+                "params": {"files": files, "concurrency": args.concurrency},
+                "metrics": {
+                    "seconds": round(seconds, 3),
+                    "files_per_second": round(files / seconds, 2),
+                    "audio_mb": round(audio_bytes / 2**20, 2),
+                    "errors": len(state["failures"]),
+                },
+            }
+        )
+    for name in ("TTS_SPOOL_DIR", "TTS_RATE_LIMITS", "AUDIO_CACHE_MAX_BYTES"):
+        os.environ.pop(name, None)
+    return results
+
+
+def bench_tts_async(args, server):
+    import tts_scheduler
+
+    os.environ["AUDIO_CACHE_MAX_BYTES"] = "0"
+    results = []
+    for files in args.zip_files:
+        texts = [
+            f"File {index}. " + "Some sentence to read out loud. " * args.zip_chars
+            for index in range(files)
+        ]
+        audio_bytes = 0
+
+        def file_done(index, audio, stats, error):
+            nonlocal audio_bytes
+            audio_bytes += len(audio or b"")
+
+        report = tts_scheduler.convert_batch(
+            texts,
+            file_done,
+            response_format="wav",
+            api_key="fake",
+            max_concurrency=args.concurrency,
+            limits={"tts-1": args.tts_rpm},
+        )
+        report.pop("retried_jobs")
+        report["audio_mb"] = round(audio_bytes / 2**20, 2)
+        results.append(
+            {
+                "scenario": "tts_async",
+                "params": {
+                    "files": files,
+                    "concurrency": args.concurrency,
+                    "requests_per_minute": args.tts_rpm,
+                },
+                "metrics": report,
+            }
+        )
+    os.environ.pop("AUDIO_CACHE_MAX_BYTES", None)
+    return results
+
+
+def bench_tts_long(args, server):
+    """One long text three ways: a single request for the whole text (the
+    path before chunking), its chunks one at a time, and its chunks in
+    parallel. The speedups compare the parallel run with the other two."""
+    import tts_scheduler
+    import utils
+
+    os.environ["AUDIO_CACHE_MAX_BYTES"] = "0"
+    # The fake API only speaks WAV, which pydub stitches without ffmpeg.
+    chunk_format = utils.CHUNK_FORMAT
+    utils.CHUNK_FORMAT = "wav"
+    sentence = "Some sentence to read out loud. "
+    results = []
+    for chars in args.long_chars:
+        text = (sentence * (chars // len(sentence) + 1))[:chars]
+        runs = {
+            "single": {"max_chars": len(text), "max_concurrency": 1},
+            "sequential": {"max_chars": utils.TTS_MAX_CHARS, "max_concurrency": 1},
+            "parallel": {
+                "max_chars": utils.TTS_MAX_CHARS,
+                "max_concurrency": args.concurrency,
+            },
+        }
+        metrics = {"chunks": len(utils.split_text(text)), "errors": 0}
+        for name, options in runs.items():
+            errors = []
+
+            def text_done(index, audio, stats, error):
+                if error is not None:
+                    errors.append(error)
+
+            seconds, _ = timed(
+                tts_scheduler.convert_batch,
+                [text],
+                text_done,
+                response_format="wav",
+                api_key="fake",
+                limits={"tts-1": args.tts_rpm},
+                **options,
+            )
+            metrics[f"{name}_seconds"] = round(seconds, 3)
+            metrics["errors"] += len(errors)
+        for name in ("single", "sequential"):
+            metrics[f"speedup_over_{name}"] = round(
+                metrics[f"{name}_seconds"] / metrics["parallel_seconds"], 2
+            )
+        results.append(
+            {
+                "scenario": "tts_long",
+                "params": {"chars": chars, "concurrency": args.concurrency},
+                "metrics": metrics,
+            }
+        )
+    utils.CHUNK_FORMAT = chunk_format
+    os.environ.pop("AUDIO_CACHE_MAX_BYTES", None)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--history-lengths", nargs="+", type=int, default=[0, 20, 200])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=["files", "sqlite"])
+    parser.add_argument("--store-sizes", nargs="+", type=int, default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--zip-files", nargs="+", type=int, default=[10, 50])
+    parser.add_argument("--zip-chars", type=int, default=20, help="sentences per file")
+    parser.add_argument(
+        "--long-chars",
+        nargs="+",
+        type=int,
+        default=[20000],
+        help="text lengths for tts_long",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--tts-rpm", type=float, default=6000, help="scheduler limit for tts_async"
+    )
+    for name, default in fake_openai.DEFAULT_CONFIG.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(default), default=default
+        )
+    args = parser.parse_args()
+
+    server_config = {
+        name: getattr(args, name) for name in fake_openai.DEFAULT_CONFIG
+    }
+    server = fake_openai.start(**server_config)
+    # Point the app's shared clients at the fake API, and keep benchmark
+    # measurements out of the app's own metrics file.
+    os.environ["OPENAI_BASE_URL"] = server.url
+    os.environ.setdefault("METRICS_ENABLED", "0")
+
+    results = []
+    for scenario in args.scenarios:
+        print(f"running {scenario}", file=sys.stderr)
+        if scenario == "chat":
+            results += bench_chat(args, server)
+        elif scenario == "chat_store":
+            results += bench_chat_store(args)
+        elif scenario == "tts_zip":
+            results += bench_tts_zip(args, server)
+        elif scenario == "tts_async":
+            results += bench_tts_async(args, server)
+        elif scenario == "tts_long":
+            results += bench_tts_long(args, server)
+    server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "server_stats": server.stats,
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Evaluate the local topic gate on a labeled JSONL set.
+
+Each line is {"topic": ..., "prompt": ..., "off_topic": true|false}.
+Rejections are the positive class: precision is the share of rejected
+prompts that really were off-topic, recall the share of off-topic prompts
+rejected without a model call. Off-topic prompts the gate lets through
+still reach the model, so recall is a saving while precision is a hard
+requirement.
+
+    python -m benchmarks.topic_gate benchmarks/data/topic_gate.jsonl
+"""
+import argparse
+import json
+import statistics
+import time
+
+import topic_gate
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dataset")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.dataset, encoding="utf-8") as dataset:
+        examples = [json.loads(line) for line in dataset if line.strip()]
+
+    counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    latencies = []
+    for example in examples:
+        result = topic_gate.check(example["prompt"], example["topic"])
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            topic_gate.check(example["prompt"], example["topic"])
+            latencies.append(time.perf_counter() - started)
+        outcome = ("t" if result["reject"] == example["off_topic"] else "f") + (
+            "p" if result["reject"] else "n"
+        )
+        counts[outcome] += 1
+        if args.show_errors and outcome[0] == "f":
+            print(json.dumps(dict(example, **result)))
+
+    rejected = counts["tp"] + counts["fp"]
+    off_topic = counts["tp"] + counts["fn"]
+    print(
+        json.dumps(
+            {
+                "examples": len(examples),
+                **counts,
+                "precision": round(counts["tp"] / rejected, 3) if rejected else None,
+                "recall": round(counts["tp"] / off_topic, 3) if off_topic else None,
+                "latency_us_p50": round(statistics.median(latencies) * 1e6, 1),
+                "latency_us_p99": round(percentile(latencies, 0.99) * 1e6, 1),
+                "latency_us_max": round(max(latencies) * 1e6, 1),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Run whitelist chat prompts in bulk, without the Streamlit page.
+
+Reads a JSONL file of prompts and sends each as the first turn of a chat
+(topic prompt, prompt, style), the same request the chat page makes, with at
+most ``--concurrency`` requests in flight. Results are written as JSON lines
+as they finish, with latency, the "Invalid Input" flag and token usage; a
+summary goes to stderr:
+
+    python chat_batch.py prompts.jsonl --output results.jsonl --concurrency 16
+    python chat_batch.py requests.jsonl --prompt-field body --fake
+
+Each line is an object with the prompt (``--prompt-field``, default
+"prompt") and optionally ``id`` (or ``request_id``), ``topic``, ``style`` and
+``model`` overriding the command-line defaults. ``--fake`` runs against the
+local stand-in server (benchmarks.fake_openai) instead of the API; the API
+key and base URL otherwise come from OPENAI_API_KEY and OPENAI_BASE_URL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import openai
+
+import chat_request
+import clients
+import context_window
+import metrics
+import prompts
+import response_cache
+import topic_gate
+
+DEFAULT_MODEL = "gpt-5-mini"
+DEFAULT_TOPIC = "coding"
+DEFAULT_CONCURRENCY = 8
+
+
+def read_prompts(path: str) -> Iterator[Dict[str, Any]]:
+    """The file's JSON objects, read lazily; "-" reads stdin."""
+    with open(sys.stdin.fileno() if path == "-" else path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _cache_key(
+    prompt: str, topic: str, style: Optional[str], model: str, effort: Optional[str]
+) -> str:
+    # The key the chat page looks up for this prompt as a new chat's first turn.
+    return response_cache.request_key(
+        chat_request.system_message(topic)["content"],
+        prompts.STYLE_PROMPTS.get(style),
+        model,
+        effort,
+        [{"role": "user", "content": prompt}],
+    )
+
+
+async def run_prompt(
+    client: openai.AsyncOpenAI,
+    index: int,
+    item: Dict[str, Any],
+    options: Dict[str, Any],
+) -> Dict[str, Any]:
+    prompt = str(item.get(options["prompt_field"]) or "")
+    topic = item.get("topic") or options["topic"]
+    style = item.get("style") or options["style"]
+    model = item.get("model") or options["model"]
+    result: Dict[str, Any] = {
+        "index": index,
+        "id": item.get("id", item.get("request_id", index)),
+        "model": model,
+        "topic": topic,
+        "style": style,
+        "invalid": False,
+        "gated": False,
+        "error": None,
+    }
+    if options["gate"]:
+        gate_result = topic_gate.check(prompt, topic, options["gate_keywords"])
+        if gate_result["reject"]:
+            # Rejected without a request, like the chat page does.
+            result.update(invalid=True, gated=True, latency_seconds=0.0, output=None)
+            return result
+
+    # Assembled like the page's first turn, under the same per-model budget.
+    messages, _, context_stats = context_window.build_context(
+        [chat_request.system_message(topic), {"role": "user", "content": prompt}],
+        chat_request.style_messages(style),
+        chat_request.token_budget(model),
+        model=model,
+    )
+    result["context_tokens"] = context_stats["context_tokens"]
+    kwargs = chat_request.request_kwargs(
+        model,
+        messages,
+        topic,
+        web_search=options["web_search"],
+        thinking_level=options["thinking_level"],
+    )
+    started = time.perf_counter()
+    try:
+        stream = await client.responses.create(**kwargs)
+        reader = await chat_request.aread_stream(stream, started=started)
+    except (RuntimeError, openai.APIError) as error:
+        result.update(
+            error=str(error),
+            latency_seconds=round(time.perf_counter() - started, 6),
+        )
+        return result
+    text = reader.text
+    result.update(
+        invalid=chat_request.is_invalid(text),
+        latency_seconds=round(time.perf_counter() - started, 6),
+        first_token_seconds=reader.first_token_seconds,
+        response_id=reader.response_id,
+        **reader.usage,
+        output=text,
+    )
+    if options["warm_cache"] and not result["invalid"] and "tools" not in kwargs:
+        key = _cache_key(
+            prompt, topic, style, model, kwargs.get("reasoning", {}).get("effort")
+        )
+        response_cache.put(key, text)
+    return result
+
+
+async def run_batch(
+    items: Iterable[Dict[str, Any]],
+    on_result: Callable[[Dict[str, Any]], Any],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    api_key: Optional[str] = None,
+    **options: Any,
+) -> None:
+    """Run every item's prompt, at most ``concurrency`` at a time.
+
+    Items are pulled from the iterable as slots free up, so large files are
+    never read into memory; on_result gets each result as it finishes.
+    """
+    client = clients.new_async_client(api_key)
+    pending = enumerate(items)
+
+    async def worker() -> None:
+        # Workers share the iterator; each takes the next item when free.
+        for index, item in pending:
+            on_result(await run_prompt(client, index, item, options))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        await client.close()
+
+
+class Summary:
+    """Totals over the batch's results, for the report at the end."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.results = 0
+        self.invalid = 0
+        self.gated = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self.tokens = {
+            "input_tokens": 0,
+            "cached_tokens": 0,
+            "uncached_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self.results += 1
+        self.invalid += result["invalid"]
+        self.gated += result["gated"]
+        if result["error"] is not None:
+            self.errors += 1
+        elif not result["gated"]:
+            self.latencies.append(result["latency_seconds"])
+        for key in self.tokens:
+            self.tokens[key] += result.get(key, 0)
+
+    def report(self) -> Dict[str, Any]:
+        wall_seconds = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        report = {
+            "prompts": self.results,
+            "invalid": self.invalid,
+            "gated": self.gated,
+            "errors": self.errors,
+            "wall_seconds": round(wall_seconds, 3),
+            "prompts_per_second": round(self.results / wall_seconds, 3)
+            if wall_seconds
+            else 0.0,
+            **self.tokens,
+        }
+        for fraction in metrics.QUANTILES:
+            report[f"latency_p{int(fraction * 100)}"] = (
+                round(metrics.quantile(latencies, fraction), 6) if latencies else None
+            )
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("prompts", help='JSONL file of prompts, "-" for stdin')
+    parser.add_argument("--output", default="-", help='results JSONL, "-" for stdout')
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--topic", default=DEFAULT_TOPIC)
+    parser.add_argument("--style", choices=sorted(prompts.STYLE_PROMPTS))
+    parser.add_argument("--web-search", action="store_true")
+    parser.add_argument("--thinking-level")
+    parser.add_argument(
+        "--no-gate",
+        dest="gate",
+        action="store_false",
+        help="send clearly off-topic prompts too instead of rejecting them locally",
+    )
+    parser.add_argument(
+        "--warm-cache",
+        action="store_true",
+        help="store valid answers in the response cache the chat page reads",
+    )
+    parser.add_argument(
+        "--fake", action="store_true", help="run against benchmarks.fake_openai"
+    )
+    args = parser.parse_args()
+
+    server = None
+    if args.fake:
+        from benchmarks import fake_openai
+
+        server = fake_openai.start()
+        os.environ["OPENAI_BASE_URL"] = server.url
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+    gate_keywords = os.environ.get("TOPIC_GATE_KEYWORDS")
+
+    summary = Summary()
+    if args.output == "-":
+        output = sys.stdout
+    else:
+        output = open(args.output, "w", encoding="utf-8")
+
+    def on_result(result):
+        summary.add(result)
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        asyncio.run(
+            run_batch(
+                read_prompts(args.prompts),
+                on_result,
+                concurrency=args.concurrency,
+                prompt_field=args.prompt_field,
+                topic=args.topic,
+                style=args.style,
+                model=args.model,
+                web_search=args.web_search,
+                thinking_level=args.thinking_level,
+                gate=args.gate,
+                gate_keywords=json.loads(gate_keywords) if gate_keywords else None,
+                warm_cache=args.warm_cache,
+            )
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if server is not None:
+            server.shutdown()
+    print(
+        json.dumps(dict(summary.report(), concurrency=args.concurrency)),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+# Roles whose text makes a chat worth saving
+CONTENT_ROLES = ("user", "assistant")
+
+
+class Message:
+    """An immutable chat message.
+
+    Reads like the dicts stored in chat files (``message["content"]``,
+    ``message.get("response_id")``). The API and storage dicts are built
+    once and shared, so treat them as read-only.
+    """
+
+    __slots__ = ("role", "content", "extra", "has_content", "_api_dict", "_dict")
+
+    def __init__(self, role: str, content: str, **extra: Any):
+        set_attr = object.__setattr__
+        set_attr(self, "role", role)
+        set_attr(self, "content", content)
+        set_attr(self, "extra", extra)
+        set_attr(
+            self,
+            "has_content",
+            role in CONTENT_ROLES and bool(str(content or "").strip()),
+        )
+        set_attr(self, "_api_dict", None)
+        set_attr(self, "_dict", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Message is immutable")
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        return self.extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+    def api_dict(self) -> Dict[str, str]:
+        """The role/content pair sent to the API."""
+        if self._api_dict is None:
+            object.__setattr__(
+                self, "_api_dict", {"role": self.role, "content": self.content}
+            )
+        return self._api_dict
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The message as stored in chat files."""
+        if self._dict is None:
+            data = {"role": self.role, "content": self.content, **self.extra}
+            object.__setattr__(self, "_dict", data)
+        return self._dict
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        extra = {
+            key: value for key, value in data.items() if key not in ("role", "content")
+        }
+        message = cls(data.get("role", "user"), data.get("content", ""), **extra)
+        # A freshly loaded dict is already in storage form; keep it.
+        object.__setattr__(message, "_dict", data)
+        return message
+
+
+MessageLike = Union[Message, Dict[str, Any]]
+
+
+def _as_message(message: MessageLike) -> Message:
+    return message if isinstance(message, Message) else Message.from_dict(message)
+
+
+class Conversation:
+    """A chat's messages with a running count of those that have content."""
+
+    __slots__ = ("_messages", "content_count")
+
+    def __init__(self, messages: Iterable[MessageLike] = ()):
+        self._messages: List[Message] = [_as_message(message) for message in messages]
+        self.content_count = sum(message.has_content for message in self._messages)
+
+    @property
+    def has_content(self) -> bool:
+        return self.content_count > 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __setitem__(self, index: int, message: MessageLike) -> None:
+        message = _as_message(message)
+        self.content_count += message.has_content - self._messages[index].has_content
+        self._messages[index] = message
+
+    def append(self, message: MessageLike) -> None:
+        message = _as_message(message)
+        self._messages.append(message)
+        self.content_count += message.has_content
+
+    def pop(self, index: int = -1) -> Message:
+        message = self._messages.pop(index)
+        self.content_count -= message.has_content
+        return message
+
+    def api_messages(self, start: int = 0) -> List[Dict[str, str]]:
+        """Role/content dicts for the API, shared with earlier turns."""
+        return [message.api_dict() for message in self._messages[start:]]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """JSON-compatible dicts in the stored chat format."""
+        return [message.to_dict() for message in self._messages]
+
+
+def as_conversation(messages: Optional[Any]) -> Conversation:
+    """A Conversation from stored dicts, or from one made by an older copy of
+    this module (Streamlit reloads changed modules but keeps session state)."""
+    if isinstance(messages, Conversation):
+        return messages
+    if hasattr(messages, "to_dicts"):
+        messages = messages.to_dicts()
+    if not isinstance(messages, list):
+        messages = []
+    return Conversation(message for message in messages if isinstance(message, dict))
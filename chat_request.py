@@ -0,0 +1,172 @@
+import hashlib
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, List, Optional
+
+import prompts
+from chat_messages import Conversation
+
+# What the topic prompt tells the model to answer with for off-topic input
+INVALID_INPUT = "Invalid Input"
+
+# Model feature flags (only show UI + send params when supported)
+# Note: you mentioned `gpt-5.2` supports both; earlier models may not.
+# token_budget: input tokens we send per request; older turns are summarized
+# beyond this. Set well below each model's context window to bound cost and
+# latency.
+MODEL_CAPABILITIES = {
+    "gpt-4o": {"web_search": False, "thinking": False, "token_budget": 32000},
+    "gpt-5-mini": {"web_search": False, "thinking": False, "token_budget": 32000},
+    "gpt-5.2": {"web_search": True, "thinking": True, "token_budget": 64000},
+    "gpt-5.2-codex": {"web_search": True, "thinking": True, "token_budget": 64000},
+}
+NO_CAPABILITIES = {"web_search": False, "thinking": False, "token_budget": 16000}
+
+
+@lru_cache(maxsize=256)
+def _system_prompt(topic: str) -> str:
+    return prompts.TOPIC_SYSTEM_PROMPT.format(topic=topic)
+
+
+def system_message(topic: str) -> Dict[str, str]:
+    # Formatted once per topic so every request for it starts with the same
+    # bytes; provider-side prompt caching only matches exact prefixes.
+    return {"role": "system", "content": _system_prompt(topic)}
+
+
+def style_messages(style: Optional[str]) -> List[Dict[str, str]]:
+    if not style:
+        return []
+    return [{"role": "system", "content": prompts.STYLE_PROMPTS[style]}]
+
+
+def api_messages(messages: Conversation, topic: str) -> List[Dict[str, str]]:
+    """Role/content dicts of the chat's messages, led by the topic prompt.
+
+    Stored messages carry extra fields (response ids, usage) that must not
+    reach the API or the prompt prefix. The dicts are shared with earlier
+    turns, not copied.
+    """
+    return [system_message(topic)] + messages.api_messages(start=1)
+
+
+def capabilities(model: str) -> Dict[str, Any]:
+    return MODEL_CAPABILITIES.get(model, NO_CAPABILITIES)
+
+
+def token_budget(model: str) -> int:
+    return capabilities(model)["token_budget"]
+
+
+def request_kwargs(
+    model: str,
+    input: List[Dict[str, str]],
+    topic: str,
+    web_search: bool = False,
+    thinking_level: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Arguments of a streamed Responses request; features the model lacks
+    are left out."""
+    kwargs = {
+        "model": model,
+        "input": input,
+        "stream": True,
+        "prompt_cache_key": prompt_cache_key(topic),
+    }
+    model_capabilities = capabilities(model)
+    if model_capabilities["web_search"] and web_search:
+        kwargs["tools"] = [{"type": "web_search"}]
+    if model_capabilities["thinking"] and thinking_level:
+        kwargs["reasoning"] = {"effort": thinking_level}
+    return kwargs
+
+
+def is_invalid(text: str) -> bool:
+    return text.strip() == INVALID_INPUT
+
+
+def prompt_cache_key(topic: str) -> str:
+    # Routes requests that share the topic prefix to the same cache shard.
+    return "topic-" + hashlib.sha256(topic.encode("utf-8")).hexdigest()[:16]
+
+
+def usage_stats(usage: Any) -> Dict[str, int]:
+    """Cached versus uncached input tokens from a response's usage."""
+    if usage is None:
+        return {}
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    details = getattr(usage, "input_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return {
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": input_tokens - cached_tokens,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
+
+
+class StreamReader:
+    """Collects a streamed response's text, id and usage, event by event.
+
+    ``on_delta`` gets each text delta as it arrives (e.g. a renderer's
+    append); latencies are measured from ``started``.
+    """
+
+    def __init__(
+        self,
+        on_delta: Optional[Callable[[str], Any]] = None,
+        started: Optional[float] = None,
+    ):
+        self.on_delta = on_delta
+        self.started = time.perf_counter() if started is None else started
+        self.deltas: List[str] = []
+        self.response_id: Optional[str] = None
+        self.usage: Dict[str, int] = {}
+        self.first_token_seconds: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.deltas)
+
+    def handle(self, event: Any) -> None:
+        event_type = getattr(event, "type", None)
+        if event_type == "response.output_text.delta":
+            if self.first_token_seconds is None:
+                self.first_token_seconds = time.perf_counter() - self.started
+            delta = getattr(event, "delta", "") or ""
+            self.deltas.append(delta)
+            if self.on_delta is not None:
+                self.on_delta(delta)
+        elif event_type in ("response.created", "response.completed"):
+            response = getattr(event, "response", None)
+            self.response_id = getattr(response, "id", self.response_id)
+            if event_type == "response.completed":
+                self.usage = usage_stats(getattr(response, "usage", None))
+        elif event_type == "error":
+            raise RuntimeError(
+                getattr(event, "error", None)
+                or getattr(event, "message", None)
+                or "Unknown error"
+            )
+
+
+def read_stream(
+    stream: Iterable[Any],
+    on_delta: Optional[Callable[[str], Any]] = None,
+    started: Optional[float] = None,
+) -> StreamReader:
+    reader = StreamReader(on_delta, started)
+    for event in stream:
+        reader.handle(event)
+    return reader
+
+
+async def aread_stream(
+    stream: AsyncIterable[Any],
+    on_delta: Optional[Callable[[str], Any]] = None,
+    started: Optional[float] = None,
+) -> StreamReader:
+    reader = StreamReader(on_delta, started)
+    async for event in stream:
+        reader.handle(event)
+    return reader
@@ -1,26 +1,117 @@
-import json
+import hashlib
+import importlib
+import os
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
+
+import metrics
 
 CHAT_DIR_NAME = "chat_history"
+# Each user's chats live in CHAT_DIR_NAME/users/<shard>/<user hash>, so no
+# directory holds more than a few hundred users.
+USERS_DIR_NAME = "users"
+# Storage engines implementing the functions below, by config name.
+BACKENDS = {
+    "files": "chat_store_files",
+    "sqlite": "chat_store_sqlite",
+}
+DEFAULT_BACKEND = "files"
+
+_backend_name = os.environ.get("CHAT_STORE_BACKEND", DEFAULT_BACKEND)
+# Whose chats this thread (a Streamlit session's script run) works on; None
+# is the shared namespace at the top of the chat directory.
+_user: ContextVar[Optional[str]] = ContextVar("chat_store_user", default=None)
+# A user's chat directory picked by path (see in_user_dir); overrides _user.
+_user_path: ContextVar[Optional[Path]] = ContextVar(
+    "chat_store_user_path", default=None
+)
+
+
+def configure(backend: Optional[str] = None) -> str:
+    """Select the storage engine; returns the engine now in use."""
+    global _backend_name
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown chat store backend {backend!r}; "
+                f"expected one of {sorted(BACKENDS)}"
+            )
+        _backend_name = backend
+    return _backend_name
+
+
+def _backend():
+    return importlib.import_module(BACKENDS[_backend_name])
+
+
+def _timed(op: str):
+    return metrics.timer("chat_store", backend=_backend_name, op=op)
+
+
+def set_user(user: Optional[str]) -> None:
+    """Scope the calling thread's chat operations to ``user``'s chats."""
+    _user.set(user or None)
+
+
+def current_user() -> Optional[str]:
+    return _user.get()
+
+
+@contextmanager
+def as_user(user: Optional[str]) -> Iterator[None]:
+    """Scope the chat operations inside the block to ``user``'s chats."""
+    token = _user.set(user or None)
+    try:
+        yield
+    finally:
+        _user.reset(token)
 
 
 def _chat_dir() -> Path:
-    return Path(__file__).resolve().parent / CHAT_DIR_NAME
+    return Path(
+        os.environ.get(
+            "CHAT_STORE_DIR", Path(__file__).resolve().parent / CHAT_DIR_NAME
+        )
+    )
+
+
+def user_dir(user: Optional[str]) -> Path:
+    if not user:
+        return _chat_dir()
+    # Hashed, so user names never end up in paths.
+    digest = hashlib.sha256(user.encode("utf-8")).hexdigest()
+    return _chat_dir() / USERS_DIR_NAME / digest[:2] / digest[:16]
+
+
+def user_dirs() -> List[Path]:
+    """Every user's chat directory on disk. Only the hashes of their names
+    are stored, so these can't be mapped back to users."""
+    users_dir = _chat_dir() / USERS_DIR_NAME
+    return sorted(path for path in users_dir.glob("*/*") if path.is_dir())
+
+
+@contextmanager
+def in_user_dir(path: Path) -> Iterator[None]:
+    """Scope the chat operations inside the block to the chats in ``path``,
+    one of user_dirs(), for tools that work on every user's chats."""
+    token = _user_path.set(path)
+    try:
+        yield
+    finally:
+        _user_path.reset(token)
 
 
 def ensure_chat_dir() -> Path:
-    chat_dir = _chat_dir()
+    """The current user's chat directory."""
+    chat_dir = _user_path.get() or user_dir(_user.get())
     chat_dir.mkdir(parents=True, exist_ok=True)
     return chat_dir
 
 
-def _chat_path(chat_id: str) -> Path:
-    return ensure_chat_dir() / f"{chat_id}.json"
-
-
 def _now_iso() -> str:
     return datetime.now().isoformat(timespec="seconds")
 
@@ -37,14 +128,19 @@ def new_chat_id(now: Optional[datetime] = None) -> str:
     return f"{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
 
-def load_chat(chat_id: str) -> Optional[Dict[str, Any]]:
-    path = _chat_path(chat_id)
-    if not path.exists():
-        return None
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except (OSError, json.JSONDecodeError):
-        return None
+def load_chat(chat_id: str, tail: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """A stored chat, or None.
+
+    With ``tail``, only the last ``tail`` messages are loaded and
+    ``message_count`` holds the length of the whole chat.
+    """
+    with _timed("load"):
+        return _backend().load_chat(chat_id, tail=tail)
+
+
+def iter_messages(chat_id: str) -> Iterator[Dict[str, Any]]:
+    """A chat's messages one at a time, without loading the whole chat."""
+    return _backend().iter_messages(chat_id)
 
 
 def save_chat(
@@ -52,70 +148,34 @@ def save_chat(
     name: str,
     messages: List[Dict[str, Any]],
     whitelist: str,
+    metadata: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    path = _chat_path(chat_id)
-    existing = load_chat(chat_id) or {}
-    now = _now_iso()
-    payload = {
-        "id": chat_id,
-        "name": name or "Untitled",
-        "whitelist": whitelist,
-        "created_at": existing.get("created_at", now),
-        "updated_at": now,
-        "messages": messages,
-    }
-    path.write_text(
-        json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8"
-    )
-    return payload
+    """Persist a chat; ``metadata=None`` keeps whatever was stored before."""
+    with _timed("save") as measurement:
+        measurement["messages"] = len(messages)
+        return _backend().save_chat(chat_id, name, messages, whitelist, metadata)
 
 
 def delete_chat(chat_id: str) -> bool:
-    path = _chat_path(chat_id)
-    if not path.exists():
-        return False
-    try:
-        path.unlink()
-        return True
-    except OSError:
-        return False
+    with _timed("delete"):
+        return _backend().delete_chat(chat_id)
 
 
-def _parse_iso(value: Optional[str]) -> Optional[datetime]:
-    if not value:
-        return None
-    try:
-        return datetime.fromisoformat(value)
-    except ValueError:
-        return None
-
-
-def list_chats() -> List[Dict[str, Any]]:
-    chat_dir = ensure_chat_dir()
-    chats = []
-    for path in chat_dir.glob("*.json"):
-        try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-        except (OSError, json.JSONDecodeError):
-            continue
-        chat_id = data.get("id") or path.stem
-        updated_at = data.get("updated_at") or data.get("created_at")
-        chats.append(
-            {
-                "id": chat_id,
-                "name": data.get("name") or "Untitled",
-                "whitelist": data.get("whitelist"),
-                "created_at": data.get("created_at"),
-                "updated_at": updated_at,
-                "_mtime": path.stat().st_mtime,
-            }
-        )
+def list_chats(limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    """Chat summaries, most recently updated first."""
+    with _timed("list"):
+        return _backend().list_chats(limit=limit, offset=offset)
+
+
+def count_chats() -> int:
+    return _backend().count_chats()
+
+
+def chat_exists(chat_id: str) -> bool:
+    return _backend().chat_exists(chat_id)
 
-    def sort_key(item: Dict[str, Any]) -> float:
-        parsed = _parse_iso(item.get("updated_at")) or _parse_iso(item.get("created_at"))
-        if parsed:
-            return parsed.timestamp()
-        return item.get("_mtime", 0.0)
 
-    chats.sort(key=sort_key, reverse=True)
-    return chats
+def search_chats(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Chat summaries whose messages match ``query``, each with a ``snippet``."""
+    with _timed("search"):
+        return _backend().search_chats(query, limit=limit)
@@ -0,0 +1,988 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from chat_store import _now_iso, ensure_chat_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are excluded
+    fcntl = None
+
+# Chats are stored as append-only JSONL logs: a header line followed by one
+# event per line. Older releases wrote a single pretty-printed .json file.
+LOG_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+# Compressed logs (CHAT_STORE_COMPRESS): the same header line, uncompressed so
+# listing never inflates anything, followed by gzip members of events. Each
+# save appends one member; rewrites pack up to MEMBER_BYTES of events per
+# member so messages can be streamed a member at a time.
+COMPRESSED_SUFFIX = ".jsonlz"
+MEMBER_BYTES = 64 * 1024
+COMPRESS_LEVEL = 6
+COMPACT_AFTER_MEMBERS = 64
+READ_SIZE = 64 * 1024
+# Logs go into subdirectories named by a prefix of their id's hash, so a
+# user's directory never holds more than a few hundred chats.
+SHARD_CHARS = 2
+# The manifest lives in a subdirectory so rewriting it doesn't touch the chat
+# directories' mtimes, which is what we use to detect out-of-band changes.
+INDEX_DIR_NAME = ".index"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "lock"
+MANIFEST_VERSION = 3
+# Rewrite a log once it carries this many superseded metadata events.
+COMPACT_AFTER_META_EVENTS = 32
+MAX_CACHED_LOGS = 256
+
+_store_lock = threading.RLock()
+# The advisory lock file held by the thread in _store_lock, and how deeply
+_lock_file = None
+_lock_depth = 0
+# manifest path -> (mtime_ns, parsed manifest) so reruns skip even the read
+_manifest_cache: "OrderedDict[str, Any]" = OrderedDict()
+# log path -> replayed log state, so appends don't need to re-read the file
+_log_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Chat directories whose pre-sharding chats this process has moved already
+_sharded_dirs: Set[str] = set()
+
+_META_PREFIX = b'{"type":"meta"'
+_MESSAGE_PREFIX = b'{"type":"message"'
+
+
+def _user_chat_dir() -> Path:
+    """The current user's chat directory, with chats saved before sharding
+    moved into their shards on first use, so they can be opened directly."""
+    chat_dir = ensure_chat_dir()
+    if str(chat_dir) not in _sharded_dirs:
+        with _store_lock:
+            if str(chat_dir) not in _sharded_dirs:
+                _move_unsharded_chats(chat_dir)
+                _sharded_dirs.add(str(chat_dir))
+    return chat_dir
+
+
+def _shard(chat_id: str) -> str:
+    return hashlib.sha256(chat_id.encode("utf-8")).hexdigest()[:SHARD_CHARS]
+
+
+def _is_shard(name: str) -> bool:
+    return len(name) == SHARD_CHARS and all(c in "0123456789abcdef" for c in name)
+
+
+def _compress() -> bool:
+    return os.environ.get("CHAT_STORE_COMPRESS", "").lower() in ("1", "true", "yes")
+
+
+def _log_paths(chat_id: str) -> Tuple[Path, Path]:
+    shard_dir = _user_chat_dir() / _shard(chat_id)
+    return (
+        shard_dir / f"{chat_id}{LOG_SUFFIX}",
+        shard_dir / f"{chat_id}{COMPRESSED_SUFFIX}",
+    )
+
+
+def _new_log_path(chat_id: str) -> Path:
+    return _log_paths(chat_id)[1 if _compress() else 0]
+
+
+def _chat_path(chat_id: str) -> Path:
+    """The chat's log in whichever format it has, else where a new one goes.
+
+    Existing logs keep their format until they are next rewritten.
+    """
+    for path in _log_paths(chat_id):
+        if path.exists():
+            return path
+    return _new_log_path(chat_id)
+
+
+def _is_compressed(path: Path) -> bool:
+    return path.suffix == COMPRESSED_SUFFIX
+
+
+def _legacy_chat_path(chat_id: str) -> Path:
+    return _user_chat_dir() / _shard(chat_id) / f"{chat_id}{LEGACY_SUFFIX}"
+
+
+def _index_dir() -> Path:
+    index_dir = _user_chat_dir() / INDEX_DIR_NAME
+    index_dir.mkdir(exist_ok=True)
+    return index_dir
+
+
+def _manifest_path() -> Path:
+    return _index_dir() / MANIFEST_NAME
+
+
+@contextmanager
+def _locked() -> Iterator[None]:
+    """_store_lock plus an advisory lock on the user's chat directory, so
+    writers in other processes wait too. Reentrant, like _store_lock."""
+    global _lock_file, _lock_depth
+    with _store_lock:
+        if _lock_depth == 0:
+            _lock_file = (_index_dir() / LOCK_NAME).open("a+b")
+            if fcntl is not None:
+                fcntl.flock(_lock_file.fileno(), fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                # Closing the file releases the flock.
+                _lock_file.close()
+                _lock_file = None
+
+
+def _fsync_dir(path: Path) -> None:
+    # Makes a rename in the directory durable; directories can't be opened
+    # for this on Windows.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Replace path's contents through a synced temp file and a rename, so
+    readers (and a restart after a crash) see the old file or the new one."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(
+        f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    with tmp_path.open("wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+def _mtime_iso(mtime: float) -> str:
+    return datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
+
+
+def _encode_event(event: Dict[str, Any]) -> bytes:
+    # Compact separators keep lines small and make _META_PREFIX stable.
+    return (
+        json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+    ).encode("utf-8")
+
+
+def _header_event(chat_id: str, meta: Dict[str, Any], created_at: str):
+    return {"type": "header", "id": chat_id, **meta, "created_at": created_at}
+
+
+def _meta_event(meta: Dict[str, Any]) -> Dict[str, Any]:
+    # "type" goes first so _META_PREFIX can spot these lines unparsed.
+    return dict({"type": "meta"}, **meta)
+
+
+def _chat_meta(
+    name: str, whitelist: str, metadata: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    return {"name": name, "whitelist": whitelist, "metadata": metadata or {}}
+
+
+def _message_event(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "message", "message": message}
+
+
+def _replay_log(path: Path) -> Optional[Dict[str, Any]]:
+    """Rebuild a chat from its log, remembering where each message starts."""
+    if _is_compressed(path):
+        return _replay_compressed_log(path)
+    try:
+        data = path.read_bytes()
+        stat = path.stat()
+    except OSError:
+        return None
+    state: Dict[str, Any] = {"messages": [], "offsets": [], "meta_events": 0}
+    offset = 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            # Torn write from a crash; the next append overwrites it.
+            break
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            break
+        kind = event.get("type") if isinstance(event, dict) else None
+        if kind == "header" and offset == 0:
+            state.update(
+                id=event.get("id") or path.stem,
+                name=event.get("name"),
+                whitelist=event.get("whitelist"),
+                metadata=event.get("metadata") or {},
+                created_at=event.get("created_at"),
+            )
+        elif "id" not in state:
+            return None
+        elif kind == "message":
+            state["offsets"].append(offset)
+            state["messages"].append(event.get("message"))
+        elif kind == "meta":
+            state["name"] = event.get("name")
+            state["whitelist"] = event.get("whitelist")
+            state["metadata"] = event.get("metadata") or {}
+            state["meta_events"] += 1
+        offset += len(line)
+    if "id" not in state:
+        return None
+    state.update(size=offset, mtime_ns=stat.st_mtime_ns, mtime=stat.st_mtime)
+    return state
+
+
+def _read_header(fh) -> Optional[Dict[str, Any]]:
+    try:
+        header = json.loads(fh.readline())
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(header, dict) or header.get("type") != "header":
+        return None
+    return header
+
+
+def _read_log_summary(path: Path) -> Optional[Dict[str, Any]]:
+    """Header plus latest metadata, without parsing any message lines."""
+    summary = None
+    try:
+        with path.open("rb") as fh:
+            header = _read_header(fh)
+            if header is None:
+                return None
+            summary = dict(header)
+            if _is_compressed(path):
+                # Renames rewrite compressed logs, so the header is current.
+                return summary
+            for line in fh:
+                if line.startswith(_META_PREFIX) and line.endswith(b"\n"):
+                    try:
+                        meta = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    summary["name"] = meta.get("name")
+                    summary["whitelist"] = meta.get("whitelist")
+    except OSError:
+        return None
+    return summary
+
+
+def _read_log_tail(path: Path, tail: int) -> Optional[Dict[str, Any]]:
+    """Header, latest metadata and the last ``tail`` messages of a log.
+
+    Only those lines are parsed; the rest of the file is skipped by scanning
+    for line prefixes, so opening a long chat doesn't decode every message.
+    """
+    if _is_compressed(path):
+        return _read_compressed_tail(path, tail)
+    try:
+        data = path.read_bytes()
+        stat = path.stat()
+    except OSError:
+        return None
+    # Ignore a torn trailing line, like _replay_log.
+    end = data.rfind(b"\n") + 1
+    header_end = data.find(b"\n") + 1
+    if header_end == 0:
+        return None
+    try:
+        header = json.loads(data[:header_end])
+        meta_start = data.rfind(b"\n" + _META_PREFIX, 0, end)
+        meta = header
+        if meta_start >= 0:
+            meta = json.loads(data[meta_start + 1 : data.find(b"\n", meta_start + 1)])
+        messages = []
+        pos = end
+        while len(messages) < tail and pos > header_end:
+            start = data.rfind(b"\n", 0, pos - 1) + 1
+            if data.startswith(_MESSAGE_PREFIX, start):
+                messages.append(json.loads(data[start:pos])["message"])
+            pos = start
+    except (ValueError, KeyError):
+        return None
+    if not isinstance(header, dict) or header.get("type") != "header":
+        return None
+    messages.reverse()
+    return {
+        "id": header.get("id") or path.stem,
+        "name": meta.get("name"),
+        "whitelist": meta.get("whitelist"),
+        "metadata": meta.get("metadata") or {},
+        "created_at": header.get("created_at"),
+        "mtime": stat.st_mtime,
+        "messages": messages,
+        "message_count": data.count(b"\n" + _MESSAGE_PREFIX, 0, end),
+    }
+
+
+def _gzip_members(chunks: List[bytes]) -> Tuple[bytes, int]:
+    """Events packed into gzip members of about MEMBER_BYTES each."""
+    members = []
+    group: List[bytes] = []
+    group_bytes = 0
+    for chunk in chunks:
+        group.append(chunk)
+        group_bytes += len(chunk)
+        if group_bytes >= MEMBER_BYTES:
+            members.append(gzip.compress(b"".join(group), COMPRESS_LEVEL, mtime=0))
+            group, group_bytes = [], 0
+    if group:
+        members.append(gzip.compress(b"".join(group), COMPRESS_LEVEL, mtime=0))
+    return b"".join(members), len(members)
+
+
+def _iter_members(fh, offset: int) -> Iterator[Tuple[List[bytes], int]]:
+    """(event lines, end offset) of each complete gzip member from offset on.
+
+    Decompresses as it reads; a member torn by a crash is never yielded.
+    """
+    decompressor = zlib.decompressobj(wbits=31)
+    member_start = offset
+    lines: List[bytes] = []
+    pending = b""
+    while True:
+        data = fh.read(READ_SIZE)
+        if not data:
+            return
+        while data:
+            try:
+                text = decompressor.decompress(data)
+            except zlib.error:
+                return
+            *complete, pending = (pending + text).split(b"\n")
+            lines += [line + b"\n" for line in complete]
+            if not decompressor.eof:
+                member_start += len(data)
+                break
+            unused = decompressor.unused_data
+            member_start += len(data) - len(unused)
+            yield lines, member_start
+            decompressor = zlib.decompressobj(wbits=31)
+            lines, pending, data = [], b"", unused
+
+
+def _replay_compressed_log(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        stat = path.stat()
+        with path.open("rb") as fh:
+            header = _read_header(fh)
+            if header is None:
+                return None
+            state: Dict[str, Any] = {
+                "id": header.get("id") or path.stem,
+                "name": header.get("name"),
+                "whitelist": header.get("whitelist"),
+                "metadata": header.get("metadata") or {},
+                "created_at": header.get("created_at"),
+                "messages": [],
+                "offsets": [],
+                "meta_events": 0,
+                "members": 0,
+            }
+            size = fh.tell()
+            for lines, size in _iter_members(fh, size):
+                state["members"] += 1
+                for line in lines:
+                    event = json.loads(line)
+                    if line.startswith(_MESSAGE_PREFIX):
+                        state["messages"].append(event.get("message"))
+                    elif line.startswith(_META_PREFIX):
+                        state["metadata"] = event.get("metadata") or {}
+                        state["meta_events"] += 1
+    except (OSError, ValueError):
+        return None
+    state.update(size=size, mtime_ns=stat.st_mtime_ns, mtime=stat.st_mtime)
+    return state
+
+
+def _read_compressed_tail(path: Path, tail: int) -> Optional[Dict[str, Any]]:
+    # Members can only be read front to back, but only the last ``tail``
+    # messages are kept and parsed.
+    try:
+        stat = path.stat()
+        with path.open("rb") as fh:
+            header = _read_header(fh)
+            if header is None:
+                return None
+            metadata = header.get("metadata") or {}
+            last_lines: deque = deque(maxlen=tail or None)
+            count = 0
+            for lines, _ in _iter_members(fh, fh.tell()):
+                for line in lines:
+                    if line.startswith(_MESSAGE_PREFIX):
+                        count += 1
+                        if tail:
+                            last_lines.append(line)
+                    elif line.startswith(_META_PREFIX):
+                        metadata = json.loads(line).get("metadata") or {}
+        messages = [json.loads(line)["message"] for line in last_lines]
+    except (OSError, ValueError, KeyError):
+        return None
+    return {
+        "id": header.get("id") or path.stem,
+        "name": header.get("name"),
+        "whitelist": header.get("whitelist"),
+        "metadata": metadata,
+        "created_at": header.get("created_at"),
+        "mtime": stat.st_mtime,
+        "messages": messages,
+        "message_count": count,
+    }
+
+
+def _remember_log(path: Path, state: Dict[str, Any]) -> None:
+    key = str(path)
+    _log_cache[key] = state
+    _log_cache.move_to_end(key)
+    while len(_log_cache) > MAX_CACHED_LOGS:
+        _log_cache.popitem(last=False)
+
+
+def _cached_log_state(path: Path, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+    # Another process may have appended since; size and mtime would differ.
+    state = _log_cache.get(str(path))
+    if (
+        state is not None
+        and state["size"] == stat.st_size
+        and state["mtime_ns"] == stat.st_mtime_ns
+    ):
+        _log_cache.move_to_end(str(path))
+        return state
+    return None
+
+
+def _log_state(chat_id: str) -> Optional[Dict[str, Any]]:
+    path = _chat_path(chat_id)
+    try:
+        stat = path.stat()
+    except OSError:
+        _log_cache.pop(str(path), None)
+        return None
+    state = _cached_log_state(path, stat)
+    if state is not None:
+        return state
+    state = _replay_log(path)
+    if state is not None:
+        _remember_log(path, state)
+    return state
+
+
+def _write_log(
+    chat_id: str,
+    meta: Dict[str, Any],
+    messages: List[Dict[str, Any]],
+    created_at: str,
+) -> Dict[str, Any]:
+    """Write a fresh, compacted log in one go (new chats, migration, compaction).
+
+    The log is written in the configured format, replacing one in the other.
+    """
+    path = _new_log_path(chat_id)
+    chunks = [_encode_event(_header_event(chat_id, meta, created_at))]
+    offsets = []
+    offset = len(chunks[0])
+    for message in messages:
+        chunk = _encode_event(_message_event(message))
+        offsets.append(offset)
+        offset += len(chunk)
+        chunks.append(chunk)
+    members = 0
+    if _is_compressed(path):
+        body, members = _gzip_members(chunks[1:])
+        offsets = []
+        offset = len(chunks[0]) + len(body)
+        chunks = [chunks[0], body]
+    _atomic_write(path, b"".join(chunks))
+    for other in _log_paths(chat_id):
+        if other != path and other.exists():
+            _log_cache.pop(str(other), None)
+            other.unlink()
+    stat = path.stat()
+    state = {
+        "id": chat_id,
+        **meta,
+        "created_at": created_at,
+        "messages": [dict(message) for message in messages],
+        "offsets": offsets,
+        "meta_events": 0,
+        "members": members,
+        "size": offset,
+        "mtime_ns": stat.st_mtime_ns,
+        "mtime": stat.st_mtime,
+    }
+    _remember_log(path, state)
+    return state
+
+
+def _append_log(
+    chat_id: str,
+    state: Dict[str, Any],
+    meta: Dict[str, Any],
+    messages: List[Dict[str, Any]],
+) -> bool:
+    """Bring the log in line with ``messages`` by appending only what changed.
+
+    Messages are only ever added or dropped at the end of a conversation, so
+    everything after the first differing message is cut off the file and
+    rewritten. Returns False when there was nothing to write.
+
+    Compressed logs only take appends; see _needs_rewrite.
+    """
+    persisted = state["messages"]
+    common = _common_prefix(persisted, messages)
+    truncated = common < len(persisted)
+    meta_changed = any(state.get(key) != value for key, value in meta.items())
+    if not truncated and common == len(messages) and not meta_changed:
+        return False
+
+    write_at = state["offsets"][common] if truncated else state["size"]
+    chunks = []
+    offsets = state["offsets"][:common]
+    offset = write_at
+    for message in messages[common:]:
+        chunk = _encode_event(_message_event(message))
+        offsets.append(offset)
+        offset += len(chunk)
+        chunks.append(chunk)
+    # Truncation may have dropped earlier metadata events, so restate it.
+    meta_events = state["meta_events"]
+    if meta_changed or truncated:
+        chunk = _encode_event(_meta_event(meta))
+        offset += len(chunk)
+        chunks.append(chunk)
+        meta_events += 1
+
+    path = _chat_path(chat_id)
+    data = b"".join(chunks)
+    members = state.get("members", 0)
+    if _is_compressed(path):
+        data, added = _gzip_members([data])
+        offsets = []
+        offset = write_at + len(data)
+        members += added
+    # Appends stay in place rather than rewriting the whole log; a crash
+    # can at worst leave a torn last line or member, which replay drops.
+    with path.open("r+b") as fh:
+        fh.seek(write_at)
+        fh.truncate()
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    stat = path.stat()
+    state.update(
+        meta,
+        messages=persisted[:common]
+        + [dict(message) for message in messages[common:]],
+        offsets=offsets,
+        meta_events=meta_events,
+        members=members,
+        size=offset,
+        mtime_ns=stat.st_mtime_ns,
+        mtime=stat.st_mtime,
+    )
+    return True
+
+
+def _common_prefix(
+    persisted: List[Dict[str, Any]], messages: List[Dict[str, Any]]
+) -> int:
+    common = 0
+    limit = min(len(persisted), len(messages))
+    while common < limit and persisted[common] == messages[common]:
+        common += 1
+    return common
+
+
+def _needs_rewrite(
+    path: Path,
+    state: Dict[str, Any],
+    meta: Dict[str, Any],
+    messages: List[Dict[str, Any]],
+) -> bool:
+    if state["meta_events"] >= COMPACT_AFTER_META_EVENTS:
+        return True
+    if not _is_compressed(path):
+        return False
+    # Compressed logs can't be cut mid-member, and their header must keep
+    # the current name for listing.
+    return (
+        state.get("members", 0) >= COMPACT_AFTER_MEMBERS
+        or _common_prefix(state["messages"], messages) < len(state["messages"])
+        or state.get("name") != meta["name"]
+        or state.get("whitelist") != meta["whitelist"]
+    )
+
+
+def _state_to_chat(
+    state: Dict[str, Any], messages: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    return {
+        "id": state["id"],
+        "name": state.get("name") or "Untitled",
+        "whitelist": state.get("whitelist"),
+        "metadata": state.get("metadata") or {},
+        "created_at": state.get("created_at"),
+        "updated_at": _mtime_iso(state["mtime"]),
+        "messages": messages,
+    }
+
+
+def _summary_entry(data: Dict[str, Any], path: Path) -> Dict[str, Any]:
+    stat = path.stat()
+    created_at = data.get("created_at")
+    return {
+        "id": data.get("id") or path.name.split(".", 1)[0],
+        "name": data.get("name") or "Untitled",
+        "whitelist": data.get("whitelist"),
+        "created_at": created_at,
+        "updated_at": data.get("updated_at") or _mtime_iso(stat.st_mtime),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _sort_entries(entries: List[Dict[str, Any]]) -> None:
+    # ISO timestamps written by this module sort correctly as strings.
+    entries.sort(key=lambda entry: entry.get("updated_at") or "", reverse=True)
+
+
+def _remember_manifest(path: Path, mtime_ns: int, manifest: Dict[str, Any]) -> None:
+    _manifest_cache[str(path)] = (mtime_ns, manifest)
+    _manifest_cache.move_to_end(str(path))
+    while len(_manifest_cache) > MAX_CACHED_LOGS:
+        _manifest_cache.popitem(last=False)
+
+
+def _write_manifest(manifest: Dict[str, Any]) -> None:
+    path = _manifest_path()
+    _atomic_write(path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    _remember_manifest(path, path.stat().st_mtime_ns, manifest)
+
+
+def _read_manifest() -> Optional[Dict[str, Any]]:
+    path = _manifest_path()
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    cached = _manifest_cache.get(str(path))
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if (
+        not isinstance(manifest, dict)
+        or manifest.get("version") != MANIFEST_VERSION
+        or not isinstance(manifest.get("chats"), list)
+    ):
+        return None
+    _remember_manifest(path, mtime_ns, manifest)
+    return manifest
+
+
+def _scan_chat_file(path: Path) -> Optional[Dict[str, Any]]:
+    if path.suffix in (LOG_SUFFIX, COMPRESSED_SUFFIX):
+        data = _read_log_summary(path)
+        if data is not None:
+            # Logs don't store updated_at; the last write time is authoritative.
+            data.pop("updated_at", None)
+    else:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+    if not isinstance(data, dict):
+        return None
+    return _summary_entry(data, path)
+
+
+def _dir_mtimes(chat_dir: Path) -> Dict[str, int]:
+    """mtimes of the chat directory and its shards; any chat file added or
+    removed, by this module or not, changes one of them."""
+    mtimes = {"": chat_dir.stat().st_mtime_ns}
+    with os.scandir(chat_dir) as entries:
+        for entry in entries:
+            if _is_shard(entry.name) and entry.is_dir():
+                mtimes[entry.name] = entry.stat().st_mtime_ns
+    return mtimes
+
+
+def _move_unsharded_chats(chat_dir: Path) -> None:
+    # Chats saved before sharding sit directly in the chat directory.
+    for pattern in (f"*{LEGACY_SUFFIX}", f"*{LOG_SUFFIX}"):
+        for path in chat_dir.glob(pattern):
+            shard_dir = chat_dir / _shard(path.stem)
+            shard_dir.mkdir(exist_ok=True)
+            if (shard_dir / path.name).exists():
+                # Never replace a sharded chat with an older copy.
+                continue
+            try:
+                os.replace(path, shard_dir / path.name)
+            except FileNotFoundError:
+                # Another process moved it first.
+                continue
+
+
+def _rebuild_manifest(previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Re-scan the chat directory, re-reading only files whose mtime changed."""
+    chat_dir = _user_chat_dir()
+    known = {}
+    if previous:
+        known = {entry["id"]: entry for entry in previous.get("chats", [])}
+    dir_mtimes = _dir_mtimes(chat_dir)
+    paths: Dict[str, Path] = {}
+    for shard in dir_mtimes:
+        if not shard:
+            continue
+        for path in (chat_dir / shard).glob(f"*{LEGACY_SUFFIX}"):
+            paths.setdefault(path.stem, path)
+        # A log supersedes a legacy file that wasn't cleaned up yet.
+        for suffix in (LOG_SUFFIX, COMPRESSED_SUFFIX):
+            for path in (chat_dir / shard).glob(f"*{suffix}"):
+                paths[path.stem] = path
+    entries = []
+    for chat_id, path in paths.items():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entry = known.get(chat_id)
+        if entry and entry.get("mtime_ns") == stat.st_mtime_ns:
+            entries.append(entry)
+            continue
+        try:
+            entry = _scan_chat_file(path)
+        except OSError:
+            entry = None
+        if entry is not None:
+            entries.append(entry)
+    _sort_entries(entries)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "dir_mtimes": dir_mtimes,
+        "chats": entries,
+    }
+    _write_manifest(manifest)
+    return manifest
+
+
+def _load_manifest() -> Dict[str, Any]:
+    manifest = _read_manifest()
+    if manifest is None:
+        return _rebuild_manifest()
+    if manifest.get("dir_mtimes") != _dir_mtimes(_user_chat_dir()):
+        # Chats were added or removed without going through this module.
+        return _rebuild_manifest(manifest)
+    return manifest
+
+
+def _update_manifest(chat_id: str, entry: Optional[Dict[str, Any]]) -> None:
+    with _locked():
+        manifest = _load_manifest()
+        chats = [item for item in manifest["chats"] if item["id"] != chat_id]
+        if entry is not None:
+            # Saved chats always carry the newest timestamp, so they go first.
+            chats.insert(0, entry)
+        _write_manifest(
+            {
+                "version": MANIFEST_VERSION,
+                "dir_mtimes": _dir_mtimes(_user_chat_dir()),
+                "chats": chats,
+            }
+        )
+
+
+def _load_legacy_chat(chat_id: str) -> Optional[Dict[str, Any]]:
+    path = _legacy_chat_path(chat_id)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def load_chat(chat_id: str, tail: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    if tail is not None:
+        path = _chat_path(chat_id)
+        with _locked():
+            try:
+                state = _cached_log_state(path, path.stat())
+            except OSError:
+                state = None
+            if state is None:
+                partial = _read_log_tail(path, tail)
+                if partial is not None:
+                    chat = _state_to_chat(partial, partial["messages"])
+                    chat["message_count"] = partial["message_count"]
+                    return chat
+    chat = None
+    with _locked():
+        state = _log_state(chat_id)
+    if state is not None:
+        # Hand out copies so callers can't mutate the cached log state.
+        messages = [dict(message) for message in state["messages"]]
+        chat = _state_to_chat(state, messages)
+    else:
+        chat = _load_legacy_chat(chat_id)
+    if chat is not None and tail is not None:
+        chat["message_count"] = len(chat["messages"])
+        chat["messages"] = chat["messages"][-tail:] if tail else []
+    return chat
+
+
+def save_chat(
+    chat_id: str,
+    name: str,
+    messages: List[Dict[str, Any]],
+    whitelist: str,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    name = name or "Untitled"
+    with _locked():
+        state = _log_state(chat_id)
+        if state is None:
+            # New chat, or a legacy .json chat being migrated to a log.
+            legacy = _load_legacy_chat(chat_id) or {}
+            if metadata is None:
+                metadata = legacy.get("metadata")
+            state = _write_log(
+                chat_id,
+                _chat_meta(name, whitelist, metadata),
+                messages,
+                legacy.get("created_at") or _now_iso(),
+            )
+            legacy_path = _legacy_chat_path(chat_id)
+            if legacy_path.exists():
+                legacy_path.unlink()
+            changed = True
+        else:
+            if metadata is None:
+                metadata = state.get("metadata")
+            meta = _chat_meta(name, whitelist, metadata)
+            if _needs_rewrite(_chat_path(chat_id), state, meta, messages):
+                state = _write_log(chat_id, meta, messages, state["created_at"])
+                changed = True
+            else:
+                changed = _append_log(chat_id, state, meta, messages)
+        chat = _state_to_chat(state, messages)
+        if changed:
+            _update_manifest(chat_id, _summary_entry(chat, _chat_path(chat_id)))
+    return chat
+
+
+def delete_chat(chat_id: str) -> bool:
+    deleted = False
+    with _locked():
+        for path in (*_log_paths(chat_id), _legacy_chat_path(chat_id)):
+            _log_cache.pop(str(path), None)
+            if not path.exists():
+                continue
+            try:
+                path.unlink()
+                deleted = True
+            except OSError:
+                continue
+        if deleted:
+            _update_manifest(chat_id, None)
+    return deleted
+
+
+def list_chats(limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    with _locked():
+        manifest = _load_manifest()
+    end = None if limit is None else offset + limit
+    return [dict(entry) for entry in manifest["chats"][offset:end]]
+
+
+def count_chats() -> int:
+    with _locked():
+        return len(_load_manifest()["chats"])
+
+
+def chat_exists(chat_id: str) -> bool:
+    return any(
+        path.exists() for path in (*_log_paths(chat_id), _legacy_chat_path(chat_id))
+    )
+
+
+def iter_messages(chat_id: str) -> Iterator[Dict[str, Any]]:
+    """The chat's messages, parsed one at a time as the log is read.
+
+    Compressed logs are inflated a member at a time, so a long chat is never
+    decompressed into memory at once.
+    """
+    path = _chat_path(chat_id)
+    try:
+        stat = path.stat()
+    except OSError:
+        legacy = _load_legacy_chat(chat_id) or {}
+        yield from legacy.get("messages") or []
+        return
+    with _locked():
+        state = _cached_log_state(path, stat)
+    if state is not None:
+        for message in state["messages"]:
+            yield dict(message)
+        return
+    try:
+        with path.open("rb") as fh:
+            if _read_header(fh) is None:
+                return
+            if _is_compressed(path):
+                batches = (lines for lines, _ in _iter_members(fh, fh.tell()))
+            else:
+                # A torn last line has no newline; _replay_log drops it too.
+                batches = ([line] for line in fh if line.endswith(b"\n"))
+            for lines in batches:
+                for line in lines:
+                    if line.startswith(_MESSAGE_PREFIX):
+                        yield json.loads(line)["message"]
+    except (OSError, ValueError, KeyError):
+        return
+
+
+def search_chats(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    # No index on disk: scan conversations newest first. Use the sqlite
+    # backend when history is large enough for this to matter.
+    needle = query.strip().lower()
+    if not needle:
+        return []
+    results = []
+    for summary in list_chats():
+        # Stops reading a chat at its first match.
+        for message in iter_messages(summary["id"]):
+            if message.get("role") not in ("user", "assistant"):
+                continue
+            content = str(message.get("content", ""))
+            position = content.lower().find(needle)
+            if position < 0:
+                continue
+            start = max(position - 40, 0)
+            results.append(
+                dict(summary, snippet=content[start : position + len(needle) + 40])
+            )
+            break
+        if len(results) >= limit:
+            break
+    return results
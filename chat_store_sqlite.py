@@ -0,0 +1,398 @@
+import json
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import chat_store
+from chat_store import _now_iso, ensure_chat_dir
+
+DB_NAME = "chats.sqlite3"
+BUSY_TIMEOUT_MS = 5000
+MAX_CACHED_CHATS = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    whitelist TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS chats_updated_at ON chats (updated_at DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role TEXT,
+    content TEXT,
+    data TEXT NOT NULL,
+    UNIQUE (chat_id, position)
+);
+"""
+
+# Only user/assistant turns are searchable; the system prompt would match
+# every chat on its topic.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+WHEN new.role IN ('user', 'assistant') BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+WHEN old.role IN ('user', 'assistant') BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content)
+    VALUES ('delete', old.id, old.content);
+END;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready: Dict[str, bool] = {}
+# (database, chat_id) -> (revision, messages) so a save only diffs against
+# memory
+_message_cache: "OrderedDict[Tuple[str, str], Tuple[int, List[Dict]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _db_path() -> str:
+    return str(ensure_chat_dir() / DB_NAME)
+
+
+def _connect() -> sqlite3.Connection:
+    # sqlite3 connections can't be shared across threads, and every Streamlit
+    # session runs on its own thread, so keep one connection per thread (and
+    # per user database it has used).
+    path = _db_path()
+    if not hasattr(_local, "conns"):
+        _local.conns = {}
+    conn = _local.conns.get(path)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    with _schema_lock:
+        if path not in _schema_ready:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(chats)")}
+            if "metadata" not in columns:
+                # Databases created before chat metadata existed.
+                conn.execute("ALTER TABLE chats ADD COLUMN metadata TEXT")
+            try:
+                conn.executescript(FTS_SCHEMA)
+                _schema_ready[path] = True
+            except sqlite3.OperationalError:
+                # This sqlite build has no FTS5; search falls back to LIKE.
+                _schema_ready[path] = False
+    _local.conns[path] = conn
+    return conn
+
+
+def _fts_enabled() -> bool:
+    _connect()
+    return _schema_ready.get(_db_path(), False)
+
+
+def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "whitelist": row["whitelist"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "message_count": row["message_count"],
+    }
+
+
+def _cached_messages(chat_id: str, revision: int) -> Optional[List[Dict[str, Any]]]:
+    key = (_db_path(), chat_id)
+    with _cache_lock:
+        cached = _message_cache.get(key)
+        if cached is None or cached[0] != revision:
+            return None
+        _message_cache.move_to_end(key)
+        return cached[1]
+
+
+def _remember_messages(
+    chat_id: str, revision: int, messages: List[Dict[str, Any]]
+) -> None:
+    key = (_db_path(), chat_id)
+    with _cache_lock:
+        _message_cache[key] = (revision, messages)
+        _message_cache.move_to_end(key)
+        while len(_message_cache) > MAX_CACHED_CHATS:
+            _message_cache.popitem(last=False)
+
+
+def iter_messages(chat_id: str) -> Iterator[Dict[str, Any]]:
+    rows = _connect().execute(
+        "SELECT data FROM messages WHERE chat_id = ? ORDER BY position", (chat_id,)
+    )
+    for row in rows:
+        yield json.loads(row["data"])
+
+
+def _read_messages(conn: sqlite3.Connection, chat_id: str) -> List[Dict[str, Any]]:
+    rows = conn.execute(
+        "SELECT data FROM messages WHERE chat_id = ? ORDER BY position", (chat_id,)
+    )
+    return [json.loads(row["data"]) for row in rows]
+
+
+def load_chat(chat_id: str, tail: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    row = conn.execute("SELECT * FROM chats WHERE id = ?", (chat_id,)).fetchone()
+    if row is None:
+        return None
+    messages = _cached_messages(chat_id, row["revision"])
+    if messages is None:
+        if tail is not None:
+            rows = conn.execute(
+                "SELECT data FROM messages WHERE chat_id = ? "
+                "ORDER BY position DESC LIMIT ?",
+                (chat_id, tail),
+            ).fetchall()
+            messages = [json.loads(message["data"]) for message in reversed(rows)]
+        else:
+            messages = _read_messages(conn, chat_id)
+            _remember_messages(chat_id, row["revision"], messages)
+    elif tail is not None:
+        messages = messages[-tail:] if tail else []
+    chat = _summary(row)
+    if tail is None:
+        del chat["message_count"]
+    chat["metadata"] = json.loads(row["metadata"] or "{}")
+    chat["messages"] = [dict(message) for message in messages]
+    return chat
+
+
+def _save(
+    chat_id: str,
+    name: str,
+    messages: List[Dict[str, Any]],
+    whitelist: str,
+    metadata: Optional[Dict[str, Any]] = None,
+    created_at: Optional[str] = None,
+    updated_at: Optional[str] = None,
+) -> Dict[str, Any]:
+    conn = _connect()
+    now = _now_iso()
+    updated_at = updated_at or now
+    with conn:
+        row = conn.execute(
+            "SELECT created_at, revision FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        persisted: List[Dict[str, Any]] = []
+        revision = 0
+        if row is not None:
+            created_at = row["created_at"]
+            revision = row["revision"]
+            cached = _cached_messages(chat_id, revision)
+            persisted = cached if cached is not None else _read_messages(conn, chat_id)
+        # Only the tail that changed since the last save is rewritten.
+        common = 0
+        limit = min(len(persisted), len(messages))
+        while common < limit and persisted[common] == messages[common]:
+            common += 1
+        conn.execute(
+            """
+            INSERT INTO chats (id, name, whitelist, created_at, updated_at,
+                               message_count, revision, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                name = excluded.name,
+                whitelist = excluded.whitelist,
+                updated_at = excluded.updated_at,
+                message_count = excluded.message_count,
+                revision = chats.revision + 1,
+                metadata = COALESCE(excluded.metadata, chats.metadata)
+            """,
+            (
+                chat_id,
+                name or "Untitled",
+                whitelist,
+                created_at or now,
+                updated_at,
+                len(messages),
+                None if metadata is None else json.dumps(metadata, ensure_ascii=False),
+            ),
+        )
+        if common < len(persisted):
+            conn.execute(
+                "DELETE FROM messages WHERE chat_id = ? AND position >= ?",
+                (chat_id, common),
+            )
+        conn.executemany(
+            "INSERT INTO messages (chat_id, position, role, content, data)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    chat_id,
+                    position,
+                    message.get("role"),
+                    str(message.get("content", "")),
+                    json.dumps(message, ensure_ascii=False),
+                )
+                for position, message in enumerate(messages[common:], start=common)
+            ],
+        )
+    _remember_messages(
+        chat_id,
+        revision + 1,
+        persisted[:common] + [dict(message) for message in messages[common:]],
+    )
+    return {
+        "id": chat_id,
+        "name": name or "Untitled",
+        "whitelist": whitelist,
+        "created_at": created_at or now,
+        "updated_at": updated_at,
+        "messages": messages,
+    }
+
+
+def save_chat(
+    chat_id: str,
+    name: str,
+    messages: List[Dict[str, Any]],
+    whitelist: str,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return _save(chat_id, name, messages, whitelist, metadata)
+
+
+def delete_chat(chat_id: str) -> bool:
+    conn = _connect()
+    with conn:
+        # Delete messages explicitly so the FTS triggers fire.
+        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+        deleted = conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount
+    with _cache_lock:
+        _message_cache.pop((_db_path(), chat_id), None)
+    return deleted > 0
+
+
+def list_chats(limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    rows = _connect().execute(
+        "SELECT * FROM chats ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+        (-1 if limit is None else limit, offset),
+    )
+    return [_summary(row) for row in rows]
+
+
+def count_chats() -> int:
+    return _connect().execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+
+def chat_exists(chat_id: str) -> bool:
+    row = _connect().execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,))
+    return row.fetchone() is not None
+
+
+def _fts_query(query: str) -> str:
+    # Quote every term so user input can't be parsed as FTS5 syntax; the last
+    # term is a prefix match so results show up while typing.
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_chats(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    query = query.strip()
+    if not query:
+        return []
+    conn = _connect()
+    if _fts_enabled():
+        rows = conn.execute(
+            """
+            SELECT c.*, snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            JOIN chats c ON c.id = m.chat_id
+            WHERE messages_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (_fts_query(query), limit * 5),
+        )
+    else:
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = conn.execute(
+            """
+            SELECT c.*, substr(m.content, 1, 120) AS snippet
+            FROM messages m
+            JOIN chats c ON c.id = m.chat_id
+            WHERE m.role IN ('user', 'assistant')
+              AND m.content LIKE ? ESCAPE '\\'
+            ORDER BY c.updated_at DESC
+            LIMIT ?
+            """,
+            (f"%{escaped}%", limit * 5),
+        )
+    results: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if row["id"] in results:
+            continue
+        results[row["id"]] = dict(_summary(row), snippet=row["snippet"])
+        if len(results) >= limit:
+            break
+    return list(results.values())
+
+
+def import_json_chats() -> int:
+    """Copy the current user's chats from the flat-file store into their
+    sqlite database; returns the count.
+
+    Chats already in the database are left alone, so re-running is safe.
+    """
+    import chat_store_files
+
+    imported = 0
+    for summary in chat_store_files.list_chats():
+        if chat_exists(summary["id"]):
+            continue
+        chat = chat_store_files.load_chat(summary["id"])
+        if not chat:
+            continue
+        messages = chat.get("messages")
+        _save(
+            summary["id"],
+            chat.get("name") or "Untitled",
+            messages if isinstance(messages, list) else [],
+            chat.get("whitelist"),
+            metadata=chat.get("metadata"),
+            created_at=chat.get("created_at"),
+            updated_at=summary.get("updated_at"),
+        )
+        imported += 1
+    return imported
+
+
+def import_all_json_chats() -> Dict[str, int]:
+    """import_json_chats for the shared namespace and every user's chats,
+    each into its own database; returns the count per database."""
+    imported = {}
+    with chat_store.as_user(None):
+        imported[_db_path()] = import_json_chats()
+    for path in chat_store.user_dirs():
+        with chat_store.in_user_dir(path):
+            imported[_db_path()] = import_json_chats()
+    return imported
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["import"]:
+        sys.exit(f"usage: {sys.argv[0]} import")
+    for db_path, count in import_all_json_chats().items():
+        print(f"Imported {count} chats into {db_path}")
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+
+# Pool settings; Streamlit exports top-level secrets as environment variables.
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 32))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 16))
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 60))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_READ_TIMEOUT", 600))
+
+_lock = threading.Lock()
+# One client (and so one connection pool) per API key, shared by every
+# Streamlit session and worker thread in the process. openai clients are
+# thread-safe.
+_clients: Dict[str, openai.OpenAI] = {}
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _fingerprint(api_key: Optional[str]) -> str:
+    # Keys are never used as-is, so stats can be shown without leaking them.
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _record_response(fingerprint: str, response: httpx.Response) -> None:
+    stream = response.extensions.get("network_stream")
+    with _lock:
+        stats = _stats[fingerprint]
+        stats["requests"] += 1
+        if stream is None:
+            return
+        # The pool keeps a connection's stream alive while it is open; once
+        # closed it drops out of the set, so a new stream is never mistaken
+        # for a reused one and the set only holds open connections.
+        if stream in stats["_streams"]:
+            stats["connections_reused"] += 1
+        else:
+            stats["_streams"].add(stream)
+            stats["connections_opened"] += 1
+
+
+def _pool_settings() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(
+            READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS
+        ),
+    }
+
+
+def _init_stats(fingerprint: str) -> None:
+    # Caller holds _lock.
+    _stats.setdefault(
+        fingerprint,
+        {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "_streams": weakref.WeakSet(),
+        },
+    )
+
+
+def _build_client(api_key: Optional[str], fingerprint: str) -> openai.OpenAI:
+    http_client = openai.DefaultHttpxClient(
+        **_pool_settings(),
+        event_hooks={
+            "response": [lambda response: _record_response(fingerprint, response)]
+        },
+    )
+    if api_key:
+        return openai.OpenAI(api_key=api_key, http_client=http_client)
+    return openai.OpenAI(http_client=http_client)
+
+
+def get_client(api_key: Optional[str] = None) -> openai.OpenAI:
+    """The shared client for api_key (or the environment's default key)."""
+    fingerprint = _fingerprint(api_key)
+    client = _clients.get(fingerprint)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(fingerprint)
+        if client is None:
+            _init_stats(fingerprint)
+            client = _build_client(api_key, fingerprint)
+            _clients[fingerprint] = client
+    return client
+
+
+def new_async_client(
+    api_key: Optional[str] = None, max_retries: int = 2
+) -> openai.AsyncOpenAI:
+    """A fresh async client for api_key, counted in its connection_stats.
+
+    Async clients are tied to the event loop they first run in, so they
+    aren't shared; close them (``await client.close()``) when done.
+    """
+    fingerprint = _fingerprint(api_key)
+    with _lock:
+        _init_stats(fingerprint)
+
+    async def record_response(response: httpx.Response) -> None:
+        _record_response(fingerprint, response)
+
+    http_client = openai.DefaultAsyncHttpxClient(
+        **_pool_settings(), event_hooks={"response": [record_response]}
+    )
+    if api_key:
+        return openai.AsyncOpenAI(
+            api_key=api_key, http_client=http_client, max_retries=max_retries
+        )
+    return openai.AsyncOpenAI(http_client=http_client, max_retries=max_retries)
+
+
+def connection_stats(api_key: Optional[str] = None) -> Dict[str, int]:
+    """Request and connection counters for api_key's shared client."""
+    with _lock:
+        stats = _stats.get(_fingerprint(api_key))
+        if stats is None:
+            return {"requests": 0, "connections_opened": 0, "connections_reused": 0}
+        return {key: value for key, value in stats.items() if not key.startswith("_")}
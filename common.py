@@ -15,6 +15,9 @@ def manage_credentials():
                 ):
                     if "OPENAI_API_KEY" in st.secrets:
                         st.session_state["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
+                    # The username widget goes away after login, and its
+                    # state with it.
+                    st.session_state["user"] = st.session_state.username
                     st.success("Login Successful")
                 else:
                     st.error("Incorrect Username/Password")
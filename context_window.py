@@ -0,0 +1,121 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to a character estimate
+    tiktoken = None
+
+# Per-message framing the API adds on top of the content tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Room left for the rolling summary when deciding how many turns to keep
+SUMMARY_RESERVE_TOKENS = 600
+# Fraction of the budget to trim down to once it is exceeded
+TRIM_TARGET = 0.75
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, model: str = "") -> int:
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def message_tokens(message: Dict[str, Any], model: str = "") -> int:
+    return count_tokens(str(message.get("content", "")), model) + (
+        MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+def summary_message(summary: Dict[str, Any]) -> Dict[str, str]:
+    return {"role": "system", "content": SUMMARY_PREFIX + summary["text"]}
+
+
+def build_context(
+    messages: List[Dict[str, Any]],
+    pinned: List[Dict[str, Any]],
+    budget: int,
+    model: str = "",
+    summary: Optional[Dict[str, Any]] = None,
+    summarize: Optional[Callable[[Optional[str], List[Dict[str, Any]]], str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Dict[str, int]]:
+    """Fit a conversation into ``budget`` tokens.
+
+    ``messages[0]`` is the whitelist system prompt and is always kept. The
+    ``pinned`` system messages (e.g. the style prompt) go after the latest
+    message, so switching them doesn't change the cacheable prefix. The most
+    recent turns are kept verbatim; older ones are replaced by a rolling
+    summary. ``summary`` is the cached ``{"text", "covers"}`` record from the
+    previous turn, where ``covers`` counts the conversation messages (after
+    ``messages[0]``) it summarizes. ``summarize(previous_text, new_messages)``
+    extends it when more turns fall out of the window. If it returns None
+    (e.g. the summary request failed), those turns are dropped unsummarized
+    and the previous summary is kept, so the next turn tries again.
+
+    Returns the messages to send, the summary to cache, and stats.
+    """
+    head = [messages[0]]
+    conversation = messages[1:]
+    costs = [message_tokens(message, model) for message in conversation]
+    fixed = sum(message_tokens(message, model) for message in head + pinned)
+    stats = {
+        "context_tokens": fixed + sum(costs),
+        "trimmed_messages": 0,
+        "trimmed_tokens": 0,
+        "summary_tokens": 0,
+    }
+    if fixed + sum(costs) <= budget:
+        return head + conversation + pinned, summary, stats
+
+    if summary and not 0 < summary.get("covers", 0) < len(conversation):
+        # Written for a different history (e.g. messages were removed).
+        summary = None
+    covered = summary["covers"] if summary else 0
+    start = covered
+    if (
+        not summary
+        or fixed
+        + message_tokens(summary_message(summary), model)
+        + sum(costs[covered:])
+        > budget
+    ):
+        # Trim well below the budget so the next turns reuse this summary
+        # (and the cached prefix) instead of moving the window every turn.
+        available = int(budget * TRIM_TARGET) - fixed - SUMMARY_RESERVE_TOKENS
+        # Keep as many recent messages as fit, but always the latest one.
+        start = len(conversation) - 1
+        used = costs[start]
+        while start > covered and used + costs[start - 1] <= available:
+            start -= 1
+            used += costs[start]
+    if start > covered:
+        if summarize is None:
+            raise ValueError("history exceeds the budget and no summarizer given")
+        previous = summary["text"] if summary else None
+        text = summarize(previous, conversation[covered:start])
+        if text is not None:
+            summary = {"text": text, "covers": start}
+    if summary is None and start == 0:
+        # Only the latest message is left and it alone is over budget.
+        return head + conversation + pinned, None, stats
+
+    summary_messages = [summary_message(summary)] if summary else []
+    context = head + summary_messages + conversation[start:] + pinned
+    stats.update(
+        context_tokens=sum(message_tokens(message, model) for message in context),
+        trimmed_messages=start,
+        trimmed_tokens=sum(costs[:start]),
+        summary_tokens=sum(
+            message_tokens(message, model) for message in summary_messages
+        ),
+    )
+    return context, summary, stats
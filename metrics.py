@@ -0,0 +1,198 @@
+"""Latency and throughput metrics, one JSON line per timed call.
+
+Records go to a size-rotated file (metrics/metrics.jsonl plus numbered
+backups). Summaries and Prometheus text are computed from the files:
+
+    python metrics.py --prometheus > metrics.prom
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+METRICS_DIR_NAME = "metrics"
+METRICS_FILE_NAME = "metrics.jsonl"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_logger: Optional[logging.Logger] = None
+
+
+def _metrics_dir() -> Path:
+    return Path(
+        os.environ.get(
+            "METRICS_DIR", Path(__file__).resolve().parent / METRICS_DIR_NAME
+        )
+    )
+
+
+def enabled() -> bool:
+    return os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "")
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    with _lock:
+        if _logger is None:
+            _metrics_dir().mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                _metrics_dir() / METRICS_FILE_NAME,
+                maxBytes=int(os.environ.get("METRICS_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                backupCount=int(os.environ.get("METRICS_BACKUPS", DEFAULT_BACKUPS)),
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("whitelist_chat.metrics")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+def record(kind: str, **fields: Any) -> None:
+    """Append one measurement; never raises into the caller."""
+    if not enabled():
+        return
+    try:
+        line = json.dumps(
+            {"ts": round(time.time(), 3), "kind": kind, **fields}, default=str
+        )
+        _get_logger().info(line)
+    except Exception:
+        logging.getLogger("whitelist_chat").exception("failed to record metrics")
+
+
+@contextmanager
+def timer(kind: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block and record it; the block may add fields to the dict."""
+    started = time.perf_counter()
+    extra: Dict[str, Any] = {}
+    try:
+        yield extra
+    except BaseException as error:
+        extra["error"] = type(error).__name__
+        raise
+    finally:
+        seconds = round(time.perf_counter() - started, 6)
+        record(kind, **{**fields, **extra, "seconds": seconds})
+
+
+def _files() -> List[Path]:
+    base = _metrics_dir() / METRICS_FILE_NAME
+    backups = int(os.environ.get("METRICS_BACKUPS", DEFAULT_BACKUPS))
+    # Oldest first, so records come out in time order.
+    paths = [base.with_name(f"{base.name}.{n}") for n in range(backups, 0, -1)]
+    return [path for path in paths + [base] if path.exists()]
+
+
+def load(kind: Optional[str] = None, since: Optional[float] = None) -> List[Dict]:
+    records = []
+    for path in _files():
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if kind is not None and entry.get("kind") != kind:
+                continue
+            if since is not None and entry.get("ts", 0) < since:
+                continue
+            records.append(entry)
+    return records
+
+
+def quantile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank quantile of already sorted values."""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(
+    records: Iterable[Dict], group_by: Sequence[str], field: str = "seconds"
+) -> List[Dict[str, Any]]:
+    """Count, mean and p50/p95/p99 of ``field`` per ``group_by`` values."""
+    groups: Dict[tuple, List[float]] = {}
+    for entry in records:
+        value = entry.get(field)
+        if not isinstance(value, (int, float)):
+            continue
+        groups.setdefault(tuple(entry.get(key) for key in group_by), []).append(value)
+    rows = []
+    for key, values in sorted(groups.items(), key=lambda item: str(item[0])):
+        values.sort()
+        row = dict(zip(group_by, key))
+        row.update(count=len(values), mean=sum(values) / len(values))
+        for fraction in QUANTILES:
+            row[f"p{int(fraction * 100)}"] = quantile(values, fraction)
+        rows.append(row)
+    return rows
+
+
+# kind -> labels and fields exported as Prometheus summaries
+PROMETHEUS_SERIES = {
+    "chat": (("model", "request_mode"), ("seconds", "first_token_seconds")),
+    "tts": (("model",), ("seconds",)),
+    "convert": (("method", "output_format"), ("seconds",)),
+    "chat_store": (("backend", "op"), ("seconds",)),
+}
+
+
+def _label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(records: Optional[List[Dict]] = None) -> str:
+    """Prometheus text exposition of the recorded latencies."""
+    if records is None:
+        records = load()
+    lines = []
+    for kind, (labels, fields) in PROMETHEUS_SERIES.items():
+        kind_records = [entry for entry in records if entry.get("kind") == kind]
+        for field in fields:
+            name = f"whitelist_chat_{kind}_{field}"
+            lines.append(f"# TYPE {name} summary")
+            for row in summarize(kind_records, labels, field):
+                base = [f'{label}="{_label_value(row[label])}"' for label in labels]
+                for fraction in QUANTILES:
+                    label_text = ",".join(base + [f'quantile="{fraction}"'])
+                    value = row[f"p{int(fraction * 100)}"]
+                    lines.append(f"{name}{{{label_text}}} {value}")
+                label_text = ",".join(base)
+                lines.append(f"{name}_sum{{{label_text}}} {row['mean'] * row['count']}")
+                lines.append(f"{name}_count{{{label_text}}} {row['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prometheus", action="store_true")
+    parser.add_argument("--hours", type=float, help="only the last N hours")
+    args = parser.parse_args()
+    since = time.time() - args.hours * 3600 if args.hours else None
+    records = load(since=since)
+    if args.prometheus:
+        print(prometheus_text(records), end="")
+        return
+    for kind, (labels, _) in PROMETHEUS_SERIES.items():
+        for row in summarize(
+            [entry for entry in records if entry.get("kind") == kind], labels
+        ):
+            print(json.dumps(dict(row, kind=kind)))
+
+
+if __name__ == "__main__":
+    main()
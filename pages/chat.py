@@ -1,11 +1,22 @@
-import copy
+import json
+import logging
+import time
 
 import openai
 import streamlit as st
 
+import chat_messages
+import chat_request
 import chat_store
+import clients
 import common
+import context_window
+import metrics
 import prompts
+import response_cache
+import stream_render
+import topic_gate
+import utils
 
 # Models that support the Responses API (latest/common as of 2026-01)
 RESPONSES_MODELS = [
@@ -15,35 +26,80 @@ RESPONSES_MODELS = [
     "gpt-5.2-codex",
 ]
 
-# Model feature flags (only show UI + send params when supported)
-# Note: you mentioned `gpt-5.2` supports both; earlier models may not.
-MODEL_CAPABILITIES = {
-    "gpt-5.2": {"web_search": True, "thinking": True},
-    "gpt-5.2-codex": {"web_search": True, "thinking": True},
-}
+SUMMARY_MODEL = "gpt-5-mini"
 
 THINKING_LEVELS = ["low", "medium", "high", "xhigh"]
 UNSAVED_CHAT_OPTION = "__unsaved__"
+CHATS_PAGE_SIZE = 50
+# Only this many of a chat's latest messages are rendered (and loaded) at first
+MESSAGES_PAGE_SIZE = 30
+SEARCH_RESULTS_LIMIT = 10
+
+logger = logging.getLogger("whitelist_chat")
+
+
+def response_chain_key(model, style):
+    # A server-side chain replays the system messages it started with, so it
+    # is only reusable while the model, topic and style stay the same.
+    return json.dumps([model, st.session_state.whitelist, style])
+
+
+def usable_response_chain(model, style):
+    if not st.session_state.get("chain_responses"):
+        return None
+    chain = st.session_state.get("response_chain")
+    if (
+        chain
+        and chain["key"] == response_chain_key(model, style)
+        # Only the new user turn was added since the chained response.
+        and chain["message_count"] == len(st.session_state.messages) - 1
+    ):
+        return chain
+    return None
+
+
+def summarize_history(client, previous_summary, messages):
+    new_messages = utils.format_messages(messages)
+    if previous_summary:
+        text = f"Existing summary:\n{previous_summary}\n\nNew messages:\n{new_messages}"
+    else:
+        text = new_messages
+    try:
+        response = client.responses.create(
+            model=SUMMARY_MODEL,
+            input=[
+                {"role": "system", "content": prompts.SUMMARY_PROMPT},
+                {"role": "user", "content": text},
+            ],
+        )
+    except openai.OpenAIError as error:
+        # The user's turn is already saved; answer it with the older turns
+        # trimmed instead, and summarize them on a later turn.
+        logger.warning("history summary failed: %s", error)
+        return None
+    return response.output_text
 
 
-def chat_has_content(messages):
-    if not isinstance(messages, list):
-        return False
-    for message in messages:
-        if message.get("role") in ("user", "assistant"):
-            if str(message.get("content", "")).strip():
-                return True
-    return False
+def update_system_message():
+    prompt = chat_request.system_message(st.session_state.whitelist)["content"]
+    if st.session_state.get("prompt") != prompt:
+        st.session_state.prompt = prompt
+        st.session_state.system_message = chat_messages.Message("system", prompt)
 
 
-def update_system_message():
-    st.session_state.prompt = prompts.TOPIC_SYSTEM_PROMPT.format(
-        topic=st.session_state.whitelist
+def record_prompt_cache_usage(usage):
+    totals = st.session_state.setdefault(
+        "prompt_cache_totals", {"turns": 0, "input_tokens": 0, "cached_tokens": 0}
     )
-    st.session_state.system_message = {
-        "role": "system",
-        "content": st.session_state.prompt,
-    }
+    totals["turns"] += 1
+    totals["input_tokens"] += usage.get("input_tokens", 0)
+    totals["cached_tokens"] += usage.get("cached_tokens", 0)
+
+
+def use_session_user():
+    # Widget callbacks run before the script body, and a new script thread
+    # starts without the user set, so every entry point sets it first.
+    chat_store.set_user(st.session_state.get("user"))
 
 
 def ensure_current_chat_id():
@@ -57,9 +113,28 @@ def ensure_current_chat_id():
     return chat_id
 
 
+def ensure_full_history():
+    """Load the messages load_chat left out before anything needs them."""
+    if not st.session_state.get("hidden_messages"):
+        return
+    # Called before the loaded tail is changed, so the stored chat is current.
+    # It may have been opened before login, from the shared namespace.
+    with chat_store.as_user(
+        st.session_state.get("chat_user", chat_store.current_user())
+    ):
+        chat_data = chat_store.load_chat(st.session_state.current_chat_id)
+    if chat_data and chat_data.get("messages"):
+        messages = chat_messages.Conversation(chat_data["messages"])
+        messages[0] = st.session_state.system_message
+        st.session_state.messages = messages
+    st.session_state.hidden_messages = 0
+
+
 def save_current_chat():
-    messages = st.session_state.get("messages", [])
-    if not chat_has_content(messages):
+    use_session_user()
+    ensure_full_history()
+    messages = chat_messages.as_conversation(st.session_state.get("messages"))
+    if not messages.has_content:
         chat_id = st.session_state.get("current_chat_id")
         if chat_id:
             chat_store.delete_chat(chat_id)
@@ -67,20 +142,32 @@ def save_current_chat():
         st.session_state.pending_selected_chat_id = UNSAVED_CHAT_OPTION
         return
     chat_id = ensure_current_chat_id()
+    metadata = None
+    if st.session_state.get("context_summary"):
+        metadata = {"context_summary": st.session_state.context_summary}
     chat_store.save_chat(
         chat_id=chat_id,
         name=st.session_state.get("chat_name", ""),
-        messages=messages,
+        messages=messages.to_dicts(),
         whitelist=st.session_state.get("chat_whitelist", st.session_state.whitelist),
+        metadata=metadata,
     )
+    st.session_state.chat_user = chat_store.current_user()
 
 
 def start_new_chat():
     st.session_state.current_chat_id = None
+    st.session_state.chat_user = chat_store.current_user()
     st.session_state.chat_name = chat_store.default_chat_name()
     st.session_state.chat_whitelist = st.session_state.whitelist
-    st.session_state.messages = [st.session_state.system_message]
+    st.session_state.messages = chat_messages.Conversation(
+        [st.session_state.system_message]
+    )
+    st.session_state.hidden_messages = 0
+    st.session_state.messages_shown = MESSAGES_PAGE_SIZE
     st.session_state.pending_selected_chat_id = UNSAVED_CHAT_OPTION
+    st.session_state.pop("response_chain", None)
+    st.session_state.pop("context_summary", None)
 
 
 def delete_current_chat():
@@ -91,10 +178,11 @@ def delete_current_chat():
 
 
 def load_chat(chat_id):
-    chat_data = chat_store.load_chat(chat_id)
+    chat_data = chat_store.load_chat(chat_id, tail=MESSAGES_PAGE_SIZE)
     if not chat_data:
         return False
     st.session_state.current_chat_id = chat_id
+    st.session_state.chat_user = chat_store.current_user()
     st.session_state.chat_name = chat_data.get("name") or chat_store.default_chat_name()
     st.session_state.chat_whitelist = chat_data.get("whitelist") or st.session_state.whitelist
     if st.session_state.chat_whitelist != st.session_state.whitelist:
@@ -102,7 +190,19 @@ def load_chat(chat_id):
     messages = chat_data.get("messages")
     if not isinstance(messages, list):
         messages = []
-    st.session_state.messages = messages
+    hidden_messages = chat_data.get("message_count", len(messages)) - len(messages)
+    if hidden_messages:
+        # Only the tail was loaded; the stored system message is among the
+        # hidden ones and gets replaced by the current one anyway.
+        messages = [st.session_state.system_message] + messages
+        hidden_messages -= 1
+    st.session_state.messages = chat_messages.Conversation(messages)
+    st.session_state.hidden_messages = hidden_messages
+    st.session_state.messages_shown = MESSAGES_PAGE_SIZE
+    metadata = chat_data.get("metadata") or {}
+    st.session_state.context_summary = metadata.get("context_summary")
+    # Stored response ids may have expired; replay the history once instead.
+    st.session_state.pop("response_chain", None)
     return True
 
 
@@ -116,6 +216,10 @@ def format_chat_label(chat_summary):
 
 st.title("Whitelisted Chatbot")
 
+chat_store.configure(st.secrets.get("CHAT_STORE_BACKEND"))
+# Logged-in users only see their own chats.
+use_session_user()
+
 if "whitelist" not in st.session_state:
     st.session_state.whitelist = st.secrets["WHITELISTED_TOPICS"][0]
 if "pending_whitelist" in st.session_state:
@@ -143,12 +247,35 @@ with st.sidebar:
         start_new_chat()
         st.rerun()
 
-    chat_summaries = chat_store.list_chats()
+    search_query = st.text_input("Search chats", key="chat_search")
+    if search_query.strip():
+        for result in chat_store.search_chats(
+            search_query, limit=SEARCH_RESULTS_LIMIT
+        ):
+            if st.button(
+                format_chat_label(result),
+                key=f"search_result_{result['id']}",
+                help=result.get("snippet"),
+            ):
+                if load_chat(result["id"]):
+                    st.session_state.pending_selected_chat_id = result["id"]
+                    st.rerun()
+
+    chats_shown = st.session_state.setdefault("chats_shown", CHATS_PAGE_SIZE)
+    chat_summaries = chat_store.list_chats(limit=chats_shown)
     chat_options = [summary["id"] for summary in chat_summaries]
     chat_labels = {
         summary["id"]: format_chat_label(summary) for summary in chat_summaries
     }
     current_chat_id = st.session_state.get("current_chat_id")
+    if (
+        current_chat_id
+        and current_chat_id not in chat_labels
+        and chat_store.chat_exists(current_chat_id)
+    ):
+        # The open chat is older than the loaded page; keep it selectable.
+        chat_options.append(current_chat_id)
+        chat_labels[current_chat_id] = st.session_state.get("chat_name", "Untitled")
     current_unsaved = not current_chat_id or current_chat_id not in chat_labels
     if current_unsaved:
         chat_options.insert(0, UNSAVED_CHAT_OPTION)
@@ -181,10 +308,15 @@ with st.sidebar:
     if selected_chat_id != UNSAVED_CHAT_OPTION and selected_chat_id != current_chat_id:
         if load_chat(selected_chat_id):
             st.rerun()
+    if len(chat_summaries) >= chats_shown and st.button("Show older chats"):
+        st.session_state.chats_shown = chats_shown + CHATS_PAGE_SIZE
+        st.rerun()
 
     st.text_input("Chat name", key="chat_name", on_change=save_current_chat)
 
     common.manage_credentials()
+    # A login in this run switches the rest of it to the user's chats.
+    use_session_user()
 
     st.session_state.model = st.selectbox(
         "Model",
@@ -192,9 +324,7 @@ with st.sidebar:
     )
 
     # Optional model features (only shown when supported)
-    capabilities = MODEL_CAPABILITIES.get(
-        st.session_state.model, {"web_search": False, "thinking": False}
-    )
+    capabilities = chat_request.capabilities(st.session_state.model)
 
     if capabilities["web_search"]:
         st.checkbox("Enable web search", key="enable_web_search", value=False)
@@ -210,19 +340,69 @@ with st.sidebar:
 
     style = st.selectbox("Style", [""] + list(prompts.STYLE_PROMPTS.keys()))
 
+    st.checkbox(
+        "Server-side history",
+        key="chain_responses",
+        value=bool(st.secrets.get("CHAT_CHAIN_RESPONSES", False)),
+        help="Send only the new message and let the API continue from the "
+        "previous response instead of resending the whole chat",
+    )
+    st.checkbox(
+        "Reuse cached answers",
+        key="use_response_cache",
+        value=bool(st.secrets.get("RESPONSE_CACHE", False)),
+        help="Answer repeated questions (same topic, style, model and recent "
+        "messages) from a shared cache instead of generating them again. "
+        "Not used with web search.",
+    )
+    if st.session_state.use_response_cache:
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"Answer cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses"
+        )
+
+    last_turn_stats = st.session_state.get("last_turn_stats") or {}
+    if last_turn_stats.get("trimmed_tokens"):
+        st.caption(
+            f"Context: {last_turn_stats['trimmed_tokens']} tokens from "
+            f"{last_turn_stats['trimmed_messages']} older messages were "
+            "replaced by a summary"
+        )
+    cache_totals = st.session_state.get("prompt_cache_totals")
+    if cache_totals and cache_totals["input_tokens"]:
+        st.caption(
+            f"Prompt cache: {cache_totals['cached_tokens']} of "
+            f"{cache_totals['input_tokens']} input tokens cached "
+            f"({cache_totals['cached_tokens'] / cache_totals['input_tokens']:.0%}) "
+            f"over {cache_totals['turns']} turns"
+        )
+    if last_turn_stats:
+        with st.expander("Last turn stats"):
+            st.json(st.session_state["last_turn_stats"])
+
 
 # initialize/update system message
-if "messages" not in st.session_state or not isinstance(
-    st.session_state.messages, list
-):
-    st.session_state.messages = [st.session_state.system_message]
-elif not st.session_state.messages:
-    st.session_state.messages = [st.session_state.system_message]
+st.session_state.messages = chat_messages.as_conversation(
+    st.session_state.get("messages")
+)
+if not st.session_state.messages:
+    st.session_state.messages.append(st.session_state.system_message)
 else:
     st.session_state.messages[0] = st.session_state.system_message
 
-# display messages
-for message in st.session_state.messages[1:]:
+# display messages; long chats only render the latest ones
+conversation = st.session_state.messages[1:]
+messages_shown = st.session_state.setdefault("messages_shown", MESSAGES_PAGE_SIZE)
+older_messages = (
+    len(conversation) + st.session_state.get("hidden_messages", 0) - messages_shown
+)
+if older_messages > 0 and st.button(f"Show older messages ({older_messages})"):
+    st.session_state.messages_shown = messages_shown + MESSAGES_PAGE_SIZE
+    if st.session_state.messages_shown > len(conversation):
+        ensure_full_history()
+    st.rerun()
+for message in conversation[-messages_shown:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
@@ -230,10 +410,31 @@ for message in st.session_state.messages[1:]:
 if prompt := st.chat_input("What is up?"):
     # Check if the required API key for the selected model is available
     required_api_key = "OPENAI_API_KEY"
+    gate_result = None
+    if st.secrets.get("TOPIC_GATE", True):
+        gate_result = topic_gate.check(
+            prompt,
+            st.session_state.whitelist,
+            st.secrets.get("TOPIC_GATE_KEYWORDS"),
+        )
     if not st.session_state.get(required_api_key, ""):
         st.error("Please provide OpenAI API key")
+    elif gate_result and gate_result["reject"]:
+        # Clearly off-topic: answer like the model would, without calling it.
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        with st.chat_message("assistant"):
+            st.markdown(chat_request.INVALID_INPUT)
+        st.session_state["last_invalid_message"] = prompt
+        st.session_state["last_turn_stats"] = dict(gate_result, request_mode="gated")
+        logger.info(
+            "topic gate rejected prompt: %s scored %.2f",
+            gate_result["domain"],
+            gate_result["off_topic_score"],
+        )
     else:
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        ensure_full_history()
+        st.session_state.messages.append(chat_messages.Message("user", prompt))
         save_current_chat()
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -242,52 +443,149 @@ if prompt := st.chat_input("What is up?"):
         try:
             with st.chat_message("assistant"):
                 message_placeholder = st.empty()
-                full_response = ""
+                renderer = stream_render.ThrottledRenderer(message_placeholder)
 
-                client = openai.OpenAI(api_key=st.session_state[required_api_key])
+                client = clients.get_client(st.session_state[required_api_key])
 
                 # Always include the whitelist system message. If a style is selected,
-                # add it as an additional system message (without replacing the whitelist).
-                generation_messages = copy.deepcopy(st.session_state.messages)
-                if style:
-                    generation_messages.insert(
-                        1,
-                        {
-                            "role": "system",
-                            "content": prompts.STYLE_PROMPTS[style],
-                        },
-                    )
+                # add it as an additional system message after the latest turn, so the
+                # topic prompt and history stay a byte-stable prefix that the API's
+                # prompt cache can reuse across turns and style changes.
+                generation_messages = chat_request.api_messages(
+                    st.session_state.messages, st.session_state.whitelist
+                )
+                pinned_messages = chat_request.style_messages(style)
 
                 selected_model = st.session_state.model
-                capabilities = MODEL_CAPABILITIES.get(
-                    selected_model, {"web_search": False, "thinking": False}
+                # Keep recent turns within the model's budget; older ones are
+                # folded into a rolling summary cached with the chat.
+                (
+                    generation_messages,
+                    st.session_state.context_summary,
+                    context_stats,
+                ) = context_window.build_context(
+                    generation_messages,
+                    pinned_messages,
+                    chat_request.token_budget(selected_model),
+                    model=selected_model,
+                    summary=st.session_state.get("context_summary"),
+                    summarize=lambda previous, messages: summarize_history(
+                        client, previous, messages
+                    ),
+                )
+                request_kwargs = chat_request.request_kwargs(
+                    selected_model,
+                    generation_messages,
+                    st.session_state.whitelist,
+                    web_search=st.session_state.get("enable_web_search", False),
+                    thinking_level=st.session_state.get("thinking_level"),
                 )
-                request_kwargs = {
-                    "model": selected_model,
-                    "input": generation_messages,
-                    "stream": True,
-                }
-
-                if capabilities["web_search"] and st.session_state.get(
-                    "enable_web_search", False
-                ):
-                    request_kwargs["tools"] = [{"type": "web_search"}]
-
-                if capabilities["thinking"] and st.session_state.get("thinking_level"):
-                    request_kwargs["reasoning"] = {
-                        "effort": st.session_state["thinking_level"]
-                    }
-
-                for event in client.responses.create(**request_kwargs):
-                    if getattr(event, "type", None) == "response.output_text.delta":
-                        full_response += getattr(event, "delta", "") or ""
-                        message_placeholder.markdown(full_response + "▌")
-                    elif getattr(event, "type", None) == "error":
-                        raise RuntimeError(getattr(event, "error", "Unknown error"))
 
-            message_placeholder.markdown(full_response)
+                chain = None
+                if not context_stats["trimmed_messages"]:
+                    # Server-side history can't be trimmed, so chains are
+                    # only used while the whole chat fits the budget.
+                    chain = usable_response_chain(selected_model, style)
+                request_mode = "full"
+                stream = None
+                # The chain already holds the style message from its first request.
+                chained_input = [{"role": "user", "content": prompt}]
+                request_started = time.perf_counter()
+                cache_key = None
+                cached_response = None
+                if st.session_state.get("use_response_cache") and (
+                    "tools" not in request_kwargs
+                ):
+                    # Web search answers go stale, so those are never cached.
+                    cache_key = response_cache.request_key(
+                        generation_messages[0]["content"],
+                        prompts.STYLE_PROMPTS.get(style),
+                        selected_model,
+                        request_kwargs.get("reasoning", {}).get("effort"),
+                        st.session_state.messages,
+                    )
+                    cached_response = response_cache.get(cache_key)
+                if cached_response is not None:
+                    # Replayed through the same rendering loop as a live stream.
+                    stream = response_cache.replay(cached_response)
+                    request_mode = "cached"
+                elif chain:
+                    try:
+                        stream = client.responses.create(
+                            **dict(
+                                request_kwargs,
+                                input=chained_input,
+                                previous_response_id=chain["response_id"],
+                            )
+                        )
+                        request_mode = "chained"
+                    except (openai.BadRequestError, openai.NotFoundError):
+                        # The stored response is gone; replay the full history.
+                        logger.info("response chain broken, replaying history")
+                if stream is None:
+                    stream = client.responses.create(**request_kwargs)
+                # What resending the whole history costs, to compare against.
+                full_request_bytes = len(
+                    json.dumps(generation_messages).encode("utf-8")
+                )
+                request_bytes = 0
+                if request_mode == "chained":
+                    request_bytes = len(json.dumps(chained_input).encode("utf-8"))
+                elif request_mode != "cached":
+                    request_bytes = full_request_bytes
+                logger.info(
+                    "responses request: %s, %d input bytes", request_mode, request_bytes
+                )
 
-            if full_response.strip() == "Invalid Input":
+                reader = chat_request.read_stream(
+                    stream, renderer.append, request_started
+                )
+                response_id = reader.response_id
+                usage = reader.usage
+                first_token_seconds = reader.first_token_seconds
+
+            full_response = renderer.finish()
+            response_seconds = time.perf_counter() - request_started
+            if cache_key and request_mode != "cached":
+                response_cache.put(cache_key, full_response)
+            st.session_state["last_turn_stats"] = dict(
+                renderer.stats,
+                **context_stats,
+                **usage,
+                request_mode=request_mode,
+                request_input_bytes=request_bytes,
+                first_token_seconds=first_token_seconds,
+                response_seconds=response_seconds,
+            )
+            if usage:
+                record_prompt_cache_usage(usage)
+                logger.info(
+                    "responses usage: %s, %d input tokens (%d cached), "
+                    "%.2fs to first token, %.2fs total",
+                    selected_model,
+                    usage["input_tokens"],
+                    usage["cached_tokens"],
+                    first_token_seconds or 0.0,
+                    response_seconds,
+                )
+            metrics.record(
+                "chat",
+                model=selected_model,
+                effort=request_kwargs.get("reasoning", {}).get("effort"),
+                web_search="tools" in request_kwargs,
+                request_mode=request_mode,
+                request_input_bytes=request_bytes,
+                full_input_bytes=full_request_bytes,
+                seconds=round(response_seconds, 6),
+                first_token_seconds=first_token_seconds,
+                deltas=renderer.events,
+                deltas_per_second=renderer.events / response_seconds,
+                output_chars=len(full_response),
+                invalid=chat_request.is_invalid(full_response),
+                **usage,
+            )
+
+            if chat_request.is_invalid(full_response):
                 # Input is invalid - remove user message and store for reporting
                 st.session_state["last_invalid_message"] = st.session_state.messages.pop()[
                     "content"
@@ -295,10 +593,26 @@ if prompt := st.chat_input("What is up?"):
                 save_current_chat()
             else:
                 # Add the response to messages
+                extra = {}
+                if response_id:
+                    extra["response_id"] = response_id
+                if usage:
+                    # Kept with the chat so cache hit rates can be tracked over time.
+                    extra["usage"] = dict(
+                        usage,
+                        first_token_seconds=first_token_seconds,
+                        response_seconds=response_seconds,
+                    )
                 st.session_state.messages.append(
-                    {"role": "assistant", "content": full_response}
+                    chat_messages.Message("assistant", full_response, **extra)
                 )
                 save_current_chat()
+                if response_id:
+                    st.session_state.response_chain = {
+                        "response_id": response_id,
+                        "key": response_chain_key(selected_model, style),
+                        "message_count": len(st.session_state.messages),
+                    }
 
         except openai.AuthenticationError:
             st.error("Invalid OpenAI API Key: please start a new chat and try again")
@@ -0,0 +1,77 @@
+import time
+
+import streamlit as st
+
+import common
+import metrics
+
+# (title, record kind, grouping, measured fields)
+SECTIONS = [
+    ("Chat", "chat", ["model"], ["seconds", "first_token_seconds"]),
+    (
+        "Chat request size",
+        "chat",
+        ["request_mode"],
+        ["request_input_bytes", "full_input_bytes"],
+    ),
+    ("Text to speech", "tts", ["model"], ["seconds"]),
+    ("Audio conversion", "convert", ["method", "output_format"], ["seconds"]),
+    ("Chat storage", "chat_store", ["backend", "op"], ["seconds"]),
+]
+
+
+def format_rows(rows):
+    return [
+        {
+            key: round(value, 4) if isinstance(value, float) else value
+            for key, value in row.items()
+        }
+        for row in rows
+    ]
+
+
+st.title("Metrics")
+
+common.manage_credentials()
+admin_users = st.secrets.get("ADMIN_USERS")
+if not st.session_state.get("OPENAI_API_KEY") or (
+    admin_users and st.session_state.get("user") not in admin_users
+):
+    st.info("Log in as an admin to see metrics")
+    st.stop()
+
+with st.sidebar:
+    hours = st.number_input("Last hours", min_value=1, max_value=24 * 90, value=24)
+
+records = metrics.load(since=time.time() - hours * 3600)
+if not records:
+    st.info("No metrics recorded yet")
+    st.stop()
+
+for title, kind, group_by, fields in SECTIONS:
+    kind_records = [record for record in records if record.get("kind") == kind]
+    if not kind_records:
+        continue
+    st.subheader(title)
+    for field in fields:
+        if len(fields) > 1:
+            st.caption(field.replace("_", " "))
+        st.dataframe(
+            format_rows(metrics.summarize(kind_records, group_by, field)),
+            use_container_width=True,
+        )
+
+chat_records = [record for record in records if record.get("kind") == "chat"]
+if chat_records:
+    st.subheader("Chat throughput")
+    st.dataframe(
+        format_rows(metrics.summarize(chat_records, ["model"], "deltas_per_second")),
+        use_container_width=True,
+    )
+
+st.download_button(
+    "Download Prometheus metrics",
+    metrics.prometheus_text(records),
+    file_name="metrics.prom",
+    mime="text/plain",
+)
@@ -1,23 +1,48 @@
 import os
-from io import BytesIO
-from zipfile import ZIP_DEFLATED, ZipFile
+import time
+from zipfile import ZipFile
 
 import streamlit as st
 
+import audio_spool
+import clients
 import common
-import utils
+import tts_jobs
+import tts_scheduler
 
 st.title("Text to Speech Converter")
-st.session_state.audio_data = st.session_state.get("audio_data", {})
+# Conversions run as background jobs that outlive reruns and reloads; the
+# session only remembers which job it is watching.
+tts_jobs.start()
+audio_spool.cleanup()
 
 common.manage_credentials()
+# The system key from the secrets is also in the environment, where a job
+# finds it again after a restart. Only any other key is handed to the job,
+# which keeps it in memory.
+api_key = st.session_state.get("OPENAI_API_KEY") or None
+if api_key == st.secrets.get("OPENAI_API_KEY"):
+    api_key = None
 FORMATS = ["flac", "opus", "aac", "mp3"]
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# Players beyond this many are left out; the download has every file.
+MAX_PLAYERS = 20
+# How often the page checks on a running job
+POLL_SECONDS = 1.0
 
 with st.sidebar:
     model = st.selectbox("model", ["tts-1", "tts-1-hd"])
     voice = st.selectbox("voice", ["alloy", "echo", "fable", "onyx", "nova", "shimmer"])
     format = st.selectbox("output format", ["mp3", "flac", "opus", "aac", "wav"])
     format_to_use = format if format in FORMATS else "flac"
+    concurrency = st.number_input(
+        "parallel requests",
+        min_value=1,
+        max_value=MAX_CONCURRENCY,
+        value=st.secrets.get("TTS_CONCURRENCY", DEFAULT_CONCURRENCY),
+        help="How many files of a zip are converted at the same time",
+    )
 
 if st.session_state.get("zip_uploader", None) is None:
     st.file_uploader("Choose a text file", type="txt", key="file_uploader")
@@ -35,71 +60,109 @@ if (
         if not st.session_state.get("OPENAI_API_KEY", ""):
             st.error("please provide api key")
         else:
-
-            def text_to_audio(
-                text,
-                model=model,
-                voice=voice,
-                format_to_use=format_to_use,
-                format=format,
-            ):
-                audio_data = utils.text_to_speech(
-                    text,
+            if st.session_state.get("file_uploader", None) is not None:
+                upload = st.session_state.file_uploader
+                kind = "file"
+                text = tts_jobs.decode_text(upload.getvalue())
+                file_name = os.path.splitext(upload.name)[0]
+                entries = [(f"{file_name}_{model}_{voice}.{format}", text)]
+            else:
+                upload = st.session_state.zip_uploader
+                kind = "zip"
+                with ZipFile(upload, "r") as zip_file:
+                    entries = tts_jobs.zip_entries(zip_file, format)
+            if not entries:
+                st.error("The zip file has no text files")
+            else:
+                # The same upload with the same settings attaches to its
+                # earlier job, resuming it if it was interrupted.
+                st.session_state.tts_job_id = tts_jobs.submit(
+                    st.session_state.get("user", ""),
+                    upload.name,
+                    entries,
+                    kind=kind,
                     model=model,
                     voice=voice,
+                    format=format,
                     response_format=format_to_use,
+                    api_key=api_key,
+                    concurrency=concurrency,
                 )
-                if format != format_to_use:
-                    audio_data = utils.convert_audio(
-                        BytesIO(audio_data),
-                        format_to_use,
-                        format,
-                    )
 
-                return audio_data
+# A reloaded page starts a new session; pick up the user's latest job.
+if "tts_job_id" not in st.session_state and st.session_state.get("OPENAI_API_KEY"):
+    user_jobs = tts_jobs.list_jobs(st.session_state.get("user", ""))
+    if user_jobs:
+        st.session_state.tts_job_id = user_jobs[0]["id"]
 
-            st.session_state.audio_data = {}
-            if st.session_state.get("file_uploader", None) is not None:
-                text = st.session_state.file_uploader.getvalue().decode("utf-8")
-                file_name = os.path.splitext(st.session_state.file_uploader.name)[0]
-                audio_file_name = f"{file_name}_{model}_{voice}.{format}"
-                audio_data = text_to_audio(text)
-                st.session_state["download_file_name"] = audio_file_name
-                st.session_state["download_data"] = audio_data
-                st.session_state["download_mime"] = f"audio/{format}"
-                st.session_state.audio_data[audio_file_name] = audio_data
-            elif st.session_state.get("zip_uploader", None) is not None:
-                new_zip_io = BytesIO()
-                with ZipFile(st.session_state.zip_uploader, "r") as zip_file:
-                    with ZipFile(new_zip_io, "w", ZIP_DEFLATED) as new_zip:
-                        for info in zip_file.infolist():
-                            with zip_file.open(info) as text_file:
-                                text = text_file.read().decode("utf-8")
-                                audio_file_name = (
-                                    f"{os.path.splitext(info.filename)[0]}.{format}"
-                                )
-                                audio_data = text_to_audio(text)
-                                new_zip.writestr(audio_file_name, audio_data)
-                                st.session_state.audio_data[
-                                    audio_file_name
-                                ] = audio_data
-                zip_name = os.path.splitext(st.session_state.zip_uploader.name)[0]
-                new_zip_name = f"{zip_name}_{model}_{voice}.zip"
-                st.session_state["download_file_name"] = new_zip_name
-                st.session_state["download_data"] = new_zip_io.getvalue()
-                st.session_state["download_mime"] = "application/zip"
+job = None
+if st.session_state.get("tts_job_id"):
+    job = tts_jobs.get(st.session_state.tts_job_id)
 
+if job is not None and job["status"] in tts_jobs.ACTIVE_STATUSES:
+    st.progress(
+        job["completed"] / max(1, job["total"]),
+        text=f"Converting {job['name']}: {job['completed']}/{job['total']} files",
+    )
+    if job["status"] == "queued":
+        st.caption("Waiting for earlier conversions to finish")
+    elif job.get("resumed"):
+        st.caption(f"Resumed after {job['resumed']} files that were already done")
+elif job is not None:
+    report = job.get("report", {})
+    if job["kind"] == "file":
+        stats = job.get("stats") or {}
+        if stats.get("cache_hit"):
+            st.caption("Loaded from cache")
+        elif stats.get("chunks", 0) > 1:
+            st.caption(
+                f"{stats['chunks']} chunks in {report['wall_seconds']:.1f}s "
+                f"({report['request_seconds']:.1f}s of requests, "
+                f"{stats['cached_chunks']} chunks cached)"
+            )
+    elif report:
+        for line in tts_scheduler.format_report(report):
+            st.caption(line)
+        if job.get("cache_hits"):
+            st.caption(f"{job['cache_hits']}/{job['total']} files loaded from cache")
+    for audio_file_name, error in job["failures"].items():
+        st.warning(f"{audio_file_name} failed: {error}")
+    if job.get("error"):
+        st.error(f"Conversion failed: {job['error']}")
 
-if st.session_state.audio_data:
-    for audio_file_name in st.session_state.audio_data:
-        st.audio(
-            st.session_state.audio_data[audio_file_name],
-            format=f"audio/{format}",
-            start_time=0,
-        )
-    st.download_button(
-        label=f"Download {st.session_state.download_mime}",
-        data=st.session_state.download_data,
-        file_name=st.session_state.download_file_name,
-        mime=st.session_state.download_mime,
+    connection_stats = clients.connection_stats(api_key)
+    st.caption(
+        f"{connection_stats['requests']} API requests so far over "
+        f"{connection_stats['connections_opened']} connections "
+        f"({connection_stats['connections_reused']} reused)"
     )
+
+    download_path = tts_jobs.output_path(job)
+    if download_path is not None:
+        audio_files = tts_jobs.finished_entries(job)
+        for audio_file_name, audio_path in audio_files[:MAX_PLAYERS]:
+            st.audio(audio_path, format=f"audio/{job['format']}", start_time=0)
+        if len(audio_files) > MAX_PLAYERS:
+            st.caption(
+                f"Showing {MAX_PLAYERS} of {len(audio_files)} files; "
+                "download the zip for the rest"
+            )
+        if job["kind"] == "zip":
+            zip_name = os.path.splitext(job["name"])[0]
+            download_file_name = f"{zip_name}_{job['model']}_{job['voice']}.zip"
+            download_mime = "application/zip"
+        else:
+            download_file_name = job["names"][0]
+            download_mime = f"audio/{job['format']}"
+        with open(download_path, "rb") as download_file:
+            st.download_button(
+                label=f"Download {download_mime}",
+                data=download_file,
+                file_name=download_file_name,
+                mime=download_mime,
+            )
+
+if job is not None and job["status"] in tts_jobs.ACTIVE_STATUSES:
+    # Any widget interaction cuts this short; the job keeps running.
+    time.sleep(POLL_SECONDS)
+    st.rerun()
@@ -24,3 +24,11 @@ STYLE_PROMPTS = {
 Regardless of the question - JUST provide relevant website/link information, with ONLY a VERY brief explanation of each website/link.
 """
 }
+
+# summarizes turns that no longer fit in the model's context budget
+SUMMARY_PROMPT = """\
+Summarize the conversation below so it can replace the original messages as context \
+for continuing it. If an existing summary is given, fold the new messages into it.
+Keep every fact, decision, constraint, code identifier and open question. \
+Drop greetings and repetition. Write plain, compact prose or bullet points.
+"""
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from audio_cache import cache_key
+
+CACHE_DIR_NAME = "response_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+# Conversation messages (newest first) that take part in the key: the new
+# prompt plus the exchange it may refer back to.
+DEFAULT_WINDOW = 3
+REPLAY_CHUNK_CHARS = 64
+
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None
+_stats = {"hits": 0, "misses": 0, "expired": 0}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _cache_dir() -> Path:
+    return Path(
+        os.environ.get(
+            "RESPONSE_CACHE_DIR", Path(__file__).resolve().parent / CACHE_DIR_NAME
+        )
+    )
+
+
+def _max_bytes() -> int:
+    return int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def _ttl_seconds() -> float:
+    return float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+
+
+def _window() -> int:
+    return int(os.environ.get("RESPONSE_CACHE_WINDOW", DEFAULT_WINDOW))
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def request_key(
+    system_prompt: str,
+    style_prompt: Optional[str],
+    model: str,
+    reasoning_effort: Optional[str],
+    messages: List[Dict[str, Any]],
+) -> str:
+    """Key for a request: prompts, model settings and the trailing turns."""
+    conversation = [message for message in messages if message["role"] != "system"]
+    window = [
+        [message["role"], _normalize(message["content"])]
+        for message in conversation[-_window():]
+    ]
+    return cache_key(
+        _normalize(system_prompt),
+        _normalize(style_prompt),
+        model,
+        reasoning_effort,
+        json.dumps(window, ensure_ascii=False),
+    )
+
+
+def _entry_path(key: str) -> Path:
+    return _cache_dir() / key[:2] / f"{key}.json"
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def get(key: str) -> Optional[str]:
+    if _max_bytes() <= 0:
+        return None
+    path = _entry_path(key)
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        _count("misses")
+        return None
+    if time.time() - entry.get("created_at", 0) > _ttl_seconds():
+        path.unlink(missing_ok=True)
+        _count("expired")
+        _count("misses")
+        return None
+    try:
+        # The mtime doubles as the last-used time for LRU eviction.
+        os.utime(path)
+    except OSError:
+        pass
+    _count("hits")
+    return entry["text"]
+
+
+def put(key: str, text: str) -> None:
+    global _total_bytes
+    max_bytes = _max_bytes()
+    data = json.dumps({"created_at": time.time(), "text": text}).encode("utf-8")
+    if max_bytes <= 0 or len(data) > max_bytes:
+        return
+    path = _entry_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # An entry written again replaces the old one's bytes.
+        replaced_bytes = path.stat().st_size
+    except OSError:
+        replaced_bytes = 0
+    tmp_path = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        return
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_size()
+        else:
+            _total_bytes += len(data) - replaced_bytes
+        if _total_bytes > max_bytes:
+            _total_bytes = _evict(max_bytes)
+
+
+def replay(text: str) -> Iterator[SimpleNamespace]:
+    """A cached answer as Responses stream delta events."""
+    for start in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield SimpleNamespace(
+            type="response.output_text.delta",
+            delta=text[start : start + REPLAY_CHUNK_CHARS],
+        )
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        counts = dict(_stats)
+    lookups = counts["hits"] + counts["misses"]
+    counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    return counts
+
+
+def _entries():
+    for path in _cache_dir().glob("??/*.json"):
+        try:
+            yield path, path.stat()
+        except OSError:
+            continue
+
+
+def _scan_size() -> int:
+    return sum(stat.st_size for _, stat in _entries())
+
+
+def _evict(max_bytes: int) -> int:
+    """Delete expired, then least recently used, entries down to 90%."""
+    entries = sorted(_entries(), key=lambda entry: entry[1].st_mtime)
+    total = sum(stat.st_size for _, stat in entries)
+    target = max_bytes * 9 // 10
+    expired_before = time.time() - _ttl_seconds()
+    for path, stat in entries:
+        if total <= target and stat.st_mtime >= expired_before:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        total -= stat.st_size
+    return total
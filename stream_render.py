@@ -0,0 +1,64 @@
+import os
+import time
+from typing import Any, Dict
+
+# Streamlit re-sends the whole markdown on every update, so streamed text is
+# buffered and pushed at most this many times per second...
+DEFAULT_FPS = float(os.environ.get("CHAT_RENDER_FPS", 12))
+# ...unless this much new text has piled up since the last push.
+DEFAULT_MAX_PENDING_CHARS = int(os.environ.get("CHAT_RENDER_MAX_PENDING_CHARS", 2000))
+CURSOR = "▌"
+
+
+class ThrottledRenderer:
+    """Accumulates streamed deltas and renders them into a placeholder."""
+
+    def __init__(
+        self,
+        placeholder,
+        fps: float = DEFAULT_FPS,
+        max_pending_chars: int = DEFAULT_MAX_PENDING_CHARS,
+    ):
+        self.placeholder = placeholder
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.max_pending_chars = max_pending_chars
+        self.text = ""
+        self._pending_chars = 0
+        self._last_flush = 0.0
+        self.events = 0
+        self.flushes = 0
+        self.bytes_pushed = 0
+
+    def append(self, delta: str) -> None:
+        if not delta:
+            return
+        self.text += delta
+        self.events += 1
+        self._pending_chars += len(delta)
+        if (
+            time.monotonic() - self._last_flush >= self.min_interval
+            or self._pending_chars >= self.max_pending_chars
+        ):
+            self._flush(self.text + CURSOR)
+
+    def finish(self) -> str:
+        """Render the final text without the cursor and return it."""
+        self._flush(self.text)
+        return self.text
+
+    def _flush(self, markdown: str) -> None:
+        self.placeholder.markdown(markdown)
+        self.flushes += 1
+        self.bytes_pushed += len(markdown.encode("utf-8"))
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "flushes": self.flushes,
+            "events_per_flush": self.events / self.flushes if self.flushes else 0.0,
+            "bytes_pushed": self.bytes_pushed,
+            "final_bytes": len(self.text.encode("utf-8")),
+        }
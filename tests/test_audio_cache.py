@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+
+import audio_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("AUDIO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(audio_cache, "_total_bytes", None)
+    return tmp_path
+
+
+def test_cache_key_separates_parts():
+    assert audio_cache.cache_key("ab", "c") != audio_cache.cache_key("a", "bc")
+    assert audio_cache.cache_key("text", "tts-1") == audio_cache.cache_key(
+        "text", "tts-1"
+    )
+
+
+def test_put_and_get():
+    key = audio_cache.cache_key("hello", "tts-1", "alloy", "mp3")
+    assert audio_cache.get(key) is None
+    audio_cache.put(key, b"audio")
+    assert audio_cache.get(key) == b"audio"
+
+
+def test_disabled_cache_stores_nothing(monkeypatch, cache_dir):
+    monkeypatch.setenv("AUDIO_CACHE_MAX_BYTES", "0")
+    audio_cache.put("key", b"audio")
+    assert audio_cache.get("key") is None
+    assert not any(cache_dir.iterdir())
+
+
+def test_overwriting_an_entry_does_not_grow_the_size():
+    audio_cache.put("key", b"a" * 100)
+    for _ in range(5):
+        audio_cache.put("key", b"b" * 100)
+    assert audio_cache._total_bytes == audio_cache._scan_size() == 100
+
+
+def test_eviction_drops_least_recently_used(monkeypatch):
+    monkeypatch.setenv("AUDIO_CACHE_MAX_BYTES", "1000")
+    keys = [audio_cache.cache_key(str(index)) for index in range(12)]
+    for index, key in enumerate(keys):
+        audio_cache.put(key, b"x" * 100)
+        stamp = time.time() - 100 + index
+        os.utime(audio_cache._entry_path(key), (stamp, stamp))
+    assert audio_cache._scan_size() <= 1000
+    assert audio_cache.get(keys[-1]) is not None
+    assert audio_cache.get(keys[0]) is None
@@ -0,0 +1,23 @@
+import chat_request
+
+
+def test_every_model_has_a_token_budget():
+    for model in chat_request.MODEL_CAPABILITIES:
+        assert chat_request.token_budget(model) > 0
+    assert chat_request.token_budget("unknown-model") == (
+        chat_request.NO_CAPABILITIES["token_budget"]
+    )
+
+
+def test_request_kwargs_drop_unsupported_features():
+    messages = chat_request.style_messages(None)
+    kwargs = chat_request.request_kwargs(
+        "gpt-5-mini", messages, "coding", web_search=True, thinking_level="high"
+    )
+    assert "tools" not in kwargs and "reasoning" not in kwargs
+
+    kwargs = chat_request.request_kwargs(
+        "gpt-5.2", messages, "coding", web_search=True, thinking_level="high"
+    )
+    assert kwargs["tools"] == [{"type": "web_search"}]
+    assert kwargs["reasoning"] == {"effort": "high"}
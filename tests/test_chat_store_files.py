@@ -0,0 +1,56 @@
+import pytest
+
+import chat_store
+import chat_store_files
+
+MESSAGES = [
+    {"role": "system", "content": "system"},
+    {"role": "user", "content": "hello"},
+    {"role": "assistant", "content": "hi"},
+]
+
+
+@pytest.fixture(autouse=True)
+def chat_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHAT_STORE_DIR", str(tmp_path))
+    monkeypatch.setenv("METRICS_ENABLED", "0")
+    chat_store.configure("files")
+    chat_store.set_user(None)
+    yield tmp_path
+    chat_store_files._sharded_dirs.clear()
+    chat_store_files._log_cache.clear()
+    chat_store_files._manifest_cache.clear()
+
+
+def test_unsharded_chat_opens_without_listing_first(chat_dir):
+    chat_store.save_chat("old", "Old chat", MESSAGES, "coding")
+    path = chat_store_files._chat_path("old")
+    # Where releases before sharding kept it, in a fresh process.
+    path.rename(chat_dir / path.name)
+    chat_store_files._sharded_dirs.clear()
+    chat_store_files._log_cache.clear()
+
+    assert chat_store.chat_exists("old")
+    assert chat_store.load_chat("old")["messages"] == MESSAGES
+    assert not (chat_dir / path.name).exists()
+
+
+def test_unsharded_copy_never_replaces_sharded_chat(chat_dir):
+    chat_store.save_chat("chat", "Chat", MESSAGES, "coding")
+    path = chat_store_files._chat_path("chat")
+    stale = chat_dir / path.name
+    stale.write_bytes(path.read_bytes())
+    chat_store.save_chat("chat", "Chat", MESSAGES + MESSAGES[1:], "coding")
+    chat_store_files._sharded_dirs.clear()
+    chat_store_files._log_cache.clear()
+
+    assert len(chat_store.load_chat("chat")["messages"]) == 5
+
+
+def test_as_user_scopes_a_block(chat_dir):
+    chat_store.save_chat("shared", "Shared", MESSAGES, "coding")
+    with chat_store.as_user("alice"):
+        assert chat_store.load_chat("shared") is None
+        chat_store.save_chat("mine", "Mine", MESSAGES, "coding")
+    assert chat_store.current_user() is None
+    assert chat_store.load_chat("mine") is None
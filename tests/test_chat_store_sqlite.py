@@ -0,0 +1,107 @@
+import pytest
+
+import chat_store
+import chat_store_files
+import chat_store_sqlite
+
+MESSAGES = [
+    {"role": "system", "content": "system"},
+    {"role": "user", "content": "How do I reverse a list in python?"},
+    {"role": "assistant", "content": "Use slicing: items[::-1]"},
+]
+
+
+@pytest.fixture(autouse=True)
+def chat_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHAT_STORE_DIR", str(tmp_path))
+    monkeypatch.setenv("METRICS_ENABLED", "0")
+    chat_store.set_user(None)
+    yield tmp_path
+    chat_store.configure("files")
+    chat_store_files._sharded_dirs.clear()
+    chat_store_files._log_cache.clear()
+    chat_store_files._manifest_cache.clear()
+
+
+def test_import_copies_every_users_chats_into_their_database():
+    chat_store.configure("files")
+    chat_store.save_chat("shared", "Shared", MESSAGES, "coding")
+    for user in ("alice", "bob"):
+        with chat_store.as_user(user):
+            chat_store.save_chat(f"{user}_chat", user, MESSAGES, "coding")
+
+    imported = chat_store_sqlite.import_all_json_chats()
+    assert sorted(imported.values()) == [1, 1, 1]
+
+    chat_store.configure("sqlite")
+    assert [chat["id"] for chat in chat_store.list_chats()] == ["shared"]
+    for user in ("alice", "bob"):
+        with chat_store.as_user(user):
+            assert [chat["id"] for chat in chat_store.list_chats()] == [
+                f"{user}_chat"
+            ]
+            assert chat_store.load_chat(f"{user}_chat")["messages"] == MESSAGES
+
+    # Re-running leaves imported chats alone.
+    assert sum(chat_store_sqlite.import_all_json_chats().values()) == 0
+
+
+@pytest.fixture
+def sqlite_store():
+    chat_store.configure("sqlite")
+
+
+def test_save_load_and_edit(sqlite_store):
+    chat_store.save_chat("chat", "Chat", MESSAGES, "coding", {"pinned": True})
+    longer = MESSAGES + [
+        {"role": "user", "content": "And for a string?"},
+        {"role": "assistant", "content": "The same: text[::-1]"},
+    ]
+    chat_store.save_chat("chat", "Renamed", longer, "coding")
+    chat = chat_store.load_chat("chat")
+    assert chat["name"] == "Renamed"
+    assert chat["messages"] == longer
+    # metadata=None keeps what was stored.
+    assert chat["metadata"] == {"pinned": True}
+
+    edited = longer[:2] + [{"role": "assistant", "content": "Use reversed()"}]
+    chat_store.save_chat("chat", "Renamed", edited, "coding")
+    assert chat_store.load_chat("chat")["messages"] == edited
+    assert chat_store.list_chats()[0]["message_count"] == 3
+
+    tail = chat_store.load_chat("chat", tail=2)
+    assert tail["messages"] == edited[-2:]
+    assert tail["message_count"] == 3
+
+
+def test_search_finds_user_and_assistant_messages_only(sqlite_store):
+    chat_store.save_chat("lists", "Lists", MESSAGES, "coding")
+    chat_store.save_chat(
+        "dicts",
+        "Dicts",
+        [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "How do I merge two dicts?"},
+        ],
+        "coding",
+    )
+    assert [chat["id"] for chat in chat_store.search_chats("reverse")] == ["lists"]
+    # The last term matches as a prefix, while typing.
+    assert [chat["id"] for chat in chat_store.search_chats("mer")] == ["dicts"]
+    assert chat_store.search_chats("system") == []
+    # Query syntax is matched literally instead of raising.
+    assert chat_store.search_chats('"unbalanced OR (') == []
+    assert chat_store.search_chats("  ") == []
+
+    chat_store.delete_chat("lists")
+    assert chat_store.search_chats("reverse") == []
+    assert not chat_store.chat_exists("lists")
+
+
+def test_search_without_fts(sqlite_store, monkeypatch):
+    chat_store.save_chat("lists", "Lists", MESSAGES, "coding")
+    monkeypatch.setattr(chat_store_sqlite, "_fts_enabled", lambda: False)
+    results = chat_store.search_chats("items[::-1]")
+    assert [chat["id"] for chat in results] == ["lists"]
+    assert "items[::-1]" in results[0]["snippet"]
+    assert chat_store.search_chats("100%") == []
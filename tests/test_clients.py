@@ -0,0 +1,28 @@
+import gc
+
+import pytest
+
+import clients
+from benchmarks import fake_openai
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fake_openai.start(latency=0)
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    yield server
+    server.shutdown()
+
+
+def test_connection_reuse_is_counted(server):
+    client = clients.get_client("test-connection-reuse")
+    for _ in range(3):
+        client.responses.create(model="gpt-5-mini", input="hello")
+    stats = clients.connection_stats("test-connection-reuse")
+    assert stats == {"requests": 3, "connections_opened": 1, "connections_reused": 2}
+
+    client.close()
+    gc.collect()
+    # Closed connections aren't kept track of.
+    fingerprint = clients._fingerprint("test-connection-reuse")
+    assert len(clients._stats[fingerprint]["_streams"]) == 0
@@ -0,0 +1,93 @@
+import pytest
+
+import context_window
+
+SYSTEM = {"role": "system", "content": "You only talk about coding."}
+STYLE = [{"role": "system", "content": "Answer briefly."}]
+
+
+def conversation(turns):
+    return [SYSTEM] + [
+        {
+            "role": "user" if index % 2 == 0 else "assistant",
+            "content": f"message {index} " + "lorem ipsum dolor " * 50,
+        }
+        for index in range(turns)
+    ]
+
+
+def budget_for(messages, fraction):
+    return int(
+        sum(context_window.message_tokens(message) for message in messages) * fraction
+    )
+
+
+def test_history_within_budget_is_sent_as_is():
+    messages = conversation(6)
+    context, summary, stats = context_window.build_context(
+        messages, STYLE, budget_for(messages + STYLE, 2)
+    )
+    assert context == messages + STYLE
+    assert summary is None
+    assert stats["trimmed_messages"] == 0
+
+
+def test_older_turns_are_summarized_and_the_summary_reused():
+    messages = conversation(40)
+    budget = budget_for(messages, 0.5)
+    calls = []
+
+    def summarize(previous, new_messages):
+        calls.append((previous, len(new_messages)))
+        return f"summary of {len(new_messages)} messages"
+
+    context, summary, stats = context_window.build_context(
+        messages, STYLE, budget, summarize=summarize
+    )
+    assert context[0] == SYSTEM
+    assert context[1]["content"].startswith(context_window.SUMMARY_PREFIX)
+    assert context[-2:] == [messages[-1]] + STYLE
+    assert stats["context_tokens"] <= budget
+    assert summary["covers"] == stats["trimmed_messages"] > 0
+    assert calls == [(None, summary["covers"])]
+
+    # The next turn fits next to the same summary without a new request.
+    messages += conversation(2)[1:]
+    _, next_summary, _ = context_window.build_context(
+        messages, STYLE, budget, summary=summary, summarize=summarize
+    )
+    assert next_summary == summary
+    assert len(calls) == 1
+
+
+def test_failed_summary_trims_without_one():
+    messages = conversation(40)
+    budget = budget_for(messages, 0.5)
+    context, summary, stats = context_window.build_context(
+        messages, STYLE, budget, summarize=lambda previous, new_messages: None
+    )
+    assert summary is None
+    assert context[0] == SYSTEM
+    assert context[1] == messages[1 + stats["trimmed_messages"]]
+    assert context[-1] == STYLE[-1]
+    assert stats["context_tokens"] <= budget
+    assert stats["summary_tokens"] == 0
+
+    # An earlier summary is kept, to be extended on a later turn.
+    previous = {"text": "earlier", "covers": 2}
+    context, summary, stats = context_window.build_context(
+        messages,
+        STYLE,
+        budget,
+        summary=previous,
+        summarize=lambda previous, new_messages: None,
+    )
+    assert summary == previous
+    assert context[1] == context_window.summary_message(previous)
+    assert stats["trimmed_messages"] > 2
+
+
+def test_over_budget_without_summarizer():
+    messages = conversation(40)
+    with pytest.raises(ValueError):
+        context_window.build_context(messages, STYLE, budget_for(messages, 0.5))
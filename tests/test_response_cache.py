@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+import response_cache
+
+SYSTEM = "You only talk about coding."
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(response_cache, "_total_bytes", None)
+    return tmp_path
+
+
+def key(messages, model="gpt-5-mini", style=None):
+    return response_cache.request_key(SYSTEM, style, model, None, messages)
+
+
+def turn(*contents):
+    roles = ["user", "assistant"]
+    return [{"role": "system", "content": SYSTEM}] + [
+        {"role": roles[index % 2], "content": content}
+        for index, content in enumerate(contents)
+    ]
+
+
+def test_key_ignores_whitespace_and_early_history():
+    assert key(turn("reverse  a list\n")) == key(turn("reverse a list"))
+    assert key(turn("a", "b", "c", "d", "question")) == key(
+        turn("x", "b", "c", "d", "question")
+    )
+    assert key(turn("question")) != key(turn("question"), model="gpt-5.2")
+    assert key(turn("question")) != key(turn("question"), style="Be brief.")
+
+
+def test_put_get_and_replay():
+    cache_key = key(turn("reverse a list"))
+    assert response_cache.get(cache_key) is None
+    response_cache.put(cache_key, "Use items[::-1]" * 10)
+    text = response_cache.get(cache_key)
+    assert text == "Use items[::-1]" * 10
+    assert "".join(event.delta for event in response_cache.replay(text)) == text
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    cache_key = key(turn("reverse a list"))
+    response_cache.put(cache_key, "answer")
+    monkeypatch.setenv("RESPONSE_CACHE_TTL_SECONDS", "0")
+    time.sleep(0.01)
+    assert response_cache.get(cache_key) is None
+    assert not response_cache._entry_path(cache_key).exists()
+
+
+def test_overwriting_an_entry_does_not_grow_the_size(cache_dir):
+    cache_key = key(turn("reverse a list"))
+    response_cache.put(cache_key, "answer")
+    response_cache.put(cache_key, "answer")
+    for _ in range(5):
+        response_cache.put(cache_key, "answer")
+    assert response_cache._total_bytes == response_cache._scan_size()
+
+
+def test_eviction_drops_least_recently_used(monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MAX_BYTES", "1000")
+    keys = [key(turn(f"question {index}")) for index in range(8)]
+    for index, cache_key in enumerate(keys):
+        response_cache.put(cache_key, "x" * 100)
+        # mtimes order the entries for eviction
+        stamp = time.time() - 100 + index
+        os.utime(response_cache._entry_path(cache_key), (stamp, stamp))
+    assert response_cache._scan_size() <= 1000
+    assert response_cache.get(keys[-1]) is not None
+    assert response_cache.get(keys[0]) is None
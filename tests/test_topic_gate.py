@@ -0,0 +1,46 @@
+import json
+from pathlib import Path
+
+import topic_gate
+
+DATASET = Path(__file__).parent.parent / "benchmarks" / "data" / "topic_gate.jsonl"
+
+
+def test_rejects_clearly_off_topic_prompts():
+    result = topic_gate.check(
+        "Which team won the football championship and who was the top player?",
+        "coding",
+    )
+    assert result["reject"]
+    assert result["domain"] == "sports"
+
+
+def test_leaves_ambiguous_prompts_to_the_model():
+    assert not topic_gate.check("make it shorter", "coding")["reject"]
+    # Any keyword of the topic itself keeps the prompt.
+    assert not topic_gate.check(
+        "Write a python script that ranks football teams by score", "coding"
+    )["reject"]
+
+
+def test_topics_without_a_profile_are_never_gated():
+    result = topic_gate.check("Which team won the football league?", "gardening")
+    assert not result["reject"]
+
+    result = topic_gate.check(
+        "Which team won the football league?",
+        "gardening",
+        {"gardening": ["soil", "seed"]},
+    )
+    assert result["reject"]
+
+
+def test_never_rejects_an_on_topic_prompt_of_the_labeled_set():
+    with open(DATASET, encoding="utf-8") as dataset:
+        examples = [json.loads(line) for line in dataset if line.strip()]
+    on_topic = [example for example in examples if not example["off_topic"]]
+    assert on_topic
+    for example in on_topic:
+        assert not topic_gate.check(example["prompt"], example["topic"])["reject"], (
+            example["prompt"]
+        )
@@ -0,0 +1,174 @@
+import json
+from io import BytesIO
+from zipfile import ZipFile
+
+import pytest
+
+import audio_spool
+import tts_jobs
+import tts_scheduler
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TTS_SPOOL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def make_job(texts, **state):
+    entries = [(str(index), text) for index, text in enumerate(texts)]
+    job = tts_jobs.job_id("owner", "upload.zip", entries)
+    state = {
+        "id": job,
+        "owner": "owner",
+        "name": "upload.zip",
+        "kind": "zip",
+        "model": "tts-1",
+        "voice": "alloy",
+        "format": "mp3",
+        "response_format": "mp3",
+        "names": [f"file{index}.mp3" for index in range(len(texts))],
+        "concurrency": 2,
+        "created_at": 0.0,
+        "status": "queued",
+        "failures": {},
+        **state,
+    }
+    audio_spool.write(job, tts_jobs.ENTRIES_NAME, json.dumps(texts).encode())
+    audio_spool.write(job, tts_jobs.STATE_NAME, json.dumps(state).encode())
+    return job
+
+
+def test_finished_job_report_formats(monkeypatch):
+    def convert_batch(texts, on_result, **kwargs):
+        for position in range(len(texts)):
+            on_result(position, b"audio", {"cache_hit": False}, None)
+        return {
+            "jobs": len(texts),
+            "succeeded": len(texts),
+            "failed": 0,
+            "requests": 3,
+            "attempts": 3,
+            "retries": 1,
+            "throttle_events": 1,
+            "request_seconds": 1.0,
+            "wall_seconds": 1.0,
+            "jobs_per_second": 2.0,
+            "requests_per_second": 3.0,
+            "concurrency": 1,
+            "lowest_concurrency": 1,
+            "concurrency_decreases": 1,
+            "retried_jobs": {1: 1},
+        }
+
+    monkeypatch.setattr(tts_scheduler, "convert_batch", convert_batch)
+    job = make_job(["one", "two"])
+    tts_jobs._run(job, None)
+
+    state = tts_jobs.get(job)
+    assert state["status"] == "done"
+    assert state["report"]["retried_jobs"] == {"file1.mp3": 1}
+    lines = tts_scheduler.format_report(state["report"])
+    assert "1 retries over 1 files" in lines[1]
+
+
+def test_format_report_without_retried_jobs():
+    report = {
+        "jobs": 1,
+        "succeeded": 1,
+        "wall_seconds": 1.0,
+        "jobs_per_second": 1.0,
+        "requests_per_second": 1.0,
+        "throttle_events": 1,
+        "retries": 1,
+        "lowest_concurrency": 1,
+        "concurrency": 1,
+    }
+    assert "over 0 files" in tts_scheduler.format_report(report)[1]
+
+
+def test_resubmit_retries_only_failed_entries(monkeypatch):
+    calls = []
+
+    def convert_batch(texts, on_result, **kwargs):
+        calls.append(list(texts))
+        for position, text in enumerate(texts):
+            if text == "two" and len(calls) == 1:
+                on_result(position, None, {}, RuntimeError("boom"))
+            else:
+                on_result(position, b"audio", {"cache_hit": False}, None)
+        return {"retried_jobs": {}}
+
+    monkeypatch.setattr(tts_scheduler, "convert_batch", convert_batch)
+    entries = [("one.mp3", "one"), ("two.mp3", "two"), ("three.mp3", "three")]
+    job = tts_jobs.submit("owner", "upload.zip", entries, api_key="key")
+    tts_jobs._queue.join()
+    assert tts_jobs.get(job)["failures"] == {"two.mp3": "boom"}
+
+    assert tts_jobs.submit("owner", "upload.zip", entries, api_key="key") == job
+    tts_jobs._queue.join()
+    state = tts_jobs.get(job)
+    assert calls == [["one", "two", "three"], ["two"]]
+    assert state["status"] == "done" and state["failures"] == {}
+
+    # Nothing left to do: the finished job is reused as is.
+    tts_jobs.submit("owner", "upload.zip", entries, api_key="key")
+    tts_jobs._queue.join()
+    assert len(calls) == 2
+
+
+def test_restart_does_not_resume_with_the_default_key(monkeypatch):
+    monkeypatch.setattr(tts_jobs, "_workers", [])
+    own_key = make_job(["one"], status="running", own_key=True)
+    default_key = make_job(["two"], status="running", own_key=False)
+    resumed = []
+    monkeypatch.setattr(tts_jobs, "_run", lambda job, api_key: resumed.append(job))
+
+    tts_jobs.start()
+    tts_jobs._queue.join()
+    assert resumed == [default_key]
+    assert tts_jobs.get(own_key)["status"] == tts_jobs.INTERRUPTED_STATUS
+
+
+def test_zip_entries_skip_metadata_and_keep_undecodable_files():
+    upload = BytesIO()
+    with ZipFile(upload, "w") as zip_file:
+        zip_file.writestr("notes/", b"")
+        zip_file.writestr("notes/one.txt", "one".encode("utf-8"))
+        zip_file.writestr("notes/two.txt", "zwei \u00fc".encode("latin-1"))
+        zip_file.writestr("__MACOSX/notes/._one.txt", b"\x00\x05\x16\x07\xff")
+        zip_file.writestr("notes/.DS_Store", b"\x00\x00\x00\x01Bud1")
+        zip_file.writestr("notes/cover.png", b"\x89PNG")
+        zip_file.writestr("README", b"three")
+
+    with ZipFile(upload) as zip_file:
+        entries = tts_jobs.zip_entries(zip_file, "mp3")
+    assert entries == [
+        ("notes/one.mp3", "one"),
+        ("notes/two.mp3", None),
+        ("README.mp3", "three"),
+    ]
+
+
+def test_undecodable_entry_fails_alone(monkeypatch):
+    calls = []
+
+    def convert_batch(texts, on_result, **kwargs):
+        calls.append(list(texts))
+        for position in range(len(texts)):
+            on_result(position, b"audio", {"cache_hit": False}, None)
+        return {"retried_jobs": {}}
+
+    monkeypatch.setattr(tts_scheduler, "convert_batch", convert_batch)
+    entries = [("one.mp3", "one"), ("two.mp3", None), ("three.mp3", "three")]
+    job = tts_jobs.submit("owner", "upload.zip", entries)
+    tts_jobs._queue.join()
+
+    state = tts_jobs.get(job)
+    assert calls == [["one", "three"]]
+    assert state["status"] == "done"
+    assert state["failures"] == {"two.mp3": tts_jobs.NOT_TEXT_ERROR}
+    assert [name for name, _ in tts_jobs.finished_entries(state)] == [
+        "one.mp3",
+        "three.mp3",
+    ]
@@ -0,0 +1,49 @@
+import email.utils
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import tts_scheduler
+
+
+def throttled(**headers):
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"retry-after-ms": "1500"}, 1.5),
+        ({"retry-after": "3"}, 3.0),
+        ({"retry-after-ms": "-5"}, 0.0),
+        ({}, None),
+    ],
+)
+def test_retry_after(headers, expected):
+    assert tts_scheduler._retry_after(throttled(**headers)) == expected
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"retry-after-ms": "soon"}, None),
+        ({"retry-after-ms": "soon", "retry-after": "2"}, 2.0),
+        ({"retry-after-ms": "inf", "retry-after": "nan"}, None),
+        ({"retry-after": "not a date"}, None),
+        ({"retry-after-ms": ""}, None),
+    ],
+)
+def test_retry_after_garbage_headers(headers, expected):
+    assert tts_scheduler._retry_after(throttled(**headers)) == expected
+
+
+def test_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < tts_scheduler._retry_after(throttled(**{"retry-after": value})) <= 60
+
+
+def test_backoff_without_retry_after():
+    assert 0 <= tts_scheduler.backoff_seconds(3, None) <= (
+        tts_scheduler.BACKOFF_BASE_SECONDS * 2**3
+    )
@@ -0,0 +1,91 @@
+import array
+import math
+import shutil
+import struct
+import wave
+from io import BytesIO
+
+import pytest
+
+import utils
+
+SAMPLE_RATE = 24000
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg not installed"
+)
+# pydub decodes anything but WAV with ffprobe's help.
+needs_ffprobe = pytest.mark.skipif(
+    shutil.which("ffprobe") is None, reason="ffprobe not installed"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setenv("METRICS_ENABLED", "0")
+
+
+def tone(seconds=1.0):
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(SAMPLE_RATE)
+        audio.writeframes(
+            array.array(
+                "h",
+                (
+                    int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+                    for i in range(int(seconds * SAMPLE_RATE))
+                ),
+            ).tobytes()
+        )
+    return buffer.getvalue()
+
+
+def frames(data):
+    with wave.open(BytesIO(data), "rb") as audio:
+        return audio.getnframes()
+
+
+def test_fix_wav_sizes_of_streamed_header():
+    data = bytearray(tone())
+    # What ffmpeg leaves behind when it can't seek back in its output.
+    struct.pack_into("<I", data, 4, 0xFFFFFFFF)
+    data_offset = data.index(b"data")
+    struct.pack_into("<I", data, data_offset + 4, 0xFFFFFFFF)
+
+    assert frames(utils._fix_wav_sizes(bytes(data))) == SAMPLE_RATE
+
+
+def test_fix_wav_sizes_leaves_other_formats_alone():
+    assert utils._fix_wav_sizes(b"fLaC\0\0\0\0") == b"fLaC\0\0\0\0"
+
+
+def test_convert_to_wav_without_ffmpeg():
+    output = utils.convert_audio(BytesIO(tone()), "wav", "wav", streaming=False)
+    assert frames(output) == SAMPLE_RATE
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize(
+    "streaming", [True, pytest.param(False, marks=needs_ffprobe)]
+)
+def test_flac_to_wav_is_readable(streaming):
+    flac = utils.convert_audio_stream(BytesIO(tone()), "wav", "flac")
+    output = utils.convert_audio(BytesIO(flac), "flac", "wav", streaming=streaming)
+    assert frames(output) == SAMPLE_RATE
+    assert struct.unpack_from("<I", output, 4)[0] == len(output) - 8
+
+
+def test_split_text_keeps_chunks_under_the_limit():
+    text = "\n\n".join(
+        ["Short paragraph."]
+        + [" ".join(f"Sentence {index} is here." for index in range(40))]
+        + ["x" * 250]
+    )
+    chunks = utils.split_text(text, max_chars=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "").replace("\n", "") == text.replace(
+        " ", ""
+    ).replace("\n", "")
@@ -0,0 +1,182 @@
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Keyword profiles for common domains. A whitelisted topic is gated only when
+# it matches one of these (by name or alias); every other profile is evidence
+# that a prompt is off-topic.
+PROFILES = {
+    "coding": {
+        "aliases": ["programming", "code", "software", "software development"],
+        "keywords": [
+            "algorithm", "api", "array", "async", "bash", "bug", "c++", "c#",
+            "class", "code", "compile", "compiler", "css", "database", "debug",
+            "deploy", "django", "docker", "exception", "function", "git",
+            "github", "golang", "html", "http", "java", "javascript", "json",
+            "kotlin", "kubernetes", "lambda", "library", "linux", "loop",
+            "method", "npm", "pandas", "pip", "program", "programming",
+            "python", "query", "react", "recursion", "regex", "repository",
+            "rust", "script", "sql", "stack trace", "string", "syntax",
+            "terminal", "typescript", "unit test", "variable", "web app",
+        ],
+    },
+    "cooking": {
+        "aliases": ["food", "recipes", "baking"],
+        "keywords": [
+            "bake", "baking", "boil", "bread", "breakfast", "cake", "cheese",
+            "chicken", "chocolate", "cook", "cooking", "cuisine", "dessert",
+            "dinner", "dish", "dough", "flour", "fry", "grill", "ingredient",
+            "kitchen", "lunch", "meal", "oven", "pasta", "pizza", "recipe",
+            "restaurant", "salad", "sauce", "soup", "spice", "steak", "vegan",
+        ],
+    },
+    "sports": {
+        "aliases": ["sport", "fitness"],
+        "keywords": [
+            "athlete", "baseball", "basketball", "champion", "championship",
+            "coach", "cricket", "football", "goal", "golf", "hockey", "league",
+            "match", "nba", "nfl", "olympic", "player", "playoff", "premier league",
+            "score", "soccer", "stadium", "team", "tennis", "tournament",
+            "world cup", "workout",
+        ],
+    },
+    "entertainment": {
+        "aliases": ["movies", "music", "celebrities"],
+        "keywords": [
+            "actor", "actress", "album", "band", "celebrity", "cinema",
+            "concert", "episode", "film", "gossip", "hollywood", "lyrics",
+            "movie", "netflix", "oscar", "singer", "song", "tv show", "tv series",
+        ],
+    },
+    "politics": {
+        "aliases": ["government"],
+        "keywords": [
+            "ballot", "campaign", "congress", "conservative", "democrat",
+            "election", "government", "liberal", "parliament", "party",
+            "policy", "politician", "politics", "president", "republican",
+            "senate", "senator", "vote", "voting",
+        ],
+    },
+    "health": {
+        "aliases": ["medicine", "medical"],
+        "keywords": [
+            "diagnosis", "diet", "disease", "doctor", "headache", "hospital",
+            "illness", "medication", "medicine", "pain", "pill", "pregnancy",
+            "symptom", "therapy", "vaccine", "vitamin", "weight loss",
+        ],
+    },
+    "travel": {
+        "aliases": ["tourism"],
+        "keywords": [
+            "airline", "airport", "beach", "flight", "holiday", "hotel",
+            "itinerary", "luggage", "passport", "resort", "sightseeing",
+            "tourist", "travel", "trip", "vacation", "visa",
+        ],
+    },
+    "finance": {
+        "aliases": ["investing", "money"],
+        "keywords": [
+            "bitcoin", "bond", "budget", "credit card", "crypto", "dividend",
+            "invest", "investment", "loan", "mortgage", "portfolio",
+            "retirement", "savings", "stock", "stock market", "tax",
+        ],
+    },
+    "relationships": {
+        "aliases": ["dating"],
+        "keywords": [
+            "boyfriend", "breakup", "crush", "date", "dating", "divorce",
+            "girlfriend", "husband", "marriage", "partner", "romantic",
+            "wedding", "wife",
+        ],
+    },
+}
+
+# Off-topic score needed to reject without asking the model; with the IDF
+# weights below this takes at least two distinct off-topic keywords.
+REJECT_SCORE = 5.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+
+
+def _tokens(text: str) -> List[str]:
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+@lru_cache(maxsize=16)
+def _build(
+    extra_keywords: Tuple[Tuple[str, Tuple[str, ...]], ...]
+) -> Tuple[Dict[str, str], Dict[str, List[Tuple[str, float]]]]:
+    """Topic-name lookup and term index for the profiles.
+
+    The index maps each term to ``[(profile, idf weight)]``; terms shared by
+    several profiles say less about which one a prompt belongs to.
+    """
+    profiles = {
+        name: set(profile["keywords"]) | set(profile["aliases"]) | {name}
+        for name, profile in PROFILES.items()
+    }
+    names = {
+        alias: name for name, profile in PROFILES.items() for alias in profile["aliases"]
+    }
+    names.update((name, name) for name in PROFILES)
+    for topic, keywords in extra_keywords:
+        profiles.setdefault(topic, {topic}).update(keywords)
+        names.setdefault(topic, topic)
+
+    owners: Dict[str, List[str]] = {}
+    for name, terms in profiles.items():
+        for term in terms:
+            owners.setdefault(term.lower(), []).append(name)
+    total = len(profiles)
+    index = {
+        term: [(name, 1.0 + math.log(total / len(owner_names))) for name in owner_names]
+        for term, owner_names in owners.items()
+    }
+    return names, index
+
+
+def check(
+    prompt: str,
+    topic: str,
+    extra_keywords: Optional[Mapping[str, Iterable[str]]] = None,
+) -> Dict[str, Any]:
+    """Score a prompt against the whitelisted topic before any model call.
+
+    Only clear cases are rejected: no keyword of the topic and a strong match
+    for another profile. Everything else (including short follow-ups like
+    "make it shorter") is left for the model to judge. ``extra_keywords``
+    maps topic names to additional keywords, adding profiles for topics that
+    have none.
+    """
+    names, index = _build(
+        tuple(
+            sorted(
+                (name.strip().lower(), tuple(keyword.lower() for keyword in keywords))
+                for name, keywords in (extra_keywords or {}).items()
+            )
+        )
+    )
+    target = names.get(topic.strip().lower())
+    result = {"reject": False, "topic_score": 0.0, "off_topic_score": 0.0, "domain": None}
+    if target is None:
+        return result
+
+    scores: Dict[str, float] = {}
+    for token in set(_tokens(prompt)):
+        matches = index.get(token)
+        if matches is None and len(token) > 3 and token.endswith("s"):
+            matches = index.get(token[:-1])
+        for name, weight in matches or ():
+            scores[name] = scores.get(name, 0.0) + weight
+
+    result["topic_score"] = scores.pop(target, 0.0)
+    if scores:
+        domain = max(scores, key=scores.get)
+        result["domain"] = domain
+        result["off_topic_score"] = scores[domain]
+    result["reject"] = (
+        result["topic_score"] == 0.0 and result["off_topic_score"] >= REJECT_SCORE
+    )
+    return result
@@ -0,0 +1,329 @@
+"""Process-level queue for text-to-speech conversions.
+
+Jobs run on worker threads, outside any Streamlit script run, so reruns and
+page reloads don't stop them; the page submits a job and polls its state.
+Each job lives in an audio_spool directory: ``job.json`` with its state,
+``entries.json`` with the texts to convert and one audio file per finished
+entry. A job that was interrupted (e.g. by a restart) picks up from the
+entries already on disk. API keys are never written to disk, so a job
+submitted with its own key waits for the page to resubmit it after a restart.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import audio_spool
+import tts_scheduler
+
+# One job at a time keeps every conversion under the same per-model rate
+# limit; each job already sends its requests in parallel.
+WORKERS = int(os.environ.get("TTS_JOB_WORKERS", 1))
+ACTIVE_STATUSES = ("queued", "running")
+# Cut short by a restart and waiting to be resubmitted with its API key
+INTERRUPTED_STATUS = "interrupted"
+# Failure recorded for an entry whose bytes weren't UTF-8 text
+NOT_TEXT_ERROR = "not UTF-8 text"
+STATE_NAME = "job.json"
+ENTRIES_NAME = "entries.json"
+
+_lock = threading.Lock()
+_queue: "queue.Queue[Tuple[str, Optional[str]]]" = queue.Queue()
+_workers: List[threading.Thread] = []
+# Jobs queued or running in this process
+_active = set()
+
+
+def job_id(
+    owner: str,
+    name: str,
+    entries: Sequence[Tuple[str, Optional[str]]],
+    **options: str,
+) -> str:
+    """Same upload and settings, same job: resubmitting reattaches to it."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([owner, name, sorted(options.items())]).encode("utf-8"))
+    for entry_name, text in entries:
+        digest.update(json.dumps([entry_name, text]).encode("utf-8"))
+    return "job-" + digest.hexdigest()[:24]
+
+
+def decode_text(data: bytes) -> Optional[str]:
+    """The uploaded bytes as text, or None if they aren't UTF-8."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def zip_entries(zip_file: ZipFile, format: str) -> List[Tuple[str, Optional[str]]]:
+    """(output file name, text) for the text files in an uploaded zip.
+
+    Folders, hidden files (including macOS's ``__MACOSX/`` and ``._*``
+    metadata) and files that aren't text by their extension are left out.
+    A file that isn't UTF-8 gets None for its text and fails on its own when
+    the job runs.
+    """
+    entries = []
+    for info in zip_file.infolist():
+        parts = info.filename.split("/")
+        if info.is_dir() or any(
+            part.startswith(".") or part == "__MACOSX" for part in parts
+        ):
+            continue
+        mime_type, _ = mimetypes.guess_type(parts[-1])
+        if mime_type is not None and not mime_type.startswith("text/"):
+            continue
+        entries.append(
+            (
+                f"{os.path.splitext(info.filename)[0]}.{format}",
+                decode_text(zip_file.read(info)),
+            )
+        )
+    return entries
+
+
+def _read_json(job: str, name: str) -> Optional[Any]:
+    try:
+        return json.loads((audio_spool.spool_path(job) / name).read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state: Dict[str, Any]) -> None:
+    state["updated_at"] = time.time()
+    audio_spool.write(state["id"], STATE_NAME, json.dumps(state).encode("utf-8"))
+
+
+def get(job: str) -> Optional[Dict[str, Any]]:
+    """The job's state, or None if it doesn't exist (or expired)."""
+    return _read_json(job, STATE_NAME)
+
+
+def list_jobs(owner: str) -> List[Dict[str, Any]]:
+    """The owner's jobs, newest first."""
+    jobs = []
+    for spool_id in audio_spool.spool_ids():
+        if spool_id.startswith("job-"):
+            state = get(spool_id)
+            if state is not None and state.get("owner") == owner:
+                jobs.append(state)
+    return sorted(jobs, key=lambda state: state["created_at"], reverse=True)
+
+
+def entry_name(state: Dict[str, Any], index: int) -> str:
+    return f"entries/{index:05d}.{state['format']}"
+
+
+def finished_entries(state: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(file name, path) of every converted entry, in upload order."""
+    spool_dir = audio_spool.spool_path(state["id"])
+    return [
+        (name, str(spool_dir / entry_name(state, index)))
+        for index, name in enumerate(state["names"])
+        if (spool_dir / entry_name(state, index)).exists()
+    ]
+
+
+def output_path(state: Dict[str, Any]) -> Optional[str]:
+    if state.get("output") is None:
+        return None
+    path = audio_spool.spool_path(state["id"]) / state["output"]
+    return str(path) if path.exists() else None
+
+
+def submit(
+    owner: str,
+    name: str,
+    entries: Sequence[Tuple[str, Optional[str]]],
+    kind: str = "zip",
+    model: str = "tts-1",
+    voice: str = "alloy",
+    format: str = "mp3",
+    response_format: Optional[str] = None,
+    api_key: Optional[str] = None,
+    concurrency: int = 4,
+) -> str:
+    """Queue converting entries, (file name, text) pairs, and return the job id.
+
+    Entries whose text is None (see decode_text) are reported as failed.
+
+    A still-running job for the same upload is reused, as is a finished one
+    where every entry converted; otherwise the job runs again for the
+    entries that are missing. ``kind`` is "zip" (output is a zip of every
+    entry) or "file" (a single entry, output as is). The api_key is only
+    kept in memory, so after a restart a job that had one waits to be
+    submitted again.
+    """
+    options = {
+        "kind": kind,
+        "model": model,
+        "voice": voice,
+        "format": format,
+        "response_format": response_format or format,
+    }
+    job = job_id(owner, name, entries, **options)
+    start()
+    with _lock:
+        state = get(job)
+        if state is not None and (
+            job in _active
+            or (
+                state["status"] == "done"
+                and not state["failures"]
+                and output_path(state)
+            )
+        ):
+            return job
+        if _read_json(job, ENTRIES_NAME) is None:
+            audio_spool.write(
+                job, ENTRIES_NAME, json.dumps([text for _, text in entries]).encode()
+            )
+        if state is None:
+            state = {
+                "id": job,
+                "owner": owner,
+                "name": name,
+                **options,
+                "names": [entry_name for entry_name, _ in entries],
+                "concurrency": concurrency,
+                "created_at": time.time(),
+            }
+        state.update(
+            status="queued",
+            own_key=api_key is not None,
+            total=len(entries),
+            completed=0,
+            cache_hits=0,
+            failures={},
+            output=None,
+            error=None,
+        )
+        _write_state(state)
+        _active.add(job)
+        _queue.put((job, api_key))
+    return job
+
+
+def start() -> None:
+    """Start this process's workers and requeue jobs left unfinished by an
+    earlier one. Cheap to call on every page run."""
+    with _lock:
+        if _workers:
+            return
+        for index in range(max(1, WORKERS)):
+            worker = threading.Thread(
+                target=_work, name=f"tts-job-{index}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+        interrupted = []
+        for spool_id in audio_spool.spool_ids():
+            if not spool_id.startswith("job-"):
+                continue
+            state = _read_json(spool_id, STATE_NAME)
+            if state is None or state["status"] not in ACTIVE_STATUSES:
+                continue
+            if state.get("own_key"):
+                # Resuming with the default key would bill someone else.
+                state.update(
+                    status=INTERRUPTED_STATUS,
+                    error="Interrupted by a restart; convert again to resume",
+                )
+                _write_state(state)
+            else:
+                interrupted.append(spool_id)
+        for job in interrupted:
+            _active.add(job)
+            _queue.put((job, None))
+
+
+def _work() -> None:
+    while True:
+        job, api_key = _queue.get()
+        try:
+            _run(job, api_key)
+        except Exception as error:
+            state = _read_json(job, STATE_NAME)
+            if state is not None:
+                state.update(status="failed", error=str(error))
+                _write_state(state)
+        finally:
+            with _lock:
+                _active.discard(job)
+            _queue.task_done()
+
+
+def _run(job: str, api_key: Optional[str]) -> None:
+    state = _read_json(job, STATE_NAME)
+    texts = _read_json(job, ENTRIES_NAME)
+    if state is None or texts is None:
+        return
+    spool_dir = audio_spool.session_dir(job)
+    # Entries are written atomically, so any file on disk is complete.
+    pending = [
+        index
+        for index in range(len(texts))
+        if not (spool_dir / entry_name(state, index)).exists()
+    ]
+    done = len(texts) - len(pending)
+    state.update(
+        status="running",
+        completed=done,
+        resumed=done,
+        cache_hits=0,
+        failures={
+            state["names"][index]: NOT_TEXT_ERROR
+            for index in pending
+            if texts[index] is None
+        },
+    )
+    pending = [index for index in pending if texts[index] is not None]
+    _write_state(state)
+
+    def entry_done(position, audio_data, stats, error):
+        index = pending[position]
+        if error is None:
+            audio_spool.write(job, entry_name(state, index), audio_data)
+            state["completed"] += 1
+            state["cache_hits"] += stats["cache_hit"]
+            if state["kind"] == "file":
+                state["stats"] = stats
+        else:
+            state["failures"][state["names"][index]] = str(error)
+        _write_state(state)
+
+    report = tts_scheduler.convert_batch(
+        [texts[index] for index in pending],
+        entry_done,
+        model=state["model"],
+        voice=state["voice"],
+        response_format=state["response_format"],
+        output_format=state["format"],
+        api_key=api_key,
+        max_concurrency=state["concurrency"],
+    )
+    # Keyed by entry name: batch positions mean nothing once the job resumes.
+    report["retried_jobs"] = {
+        state["names"][pending[position]]: retries
+        for position, retries in report["retried_jobs"].items()
+    }
+    state["report"] = report
+
+    if state["completed"] and state["kind"] == "zip":
+        output = "output.zip"
+        tmp_path = spool_dir / f".{output}.tmp"
+        with ZipFile(tmp_path, "w", ZIP_DEFLATED) as output_zip:
+            for name, path in finished_entries(state):
+                output_zip.write(path, arcname=name)
+        os.replace(tmp_path, spool_dir / output)
+        state["output"] = output
+    elif state["completed"]:
+        state["output"] = entry_name(state, 0)
+    state["status"] = "done" if state["completed"] else "failed"
+    _write_state(state)
@@ -0,0 +1,441 @@
+"""Rate-limit-aware asyncio scheduler for batches of speech requests.
+
+Every request waits for its model's token bucket and for a slot under an
+adaptive concurrency cap. Throttled and transient failures are retried with
+exponential backoff and full jitter, never sooner than the server's
+Retry-After. Retries and throttling are counted per job for the batch report.
+"""
+import asyncio
+import email.utils
+import math
+import os
+import random
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import openai
+
+import audio_cache
+import clients
+import metrics
+import utils
+
+# Requests per minute per model. Override with e.g.
+# TTS_RATE_LIMITS="tts-1=50,tts-1-hd=20" (or the same top-level secret).
+DEFAULT_RATE_LIMITS = {"tts-1": 50.0, "tts-1-hd": 50.0}
+DEFAULT_RATE_LIMIT = 50.0
+# A bucket holds this many seconds' worth of requests, so a batch may start
+# with a short burst.
+BURST_SECONDS = 10
+MAX_ATTEMPTS = int(os.environ.get("TTS_MAX_ATTEMPTS", 6))
+BACKOFF_BASE_SECONDS = float(os.environ.get("TTS_BACKOFF_BASE", 0.5))
+BACKOFF_MAX_SECONDS = float(os.environ.get("TTS_BACKOFF_MAX", 30))
+
+
+def rate_limits() -> Dict[str, float]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in os.environ.get("TTS_RATE_LIMITS", "").split(","):
+        model, _, value = item.partition("=")
+        if value.strip():
+            limits[model.strip()] = float(value)
+    return limits
+
+
+class TokenBucket:
+    """Lets through ``rate`` requests per second on average."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in order.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for this model, e.g. for a Retry-After."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+
+class AdaptiveConcurrency:
+    """Caps requests in flight; halves the cap when throttled and raises it
+    by one after a cap's worth of successes in a row."""
+
+    def __init__(self, maximum: int):
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.lowest = self.maximum
+        self.in_flight = 0
+        self.decreases = 0
+        self._successes = 0
+        self._decreased_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, throttled: bool, succeeded: bool) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                # Requests already in flight when the cap dropped were sent
+                # under the old cap; their 429s don't call for another cut.
+                if started >= self._decreased_at and self.limit > 1:
+                    self.limit = max(1, self.limit // 2)
+                    self.lowest = min(self.lowest, self.limit)
+                    self.decreases += 1
+                    self._decreased_at = time.monotonic()
+                self._successes = 0
+            elif succeeded:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+def backoff_seconds(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, but never before Retry-After."""
+    delay = random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+    if retry_after is not None:
+        # Jitter on top, so throttled requests don't all return at once.
+        delay = max(delay, retry_after + random.uniform(0, BACKOFF_BASE_SECONDS))
+    return delay
+
+
+def _seconds(value: Optional[str], scale: float = 1.0) -> Optional[float]:
+    try:
+        seconds = float(value) / scale
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, seconds) if math.isfinite(seconds) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """The server's requested delay; None (plain backoff) if it sent none we
+    can read."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    seconds = _seconds(headers.get("retry-after-ms"), 1000)
+    if seconds is not None:
+        return seconds
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    seconds = _seconds(value)
+    if seconds is not None:
+        return seconds
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class Scheduler:
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI,
+        max_concurrency: int = 4,
+        limits: Optional[Dict[str, float]] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.client = client
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.limits = rate_limits() if limits is None else limits
+        self.max_attempts = max(1, max_attempts)
+        self.jobs: Dict[Any, Dict[str, Any]] = {}
+        self.throttle_events = 0
+        self.started = time.monotonic()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, model: str) -> TokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            rate = self.limits.get(model, DEFAULT_RATE_LIMIT) / 60
+            bucket = TokenBucket(rate, max(1.0, rate * BURST_SECONDS))
+            self._buckets[model] = bucket
+        return bucket
+
+    def job(self, job_id: Any) -> Dict[str, Any]:
+        return self.jobs.setdefault(
+            job_id,
+            {
+                "status": "pending",
+                "requests": 0,
+                "attempts": 0,
+                "retries": 0,
+                "throttled": 0,
+                "request_seconds": 0.0,
+                "error": None,
+            },
+        )
+
+    async def speech(
+        self, job_id: Any, text: str, model: str, voice: str, response_format: str
+    ) -> bytes:
+        """One speech request, retried until it succeeds or gives up."""
+        job = self.job(job_id)
+        job["requests"] += 1
+        bucket = self.bucket(model)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            started = await self.concurrency.acquire()
+            attempt += 1
+            job["attempts"] += 1
+            error = None
+            try:
+                with metrics.timer(
+                    "tts",
+                    model=model,
+                    voice=voice,
+                    response_format=response_format,
+                    bytes_in=len(text.encode("utf-8")),
+                    attempt=attempt,
+                ) as measurement:
+                    response = await self.client.audio.speech.create(
+                        model=model,
+                        voice=voice,
+                        input=text,
+                        response_format=response_format,
+                    )
+                    audio_data = response.content
+                    measurement["bytes_out"] = len(audio_data)
+            except openai.OpenAIError as caught:
+                error = caught
+            throttled = isinstance(error, openai.RateLimitError)
+            await self.concurrency.release(
+                started, throttled=throttled, succeeded=error is None
+            )
+            job["request_seconds"] += time.monotonic() - started
+            if error is None:
+                return audio_data
+            if throttled:
+                job["throttled"] += 1
+                self.throttle_events += 1
+            if not _retryable(error) or attempt >= self.max_attempts:
+                raise error
+            retry_after = _retry_after(error)
+            if throttled and retry_after:
+                bucket.pause(retry_after)
+            job["retries"] += 1
+            await asyncio.sleep(backoff_seconds(attempt, retry_after))
+
+    def report(self) -> Dict[str, Any]:
+        """Throughput, throttling and per-job retries of the batch so far."""
+        wall_seconds = time.monotonic() - self.started
+        jobs = list(self.jobs.values())
+        requests = sum(job["requests"] for job in jobs)
+        return {
+            "jobs": len(jobs),
+            "succeeded": sum(job["status"] == "done" for job in jobs),
+            "failed": sum(job["status"] == "failed" for job in jobs),
+            "requests": requests,
+            "attempts": sum(job["attempts"] for job in jobs),
+            "retries": sum(job["retries"] for job in jobs),
+            "throttle_events": self.throttle_events,
+            "request_seconds": round(
+                sum(job["request_seconds"] for job in jobs), 3
+            ),
+            "wall_seconds": round(wall_seconds, 3),
+            "jobs_per_second": round(len(jobs) / wall_seconds, 3)
+            if wall_seconds
+            else 0.0,
+            "requests_per_second": round(requests / wall_seconds, 3)
+            if wall_seconds
+            else 0.0,
+            "concurrency": self.concurrency.limit,
+            "lowest_concurrency": self.concurrency.lowest,
+            "concurrency_decreases": self.concurrency.decreases,
+            "retried_jobs": {
+                job_id: job["retries"]
+                for job_id, job in self.jobs.items()
+                if job["retries"]
+            },
+        }
+
+
+async def convert_text(
+    scheduler: Scheduler,
+    job_id: Any,
+    text: str,
+    model: str = "tts-1",
+    voice: str = "alloy",
+    response_format: str = "mp3",
+    output_format: Optional[str] = None,
+    max_chars: int = utils.TTS_MAX_CHARS,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Synthesize text of any length, its requests going through the scheduler.
+
+    Short text is a single request in response_format, converted to
+    output_format if that differs. Longer text is split on natural boundaries
+    and the chunks are stitched together. Finished audio and individual
+    chunks are cached on disk, so re-running the same text (or a document
+    with one changed paragraph) is cheap. Decoding and stitching run in a
+    worker thread.
+    """
+    output_format = output_format or response_format
+    key = audio_cache.cache_key(text, model, voice, response_format, output_format)
+    audio_data = audio_cache.get(key)
+    if audio_data is not None:
+        return audio_data, {"chunks": 0, "cached_chunks": 0, "cache_hit": True}
+
+    chunks = utils.split_text(text, max_chars=max_chars) or [text]
+    chunk_format = response_format if len(chunks) == 1 else utils.CHUNK_FORMAT
+    cached_chunks = 0
+
+    async def synthesize(chunk):
+        nonlocal cached_chunks
+        chunk_key = None
+        if len(chunks) > 1:
+            chunk_key = audio_cache.cache_key(chunk, model, voice, chunk_format)
+            audio_data = audio_cache.get(chunk_key)
+            if audio_data is not None:
+                cached_chunks += 1
+                return audio_data
+        audio_data = await scheduler.speech(job_id, chunk, model, voice, chunk_format)
+        if chunk_key is not None:
+            audio_cache.put(chunk_key, audio_data)
+        return audio_data
+
+    results = await asyncio.gather(*(synthesize(chunk) for chunk in chunks))
+    if len(chunks) > 1:
+        audio_data = await asyncio.to_thread(
+            utils.stitch_audio, results, chunk_format, output_format
+        )
+    elif output_format != response_format:
+        audio_data = await asyncio.to_thread(
+            utils.convert_audio, BytesIO(results[0]), response_format, output_format
+        )
+    else:
+        audio_data = results[0]
+    audio_cache.put(key, audio_data)
+    return audio_data, {
+        "chunks": len(chunks),
+        "cached_chunks": cached_chunks,
+        "cache_hit": False,
+    }
+
+
+async def _convert_batch(
+    texts, on_result, client, max_concurrency, limits, **options
+):
+    scheduler = Scheduler(client, max_concurrency=max_concurrency, limits=limits)
+    # Bounds the texts being prepared at once; requests are capped separately.
+    pending = asyncio.Semaphore(max(1, max_concurrency) * 2)
+
+    async def run(index, text):
+        async with pending:
+            job = scheduler.job(index)
+            job["status"] = "running"
+            try:
+                audio_data, stats = await convert_text(
+                    scheduler, index, text, **options
+                )
+            except Exception as error:
+                job["status"] = "failed"
+                job["error"] = str(error)
+                on_result(index, None, None, error)
+                return
+            job["status"] = "done"
+            on_result(index, audio_data, stats, None)
+
+    try:
+        await asyncio.gather(*(run(index, text) for index, text in enumerate(texts)))
+    finally:
+        await client.close()
+    return scheduler.report()
+
+
+def convert_batch(
+    texts: Sequence[str],
+    on_result: Callable[
+        [int, Optional[bytes], Optional[Dict], Optional[Exception]], None
+    ],
+    model: str = "tts-1",
+    voice: str = "alloy",
+    response_format: str = "mp3",
+    output_format: Optional[str] = None,
+    api_key: Optional[str] = None,
+    max_concurrency: int = 4,
+    limits: Optional[Dict[str, float]] = None,
+    max_chars: int = utils.TTS_MAX_CHARS,
+) -> Dict[str, Any]:
+    """Convert texts on a private event loop and return the batch report.
+
+    ``on_result(index, audio, stats, error)`` is called on the calling
+    thread as each text finishes, in completion order. Texts longer than
+    ``max_chars`` are synthesized in chunks.
+    """
+    # Retries are the scheduler's job; the client's own would hide 429s.
+    client = clients.new_async_client(api_key or None, max_retries=0)
+    return asyncio.run(
+        _convert_batch(
+            texts,
+            on_result,
+            client,
+            max_concurrency,
+            limits,
+            model=model,
+            voice=voice,
+            response_format=response_format,
+            output_format=output_format,
+            max_chars=max_chars,
+        )
+    )
+
+
+def format_report(report: Dict[str, Any]) -> List[str]:
+    lines = [
+        f"{report['succeeded']}/{report['jobs']} files "
+        f"in {report['wall_seconds']:.1f}s "
+        f"({report['jobs_per_second']:.2f} files/s, "
+        f"{report['requests_per_second']:.2f} requests/s)",
+    ]
+    if report["throttle_events"] or report["retries"]:
+        lines.append(
+            f"{report['throttle_events']} throttled responses, "
+            f"{report['retries']} retries over "
+            f"{len(report.get('retried_jobs', ()))} files; "
+            f"parallel requests went down to {report['lowest_concurrency']} "
+            f"and ended at {report['concurrency']}"
+        )
+    return lines
@@ -1,5 +1,26 @@
-import openai
+import re
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from io import BytesIO
+
 import pydub
+import pydub.silence
+
+import metrics
+
+# The speech endpoint rejects inputs longer than this many characters
+TTS_MAX_CHARS = 4096
+# Lossless intermediate for chunks that get decoded and stitched together
+CHUNK_FORMAT = "flac"
+# Silence kept on each side of a join, so chunks don't run into each other
+JOIN_SILENCE_MS = 150
+# ffmpeg muxer/demuxer names where they differ from our format names
+FFMPEG_INPUT_FORMATS = {"opus": "ogg"}
+FFMPEG_OUTPUT_FORMATS = {"aac": "adts"}
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 def format_messages(messages):
@@ -10,29 +31,181 @@ def format_messages(messages):
     return messages_string
 
 
-def text_to_speech(text, model="tts-1", voice="alloy", response_format="mp3"):
-    import streamlit as st
+def convert_audio_stream(audio_file, input_format, output_format):
+    """Convert by piping bytes through ffmpeg, never decoding into Python.
+
+    WAV output gets its header sizes filled in afterwards, since ffmpeg can't
+    seek back in a pipe to write them. Raises FileNotFoundError without ffmpeg and RuntimeError when ffmpeg
+    can't convert from a pipe (e.g. inputs that need seeking).
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise FileNotFoundError("ffmpeg not found")
+    process = subprocess.Popen(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            FFMPEG_INPUT_FORMATS.get(input_format, input_format),
+            "-i",
+            "pipe:0",
+            "-vn",
+            "-f",
+            FFMPEG_OUTPUT_FORMATS.get(output_format, output_format),
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    errors = []
+    started = time.perf_counter()
+    bytes_in = 0
+    bytes_out = 0
 
-    # Use OpenAI API key from session state if available, otherwise default
-    api_key = st.session_state.get("OPENAI_API_KEY")
-    if api_key:
-        client = openai.OpenAI(api_key=api_key)
-    else:
-        client = openai.OpenAI()
+    def feed():
+        nonlocal bytes_in
+        try:
+            while chunk := audio_file.read(STREAM_CHUNK_SIZE):
+                bytes_in += len(chunk)
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg gave up early; its exit status says why.
+            pass
+        finally:
+            process.stdin.close()
+
+    def drain_errors():
+        errors.append(process.stderr.read())
+
+    threads = [threading.Thread(target=feed), threading.Thread(target=drain_errors)]
+    for thread in threads:
+        thread.start()
+    output_chunks = []
+    while chunk := process.stdout.read(STREAM_CHUNK_SIZE):
+        bytes_out += len(chunk)
+        output_chunks.append(chunk)
+    process.wait()
+    for thread in threads:
+        thread.join()
+    if process.returncode != 0:
+        message = b"".join(errors).decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg failed: {message}")
+    metrics.record(
+        "convert",
+        method="ffmpeg",
+        input_format=input_format,
+        output_format=output_format,
+        seconds=round(time.perf_counter() - started, 6),
+        bytes_in=bytes_in,
+        bytes_out=bytes_out,
+    )
+    output_data = b"".join(output_chunks)
+    if output_format == "wav":
+        output_data = _fix_wav_sizes(output_data)
+    return output_data
 
-    audio_data = client.audio.speech.create(
-        model=model,
-        voice=voice,
-        input=text,
-        response_format=response_format,
-    ).content
 
-    return audio_data
+def _fix_wav_sizes(data):
+    """Set the RIFF and data chunk sizes, left as 0xFFFFFFFF by ffmpeg when
+    it writes WAV to a pipe, to the actual sizes."""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return data
+    data = bytearray(data)
+    struct.pack_into("<I", data, 4, len(data) - 8)
+    offset = 12
+    while offset + 8 <= len(data):
+        (size,) = struct.unpack_from("<I", data, offset + 4)
+        if data[offset : offset + 4] == b"data":
+            struct.pack_into("<I", data, offset + 4, len(data) - offset - 8)
+            break
+        # Chunks are padded to an even size.
+        offset += 8 + size + (size & 1)
+    return bytes(data)
 
 
-def convert_audio(audio_file, input_format, output_format):
-    input_audio = pydub.AudioSegment.from_file(audio_file, format=input_format)
-    output_audio = input_audio.export(format=output_format)
-    output_data = output_audio.read()
+def convert_audio(audio_file, input_format, output_format, streaming=True):
+    if streaming and shutil.which("ffmpeg") and audio_file.seekable():
+        start = audio_file.tell()
+        try:
+            return convert_audio_stream(audio_file, input_format, output_format)
+        except RuntimeError:
+            # Not pipeable; rewind and let pydub decode it the slow way.
+            audio_file.seek(start)
+    with metrics.timer(
+        "convert",
+        method="pydub",
+        input_format=input_format,
+        output_format=output_format,
+    ) as measurement:
+        start = audio_file.tell() if audio_file.seekable() else None
+        input_audio = pydub.AudioSegment.from_file(audio_file, format=input_format)
+        output_audio = input_audio.export(format=output_format)
+        output_data = output_audio.read()
+        if start is not None:
+            measurement["bytes_in"] = audio_file.tell() - start
+        measurement["bytes_out"] = len(output_data)
 
     return output_data
+
+
+def _text_pieces(text, max_chars):
+    # (separator, piece) pairs, falling back from paragraphs to sentences to
+    # words to hard cuts until every piece fits.
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            yield "\n\n", paragraph
+            continue
+        separator = "\n\n"
+        for sentence in re.split(r"(?<=[.!?;:])\s+", paragraph):
+            if len(sentence) <= max_chars:
+                yield separator, sentence
+                separator = " "
+                continue
+            for word in sentence.split():
+                for start in range(0, len(word), max_chars):
+                    yield separator, word[start : start + max_chars]
+                    separator = " "
+
+
+def split_text(text, max_chars=TTS_MAX_CHARS):
+    """Split text into chunks of at most max_chars on natural boundaries."""
+    chunks = []
+    current = ""
+    for separator, piece in _text_pieces(text, max_chars):
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def stitch_audio(chunks, input_format, output_format):
+    segments = [
+        pydub.AudioSegment.from_file(BytesIO(chunk), format=input_format)
+        for chunk in chunks
+    ]
+    # Trim the padding the API puts around every clip down to a short pause,
+    # otherwise each join is an audible gap.
+    for index, segment in enumerate(segments):
+        start = 0
+        end = len(segment)
+        if index > 0:
+            start = max(
+                pydub.silence.detect_leading_silence(segment) - JOIN_SILENCE_MS, 0
+            )
+        if index < len(segments) - 1:
+            trailing = pydub.silence.detect_leading_silence(segment.reverse())
+            end = len(segment) - max(trailing - JOIN_SILENCE_MS, 0)
+        segments[index] = segment[start:end]
+    combined = sum(segments[1:], segments[0])
+    return combined.export(format=output_format).read()